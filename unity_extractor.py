@@ -13,6 +13,17 @@ Usage:
     python unity_extractor.py --profile scripts  # Run only scripts profile
     python unity_extractor.py --profile ui       # Run only UI profile
     python unity_extractor.py --list             # List available profiles
+    python unity_extractor.py --no-cache         # Ignore the incremental cache
+    python unity_extractor.py --jobs 8           # Compress on 8 worker processes
+    python unity_extractor.py --watch            # Re-extract whenever files change
+    python unity_extractor.py --get PlantGrowth  # Print one class from the output
+    python unity_extractor.py --seed PlantGrowth --depth 2  # Only PlantGrowth and what it uses
+    python unity_extractor.py --timings          # Report time per stage and the slowest files
+    python unity_extractor.py --since main       # Only files changed since the main branch
+    python unity_extractor.py --query "plant growth" --budget 40000  # Best matches within 40k chars
+    python unity_extractor.py --refs StatusEffectManager  # Only the files using StatusEffectManager
+    python unity_extractor.py --backups          # List backup snapshots
+    python unity_extractor.py --restore latest   # Restore the newest backup snapshot
     python unity_extractor.py --help             # Show help
 ===============================================================================
 """
@@ -22,9 +33,17 @@ import sys
 import datetime
 import json
 import re
-import shutil
 import glob
 import argparse
+import hashlib
+import base64
+import threading
+import functools
+import time
+import struct
+import subprocess
+import zlib
+import math
 
 # =============================================================================
 # CONFIGURATION
@@ -43,9 +62,62 @@ DEFAULT_SETTINGS = {
         "clean_previous_files": True,
         "backup_previous_files": False,
         "backup_directory": "_extractor_backups",
+        
+        # Backups go to a deduplicating chunk store (see --backups/--restore).
+        # Chunks are compressed with "zlib", "lzma" or "none"; per profile the
+        # newest backup_keep snapshots are kept (0 = all), and snapshots older
+        # than backup_max_age_days are dropped (0 = no age limit).
+        "backup_compression": "zlib",
+        "backup_keep": 50,
+        "backup_max_age_days": 0,
+        
         "include_timestamp_in_filename": False,
+        
+        # Outputs larger than these budgets are split into numbered parts
+        # (profile "part_output_filename") plus a class -> part index.
+        # A budget of 0 disables that limit.
         "max_chars_per_file": 10000000,
-        "show_compression_stats": True
+        "max_tokens_per_file": 0,
+        "show_compression_stats": True,
+        
+        # Token accounting. "estimate" divides characters by chars_per_token;
+        # "bpe" counts real tokens with a tiktoken-format vocabulary file
+        # (e.g. cl100k_base.tiktoken, relative to the project or this script).
+        "tokenizer": {
+            "type": "estimate",
+            "vocab_file": "",
+            "chars_per_token": 4
+        },
+        
+        # How profile directories are listed: "filesystem" walks them on disk,
+        # "git" takes the files tracked in the git index (so .gitignore'd and
+        # untracked files are left out)
+        "discovery": "filesystem",
+        
+        # Incremental extraction: unchanged files are served from this cache
+        "cache_enabled": True,
+        "cache_directory": "_extractor_cache",
+        
+        # Worker processes for reading/compressing files (0 = all CPU cores)
+        "workers": 1,
+        
+        # Run profiles at the same time (their files share the worker processes)
+        "parallel_profiles": True,
+        
+        # Write <output>.index.json with byte offsets of every file, type and
+        # method, used by --get to slice one block out of the output
+        "write_symbol_index": True,
+        
+        # Keep a cross-reference index (identifier -> files and lines using
+        # it) in the cache directory while extracting, used by --refs
+        "write_xref_index": True,
+        
+        # Source files of at least this many bytes are memory-mapped (0 = never)
+        "mmap_min_size": 1048576,
+        
+        # --watch: seconds between polls, and quiet time before regenerating
+        "watch_interval": 1.0,
+        "watch_debounce": 1.5
     },
     
     # ==========================================================================
@@ -65,9 +137,15 @@ DEFAULT_SETTINGS = {
                 "Assets/Editor"
             ],
             
-            # Blacklisted directories (won't be scanned)
+            # Blacklisted directories (won't be scanned): names ("Plugins"),
+            # project-relative paths ("Assets/Scripts/Old") or globs
+            # ("**/TextMesh Pro/Examples & Extras/**"; * = one level, ** = any)
             "blacklist_directories": [],
             
+            # Optional file globs; when given, only matching files are kept
+            # (e.g. "Assets/Scripts/**/*Manager.cs")
+            "whitelist_patterns": [],
+            
             # File extensions
             "include_extensions": [".cs"],
             "exclude_extensions": [".meta"],
@@ -76,11 +154,40 @@ DEFAULT_SETTINGS = {
             "output_filename": "Unity_EXTRACTED_scripts",
             "part_output_filename": "Unity_EXTRACTED_scripts_part",
             
+            # "txt" (header + TOC + file blocks, for LLMs), "jsonl" (one JSON
+            # record per file) or "packed" (binary records with an offset
+            # table, see PackedOutputReader). Only "txt" is split into parts.
+            "output_format": "txt",
+            
+            # Context budget packing (--budget overrides budget): when the
+            # output would exceed budget (40000 chars, "12000t" tokens; 0 =
+            # off), the files with the highest priority stay whole and the
+            # rest fall back to a skeleton (C#), a one-line stub or are left
+            # out. priorities maps path globs to weights (first match wins,
+            # e.g. {"Assets/Scripts/Core/**": 3, "**/*Editor*.cs": 0.2});
+            # recently modified files get up to recency_boost on top, halving
+            # every recency_half_life_days, and --query relevance up to
+            # query_boost. Skeletons and stubs are worth skeleton_value and
+            # stub_value of a whole file.
+            "packing": {
+                "budget": 0,
+                "priorities": {},
+                "default_priority": 1.0,
+                "recency_boost": 1.0,
+                "recency_half_life_days": 14,
+                "query_boost": 4.0,
+                "skeleton_value": 0.5,
+                "stub_value": 0.05
+            },
+            
             # Compression settings (only apply to code files)
             "compression": {
                 "enabled": True,
                 "remove_empty_lines": True,
                 "remove_comments": True,
+                # Also drop // comments after code ("x++; // why"), not only
+                # comments on lines of their own
+                "remove_trailing_comments": False,
                 "remove_xml_docs": True,
                 "remove_using_statements": True,
                 "remove_regions": True,
@@ -92,6 +199,16 @@ DEFAULT_SETTINGS = {
                 "shorten_modifiers": True,
                 "extreme_compression": True,
                 
+                # Skeleton mode: keep declarations, fields and signatures but
+                # replace method/accessor bodies with { /* N lines */ }.
+                # skeleton_keep lists types ("PlantGrowth") or path globs
+                # ("Ecosystem/**", "PlantGrowth.cs") whose bodies stay intact.
+                "skeleton": False,
+                "skeleton_keep": [],
+                
+                # Extra whole-word abbreviations, e.g. {"GameObject": "GO"}
+                "custom_abbreviations": {},
+                
                 # Common using statements to remove
                 "common_usings": [
                     "using System;",
@@ -111,7 +228,7 @@ DEFAULT_SETTINGS = {
             # Header template (supports placeholders)
             "header_text": """UNITY PROJECT SCRIPTS - COMPRESSED FORMAT
 Compression Stats: {original_size:,} → {compressed_size:,} chars ({saved_percent:.1f}% reduction)
-Estimated tokens saved: ~{tokens_saved:,}
+Tokens: {original_tokens:,} → {compressed_tokens:,} ({tokens_saved:,} saved, {tokenizer})
 
 This document contains extracted Unity 6 (version 6000.0.39f1) C# scripts from my Unity game project.
 
@@ -182,6 +299,85 @@ Extracted on: {extraction_date}
 """
         },
         
+        # ----------------------------------------------------------------------
+        # UNITY DATA PROFILE - ScriptableObjects, prefabs and scenes (YAML)
+        # ----------------------------------------------------------------------
+        "unity_data": {
+            "enabled": False,
+            "description": "Unity YAML assets (.asset, .prefab, .unity) as object summaries",
+            
+            "directories": [
+                "Assets"
+            ],
+            
+            # Font atlases and imported packages are large and rarely useful
+            "blacklist_directories": ["TextMesh Pro", "Plugins"],
+            "include_extensions": [".asset", ".prefab", ".unity"],
+            "exclude_extensions": [".meta"],
+            
+            "output_filename": "Unity_EXTRACTED_data",
+            
+            # Unity YAML compression (files are streamed, see compress_unity_yaml)
+            "compression": {
+                "enabled": True,
+                "shorten_modifiers": False,  # C# only; keeps the legend out of the header
+                
+                # Editor-only bookkeeping, dropped wherever it appears
+                "yaml_drop_fields": [
+                    "m_ObjectHideFlags", "m_CorrespondingSourceObject", "m_PrefabInstance",
+                    "m_PrefabAsset", "m_EditorHideFlags", "m_EditorClassIdentifier",
+                    "serializedVersion", "m_StaticEditorFlags", "m_Icon", "m_NavMeshLayer",
+                    "m_LocalEulerAnglesHint", "m_ConstrainProportionsScale"
+                ],
+                
+                # Scene-wide settings objects, dropped whole
+                "yaml_drop_types": [
+                    "OcclusionCullingSettings", "RenderSettings", "LightmapSettings", "NavMeshSettings"
+                ],
+                
+                # Drop null references, empty values and zero vectors, plus
+                # fields equal to their default below (values as written in
+                # the output, e.g. vectors as tuples)
+                "yaml_drop_defaults": True,
+                "yaml_field_defaults": {
+                    "m_Enabled": "1",
+                    "m_IsActive": "1",
+                    "m_Layer": "0",
+                    "m_TagString": "Untagged",
+                    "m_LocalRotation": "(0, 0, 0, 1)",
+                    "m_LocalScale": "(1, 1, 1)"
+                },
+                
+                "yaml_strip_m_prefix": True,
+                
+                # Long lists and scalars (glyph tables, serialized blobs) are
+                # cut to these sizes (0 = keep everything)
+                "yaml_max_list_items": 32,
+                "yaml_max_value_chars": 200,
+                
+                # Rewrite @<guid> references to asset paths and script class
+                # names, using the GUIDs in the project's .meta files
+                "yaml_resolve_guids": True
+            },
+            
+            "include_toc": True,
+            "compact_toc": False,
+            
+            "header_text": """UNITY PROJECT DATA - COMPRESSED YAML
+Project: {project_name}
+Extracted on: {extraction_date}
+Compression Stats: {original_size:,} → {compressed_size:,} chars ({saved_percent:.1f}% reduction)
+
+Each Unity object is written as "<Type> &<fileID>" followed by its fields.
+- Editor-only fields, default values and empty blocks are omitted
+- &N references object N in the same file; @Assets/<path> references
+  another asset (@<path>:N for its sub-object N), @<Class> a script and
+  @<guid> an asset outside the project; null is an empty reference
+- Vectors and colors are written as tuples: (x, y, z) / (r, g, b, a)
+- Long lists end with "- … (N more)" and long values with "… (N chars)"
+"""
+        },
+        
         # ----------------------------------------------------------------------
         # CUSTOM PROFILE TEMPLATE (disabled by default)
         # ----------------------------------------------------------------------
@@ -272,8 +468,11 @@ def format_size(size):
 # COMPRESSION FUNCTIONS
 # =============================================================================
 
-def compress_content(content, compression_settings, file_extension=None):
-    """Route to appropriate compressor based on file type."""
+def compress_content(content, compression_settings, file_extension=None, file_path=None):
+    """Route to appropriate compressor based on file type.
+    
+    file_path is only needed to match skeleton_keep path patterns.
+    """
     if not compression_settings.get("enabled", False):
         return content
     
@@ -282,8 +481,15 @@ def compress_content(content, compression_settings, file_extension=None):
         return compress_uss_content(content, compression_settings)
     elif file_extension == '.uxml':
         return compress_uxml_content(content, compression_settings)
+    elif file_extension in UNITY_YAML_EXTENSIONS:
+        return compress_unity_yaml(content.split('\n'), compression_settings)
     elif file_extension == '.cs':
-        return compress_csharp_content(content, compression_settings)
+        content = compress_csharp_content(content, compression_settings)
+        if compression_settings.get("skeleton", False):
+            keep_types, keep_paths = _compile_skeleton_keep(tuple(compression_settings.get("skeleton_keep", [])))
+            if not (keep_paths and file_path and keep_paths.match(file_path.replace('\\', '/'))):
+                content = skeletonize_csharp(content, keep_types)
+        return content
     else:
         return content
 
@@ -396,150 +602,787 @@ def compress_uxml_content(content, compression_settings):
     return '\n'.join(compressed_lines)
 
 
-def compress_csharp_content(content, compression_settings):
-    """Apply compression settings to C# file content."""
-    lines = content.split('\n')
-    compressed_lines = []
-    in_multiline_comment = False
-    collecting_signature = False
-    signature_parts = []
+# Unity's serialization format: tagged YAML documents, one per object
+UNITY_YAML_EXTENSIONS = ('.asset', '.prefab', '.unity')
+
+_YAML_DOCUMENT_RE = re.compile(r'--- !u!\d+ &(-?\d+)( stripped)?')
+_YAML_KEY_RE = re.compile(r'([A-Za-z_][\w. \[\]]*):(?: (.*))?$')
+_YAML_REFERENCE_RE = re.compile(r'\{fileID: (-?\d+)(?:, guid: ([0-9a-fA-F]+), type: \d+)?\}')
+_YAML_VECTOR_RE = re.compile(r'\{[xyzwrgba]: [^,{}]+(?:, [xyzwrgba]: [^,{}]+){1,3}\}')
+_YAML_VECTOR_COMPONENT_RE = re.compile(r': ([^,}]+)')
+
+# Values that carry no information whatever the field
+_YAML_DEFAULT_VALUES = frozenset(['', 'null', '[]', '{}', '(0, 0)', '(0, 0, 0)', '(0, 0, 0, 0)'])
+
+_YAML_MATRIX_KEYS = frozenset(f"e{row}{column}" for row in range(4) for column in range(4))
+_YAML_IDENTITY_MATRIX = '((1, 0, 0, 0), (0, 1, 0, 0), (0, 0, 1, 0), (0, 0, 0, 1))'
+
+
+def _yaml_reference(match):
+    file_id, guid = match.group(1), match.group(2)
+    if guid is None:
+        return 'null' if file_id == '0' else f"&{file_id}"
+    # An asset's main object has the id <class id> * 100000; only name sub-objects
+    number = int(file_id)
+    if number % 100000 == 0 or number == 100100000:
+        return f"@{guid}"
+    return f"@{guid}:{file_id}"
+
+
+def _yaml_vector(match):
+    return '(' + ', '.join(_YAML_VECTOR_COMPONENT_RE.findall(match.group())) + ')'
+
+
+def _yaml_matrix(values):
+    """Row tuples for the 16 elements of a serialized Matrix4x4, else None."""
+    if len(values) != 16:
+        return None
+    return '(' + ', '.join('(' + ', '.join(values[row:row + 4]) + ')' for row in range(0, 16, 4)) + ')'
+
+
+def _compact_yaml_value(value, max_chars=0):
+    """Collapse references and vectors in a YAML value, truncating long scalars."""
+    if '{' in value:
+        value = _YAML_REFERENCE_RE.sub(_yaml_reference, value)
+        if '{' in value:
+            value = _YAML_VECTOR_RE.sub(_yaml_vector, value)
+    if max_chars and len(value) > max_chars:
+        value = f"{value[:max_chars]}… ({len(value):,} chars)"
+    return value
+
+
+def compress_unity_yaml(lines, compression_settings):
+    """Compress Unity's tagged YAML (.asset, .prefab, .unity) into object summaries.
     
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        stripped_line = line.strip()
-        
-        # Handle multiline comments
-        if '/*' in line:
-            in_multiline_comment = True
-        if in_multiline_comment:
-            if compression_settings.get("remove_comments", False):
-                if '*/' in line:
-                    in_multiline_comment = False
-                i += 1
-                continue
-            else:
-                compressed_lines.append(line)
-                if '*/' in line:
-                    in_multiline_comment = False
-                i += 1
-                continue
-        
-        # Skip XML documentation
-        if compression_settings.get("remove_xml_docs", True) and stripped_line.startswith('///'):
-            i += 1
-            continue
-        
-        # Skip attributes (single-line)
-        if compression_settings.get("remove_attributes", True):
-            if stripped_line.startswith('[') and stripped_line.endswith(']'):
-                # But preserve important attributes
-                preserve_attrs = ['SerializeField', 'Header', 'Tooltip', 'Range', 'Min', 'Max']
-                if not any(attr in stripped_line for attr in preserve_attrs):
-                    i += 1
+    lines is any iterable of lines (a SourceLineStream for large files) and
+    is read once; memory stays bounded by the nesting depth, not the file.
+    Each "--- !u!<class> &<id>" document becomes a "<Type> &<id>" line
+    followed by the fields that survive:
+    - yaml_drop_fields (editor-only bookkeeping) and yaml_drop_types objects
+      are dropped, as are default values when yaml_drop_defaults is on
+      (null references, empty values, zero vectors, yaml_field_defaults);
+      blocks left empty disappear with them
+    - {fileID: 0} → null, {fileID: N} → &N, {fileID: N, guid: G, type: T}
+      → @G (@G:N for sub-objects); {x: 1, y: 2} and colors → (1, 2)
+    - the m_ prefix is stripped from field names (yaml_strip_m_prefix)
+    - lists keep yaml_max_list_items items and scalars yaml_max_value_chars
+      characters (0 = no limit)
+    """
+    drop_fields = frozenset(compression_settings.get("yaml_drop_fields", []))
+    drop_types = frozenset(compression_settings.get("yaml_drop_types", []))
+    drop_defaults = compression_settings.get("yaml_drop_defaults", True)
+    field_defaults = compression_settings.get("yaml_field_defaults", {})
+    strip_prefix = compression_settings.get("yaml_strip_m_prefix", True)
+    max_items = compression_settings.get("yaml_max_list_items", 0)
+    max_chars = compression_settings.get("yaml_max_value_chars", 0)
+    
+    # A line's level orders it in the tree: deeper lines have higher levels.
+    # Unity puts list items at their key's indentation, so "- " adds one.
+    output = []
+    blocks = []  # open block keys: [level, line until emitted, items seen, item indent, matrix lines]
+    pending = False  # some block line is waiting for its first child
+    skip_level = None  # lines deeper than this belong to a dropped field
+    document_id = None  # "<id>[ stripped]" of a document whose type line is next
+    
+    def emit(text=None):
+        nonlocal pending
+        if pending:
+            for block in blocks:
+                if block[1] is not None:
+                    output.append(block[1])
+                    block[1] = None
+                    if block[4]:
+                        output.extend(text for _, text in block[4])
+                        block[4] = None
+            pending = False
+        if text is not None:
+            output.append(text)
+    
+    def close_blocks(level):
+        nonlocal pending
+        while blocks and blocks[-1][0] >= level:
+            block = blocks.pop()
+            matrix = block[4]
+            if matrix is not None and block[1] is not None:
+                value = _yaml_matrix([entry[0] for entry in matrix])
+                if value is not None:
+                    if not (drop_defaults and value == _YAML_IDENTITY_MATRIX):
+                        emit(f"{block[1]} {value}")
                     continue
-        
-        # Skip single-line comments
-        if compression_settings.get("remove_comments", False) and stripped_line.startswith('//'):
-            # Preserve TODO, FIXME, HACK, NOTE comments as they're often important
-            if not any(marker in stripped_line.upper() for marker in ['TODO', 'FIXME', 'HACK', 'NOTE', 'BUG']):
-                i += 1
+                blocks.append(block)
+                pending = True
+                emit()
+                blocks.pop()
+            if max_items and block[2] > max_items and block[1] is None:
+                output.append(f"{' ' * block[3]}- … ({block[2] - max_items:,} more)")
+    
+    for line in lines:
+        stripped = line.lstrip(' ')
+        if not stripped or stripped[0] == '%':
+            continue
+        indent = len(line) - len(stripped)
+        is_item = stripped[0] == '-' and stripped[:2] in ('- ', '-')
+        level = 2 * indent + is_item
+        if skip_level is not None:
+            if level > skip_level:
                 continue
+            skip_level = None
         
-        # Skip regions
-        if compression_settings.get("remove_regions", True):
-            if stripped_line.startswith('#region') or stripped_line.startswith('#endregion'):
-                i += 1
+        if not indent and not is_item:
+            if stripped.startswith('---'):
+                close_blocks(-1)
+                match = _YAML_DOCUMENT_RE.match(stripped)
+                document_id = f"{match.group(1)}{' stripped' if match.group(2) else ''}" if match else ''
                 continue
-        
-        # Skip common using statements
-        if compression_settings.get("remove_using_statements", True):
-            common_usings = compression_settings.get("common_usings", [])
-            if any(stripped_line == using for using in common_usings):
-                i += 1
+            if document_id is not None:
+                type_name = stripped.rstrip().rstrip(':')
+                if type_name in drop_types:
+                    skip_level = level
+                else:
+                    output.append(f"{type_name} &{document_id}" if document_id else type_name)
+                document_id = None
                 continue
         
-        # Handle method signature compression
-        if compression_settings.get("compress_method_signatures", True) and not collecting_signature:
-            method_keywords = ['public', 'private', 'protected', 'internal', 'static', 'virtual', 'override', 'abstract']
-            type_keywords = ['void', 'string', 'int', 'float', 'bool', 'double', 'decimal', 'IEnumerator', 'Task', 'async']
-            
-            if ('(' in stripped_line and ')' not in stripped_line and
-                (any(mod in stripped_line for mod in method_keywords) or
-                 any(t in stripped_line for t in type_keywords))):
-                collecting_signature = True
-                signature_parts = [line.rstrip()]
-                i += 1
+        if blocks and blocks[-1][0] >= level:
+            close_blocks(level)
+        if is_item and blocks:
+            block = blocks[-1]
+            block[2] += 1
+            block[3] = indent
+            if max_items and block[2] > max_items:
+                skip_level = level
                 continue
         
-        # Continue collecting signature
-        if collecting_signature:
-            signature_parts.append(stripped_line)
-            if ')' in stripped_line:
-                collecting_signature = False
-                compressed_signature = ' '.join(part.strip() for part in signature_parts)
-                if compression_settings.get("shorten_modifiers", True):
-                    compressed_signature = shorten_modifiers(compressed_signature, compression_settings)
-                compressed_lines.append(compressed_signature)
-                signature_parts = []
-            i += 1
+        body = stripped[2:] if is_item else stripped.rstrip()
+        prefix = line[:indent + 2] if is_item else line[:indent]
+        match = _YAML_KEY_RE.match(body)
+        if match is None:
+            # A scalar list item, or the continuation of a multi-line scalar
+            emit(prefix + _compact_yaml_value(body.rstrip(), max_chars))
             continue
         
-        # Compress namespace declarations
-        if compression_settings.get("compress_namespaces", True) and stripped_line.startswith('namespace'):
-            if i + 1 < len(lines) and lines[i + 1].strip() == '{':
-                compressed_lines.append(line.rstrip() + ' {')
+        key, value = match.groups()
+        if key in drop_fields and not is_item:
+            skip_level = level
+            continue
+        name = key[2:] if strip_prefix and key.startswith('m_') and len(key) > 2 else key
+        if not value:
+            # A block (or empty) value: only written once a child survives
+            blocks.append([level, f"{prefix}{name}:", 0, indent, None])
+            pending = True
+            continue
+        value = _compact_yaml_value(value.rstrip(), max_chars)
+        text = f"{prefix}{name}: {value}"
+        if key in _YAML_MATRIX_KEYS and not is_item and blocks and blocks[-1][1] is not None:
+            # Matrix4x4 elements e00..e33 are gathered into one value
+            matrix = blocks[-1][4]
+            if matrix is None:
+                matrix = blocks[-1][4] = []
+            matrix.append((value, text))
+            continue
+        if drop_defaults and not is_item and (value in _YAML_DEFAULT_VALUES or field_defaults.get(key) == value):
+            skip_level = level
+            continue
+        emit(text)
+    
+    close_blocks(-1)
+    return '\n'.join(output)
+
+
+# Attributes kept even when remove_attributes is on (override with "preserve_attributes")
+PRESERVED_ATTRIBUTES = ['SerializeField', 'Header', 'Tooltip', 'Range', 'Min', 'Max']
+
+# Comment markers that survive remove_comments
+COMMENT_MARKERS = ['TODO', 'FIXME', 'HACK', 'NOTE', 'BUG']
+
+# Lines without any of these characters cannot contain comments or literals
+_CS_NEEDS_LEX_RE = re.compile(r'["\'/]')
+_CS_SPECIAL_RE = re.compile(r'//|/\*|["\']')
+_CS_REGULAR_STRING_RE = re.compile(r'"(?:[^"\\\n]|\\.)*"')
+_CS_VERBATIM_BODY_RE = re.compile(r'[^"]*(?:""[^"]*)*"(?!")')
+_CS_CHAR_RE = re.compile(r"'(?:[^'\\\n]|\\.){1,10}'")
+_CS_ATTRIBUTE_GROUP_RE = re.compile(r'\[((?:[^\[\]"]|"(?:[^"\\]|\\.)*")*)\]\s*')
+_CS_ATTRIBUTE_NAME_RE = re.compile(r'(?:^|,)\s*(?:\w+\s*:\s*)?([\w.]+)')
+_CS_ATTRIBUTE_ARGS_RE = re.compile(r'\((?:[^()"]|"(?:[^"\\]|\\.)*")*\)')
+_CS_DECLARATION_HINT_RE = re.compile(
+    r'\b(?:public|private|protected|internal|static|virtual|override|abstract|'
+    r'void|string|int|float|bool|double|decimal|IEnumerator|Task|async)\b')
+
+# Signatures longer than this are flushed as-is (guards against unbalanced parens)
+_CS_MAX_SIGNATURE_LINES = 40
+
+# Scope tracking for signature joining: braces, statement ends and the
+# keywords whose braces hold member declarations
+_CS_SCOPE_TOKEN_RE = re.compile(r'[{};]')
+_CS_MEMBER_SCOPE_RE = re.compile(r'\b(?:class|struct|interface|record|namespace)\b')
+# An assignment or => before the first '(' means an expression, not a declaration
+_CS_EXPRESSION_START_RE = re.compile(r'^[^(]*?(?:(?<![=!<>])=(?!=)|=>)')
+
+# Piece kinds produced by the lexer
+_CODE, _LITERAL, _COMMENT = 0, 1, 2
+
+
+def _scan_csharp_hole(line, i):
+    """Scan an interpolation hole starting at line[i]; return the index after its '}' or -1."""
+    n = len(line)
+    depth = 0
+    while i < n:
+        c = line[i]
+        if c == '"':
+            prefix = line[max(0, i - 2):i]
+            verbatim = '@' in prefix
+            interpolated = '$' in prefix
+            if interpolated or verbatim:
+                i = _scan_csharp_string(line, i + 1, verbatim, interpolated)
+            else:
+                match = _CS_REGULAR_STRING_RE.match(line, i)
+                i = match.end() if match else -1
+            if i < 0:
+                return -1
+            continue
+        if c == "'":
+            match = _CS_CHAR_RE.match(line, i)
+            i = match.end() if match else i + 1
+            continue
+        if c in '([{':
+            depth += 1
+        elif c in ')]':
+            depth -= 1
+        elif c == '}':
+            if depth == 0:
+                return i + 1
+            depth -= 1
+        i += 1
+    return -1
+
+
+def _scan_csharp_string(line, i, verbatim, interpolated):
+    """Scan a string body starting at line[i] (just past the opening quote).
+
+    Returns the index just past the closing quote, or -1 if the string
+    continues past the end of the line.
+    """
+    if not interpolated:
+        if verbatim:
+            match = _CS_VERBATIM_BODY_RE.match(line, i)
+            return match.end() if match else -1
+        match = _CS_REGULAR_STRING_RE.match(line, i - 1)
+        return match.end() if match else -1
+
+    n = len(line)
+    while i < n:
+        c = line[i]
+        if c == '"':
+            if verbatim and line.startswith('""', i):
                 i += 2
                 continue
-        
-        # Skip consecutive empty lines
-        if compression_settings.get("remove_empty_lines", True):
-            if not stripped_line and compressed_lines and not compressed_lines[-1].strip():
-                i += 1
+            return i + 1
+        if c == '\\' and not verbatim:
+            i += 2
+            continue
+        if c == '{':
+            if line.startswith('{{', i):
+                i += 2
                 continue
+            i = _scan_csharp_hole(line, i + 1)
+            if i < 0:
+                return -1
+            continue
+        i += 1
+    return -1
+
+
+def _lex_csharp_line(line, state, remove_comments, remove_xml_docs, remove_trailing_comments=False):
+    """Lex one physical line of C#, carrying multi-line state between calls.
+
+    state is None for plain code, or ('comment',), ('verbatim', interpolated)
+    or ('raw', quote_count) while inside a construct that spans lines.
+    remove_comments and remove_xml_docs apply to // comments on lines of
+    their own; one after code on the same line is only removed with
+    remove_trailing_comments.
+
+    Returns (pieces, code, paren_delta, line_comment, dropped, state):
+      pieces        [(text, kind)] making up the output line
+      code          code text only (literals intact, no comments) for rule checks
+      paren_delta   '(' minus ')' outside literals and comments
+      line_comment  True if the line ends with a kept // comment
+      dropped       True if comment text was removed from the line
+    """
+    pieces = []
+    code_parts = []
+    dropped = False
+    line_comment = False
+    n = len(line)
+    i = 0
+
+    # Finish a construct carried over from the previous line
+    if state is not None:
+        kind = state[0]
+        if kind == 'comment':
+            end = line.find('*/')
+            stop = n if end < 0 else end + 2
+            if remove_comments:
+                dropped = True
+            else:
+                pieces.append((line[:stop], _COMMENT))
+            if end < 0:
+                return pieces, '', 0, False, dropped, state
+        else:
+            if kind == 'verbatim':
+                stop = _scan_csharp_string(line, 0, True, state[1])
+            else:
+                end = line.find('"' * state[1])
+                stop = end + state[1] if end >= 0 else -1
+            if stop < 0:
+                return [(line, _LITERAL)], '', 0, False, False, state
+            pieces.append((line[:stop], _LITERAL))
+        state = None
+        i = stop
+
+    while i < n:
+        match = _CS_SPECIAL_RE.search(line, i)
+        j = match.start() if match else n
+        if j > i:
+            segment = line[i:j]
+            pieces.append((segment, _CODE))
+            code_parts.append(segment)
+        if not match:
+            break
+
+        token = match.group()
+        if token == '//':
+            comment = line[j:]
+            if code_parts and not remove_trailing_comments and ''.join(code_parts).strip():
+                pieces.append((comment, _COMMENT))
+                line_comment = True
+            elif remove_xml_docs and comment.startswith('///'):
+                dropped = True
+            elif remove_comments and not any(marker in comment.upper() for marker in COMMENT_MARKERS):
+                dropped = True
+            else:
+                pieces.append((comment, _COMMENT))
+                line_comment = True
+            break
+
+        if token == '/*':
+            end = line.find('*/', j + 2)
+            stop = n if end < 0 else end + 2
+            if end < 0:
+                state = ('comment',)
+            if remove_comments:
+                dropped = True
+                # Keep tokens on either side of an inline comment apart
+                if 0 < j and stop < n and not line[j - 1].isspace() and not line[stop].isspace():
+                    pieces.append((' ', _CODE))
+                    code_parts.append(' ')
+            else:
+                pieces.append((line[j:stop], _COMMENT))
+            i = stop
+            continue
+
+        if token == "'":
+            char_match = _CS_CHAR_RE.match(line, j)
+            if char_match:
+                pieces.append((char_match.group(), _LITERAL))
+                code_parts.append(char_match.group())
+                i = char_match.end()
+            else:
+                pieces.append(("'", _CODE))
+                code_parts.append("'")
+                i = j + 1
+            continue
+
+        # String literal: the $ / @ prefix is already part of the preceding code
+        prefix = line[max(i, j - 2):j]
+        verbatim = '@' in prefix
+        interpolated = '$' in prefix
+        if not verbatim and line.startswith('"""', j):
+            quotes = n - j - len(line[j:].lstrip('"'))
+            end = line.find('"' * quotes, j + quotes)
+            stop = end + quotes if end >= 0 else -1
+            if stop < 0:
+                state = ('raw', quotes)
+        else:
+            stop = _scan_csharp_string(line, j + 1, verbatim, interpolated)
+            if stop < 0 and verbatim:
+                state = ('verbatim', interpolated)
+        if stop < 0:
+            stop = n
+        literal = line[j:stop]
+        pieces.append((literal, _LITERAL))
+        code_parts.append(literal)
+        i = stop
+
+    code = ''.join(code_parts)
+    paren_delta = 0
+    if '(' in code or ')' in code:
+        for text, kind in pieces:
+            if kind == _CODE:
+                paren_delta += text.count('(') - text.count(')')
+    return pieces, code, paren_delta, line_comment, dropped, state
+
+
+def _is_removable_attribute_line(code, preserved):
+    """True if the line consists only of attribute groups, none of them preserved."""
+    body_start = len(code) - len(code.lstrip())
+    pos = body_start
+    while True:
+        match = _CS_ATTRIBUTE_GROUP_RE.match(code, pos)
+        if not match:
+            break
+        names = _CS_ATTRIBUTE_NAME_RE.findall(_CS_ATTRIBUTE_ARGS_RE.sub('', match.group(1)))
+        if not names or any(name.rsplit('.', 1)[-1] in preserved for name in names):
+            break
+        pos = match.end()
+    return pos > body_start and not code[pos:].strip()
+
+
+def compress_csharp_content(content, compression_settings):
+    """Apply compression settings to C# file content.
+
+    Single pass over the file: each line is lexed (comments, regular, verbatim,
+    interpolated and raw strings, char literals) with state carried across
+    lines, and every enabled rule is applied as soon as the line is complete.
+    Text inside literals and comments is never rewritten.
+    """
+    get = compression_settings.get
+    remove_comments = get("remove_comments", False)
+    remove_trailing_comments = get("remove_trailing_comments", False)
+    remove_xml_docs = get("remove_xml_docs", True)
+    remove_attributes = get("remove_attributes", True)
+    remove_regions = get("remove_regions", True)
+    remove_usings = get("remove_using_statements", True)
+    remove_empty_lines = get("remove_empty_lines", True)
+    compress_signatures = get("compress_method_signatures", True)
+    compress_namespaces = get("compress_namespaces", True)
+    compress_braces = get("compress_braces", True)
+    trim_whitespace = get("trim_whitespace", True)
+    reduce_indentation = get("reduce_indentation", True)
+    indent_size = get("indent_size", 1)
+    common_usings = set(get("common_usings", [])) if remove_usings else set()
+    preserved_attributes = set(get("preserve_attributes", PRESERVED_ATTRIBUTES))
+    shorten = get_modifier_rewriter(compression_settings).rewrite if get("shorten_modifiers", True) else None
+
+    def render(pieces, code):
+        """Output text for a line; modifiers are only shortened outside literals/comments."""
+        if pieces is None:
+            return shorten(code) if shorten else code
+        if not shorten:
+            return ''.join(text for text, _ in pieces)
+        return ''.join(shorten(text) if kind == _CODE else text for text, kind in pieces)
+
+    indents = {}  # original leading whitespace -> reduced
+
+    def indent(text):
+        if not reduce_indentation:
+            return text
+        body = text.lstrip()
+        if not body:
+            return text
+        leading = text[:len(text) - len(body)]
+        reduced = indents.get(leading)
+        if reduced is None:
+            reduced = indents[leading] = ' ' * ((len(leading.replace('\t', '    ')) // 4) * indent_size)
+        return reduced + body
+
+    bom = content.startswith('\ufeff')
+    if bom:
+        content = content[1:]
+    if '\r' in content:
+        content = content.replace('\r\n', '\n')
+    lines = content.split('\n')
+
+    compressed_lines = []
+    last_line_comment = False   # last emitted line ends with a // comment
+    last_namespace = False      # last emitted line is a namespace declaration
+    signature = None            # lines of a multi-line signature being joined
+    signature_indent = ''
+    signature_depth = 0
+    member_scopes = [True]      # per open brace: does it hold member declarations?
+    last_code = ''              # code of the last line without braces (a header for a '{' line)
+    state = None
+    needs_lex = _CS_NEEDS_LEX_RE.search
+
+    # A // comment on a BOM-prefixed first line has always been kept
+    if bom and lines[0].lstrip().startswith('//'):
+        compressed_lines.append(indent(lines[0].rstrip()))
+        last_line_comment = True
+        lines = lines[1:]
+
+    def flush_signature():
+        compressed_lines.append(signature_indent + ' '.join(part for part in map(str.strip, signature) if part))
+
+    def code_only(pieces):
+        return ''.join(text for text, kind in pieces if kind == _CODE)
+
+    def track_scopes(text):
+        """Follow the braces of a line's code, so signatures are only joined among members.
         
-        # Shorten modifiers
-        if compression_settings.get("shorten_modifiers", True):
-            line = shorten_modifiers(line, compression_settings)
-        
-        # Trim whitespace
-        if compression_settings.get("trim_whitespace", True):
-            line = line.rstrip()
-        
-        # Reduce indentation (big token saver while preserving structure)
-        if compression_settings.get("reduce_indentation", True):
-            # Count leading whitespace
-            stripped = line.lstrip()
-            if stripped:  # Don't process empty lines
-                leading = line[:len(line) - len(stripped)]
-                # Convert tabs to spaces first, then reduce
-                leading = leading.replace('\t', '    ')
-                # Count indent level (assuming 4-space original)
-                indent_level = len(leading) // 4
-                remainder = len(leading) % 4
-                # Reduce to 1 space per level (configurable)
-                new_indent_size = compression_settings.get("indent_size", 1)
-                new_leading = ' ' * (indent_level * new_indent_size)
-                line = new_leading + stripped
-        
-        # Compress braces
-        if compression_settings.get("compress_braces", True) and stripped_line == '{' and compressed_lines:
+        A '{' opens a member scope when the code before it on the line (or,
+        with nothing there, the previous line) declares a type or namespace.
+        """
+        nonlocal last_code
+        if '{' not in text and '}' not in text:
+            last_code = text
+            return
+        position = 0
+        for match in _CS_SCOPE_TOKEN_RE.finditer(text):
+            token = match.group()
+            if token == '{':
+                header = text[position:match.start()]
+                if not header.strip():
+                    header = last_code
+                member_scopes.append(_CS_MEMBER_SCOPE_RE.search(header) is not None)
+            elif token == '}' and len(member_scopes) > 1:
+                member_scopes.pop()
+            position = match.end()
+        last_code = text[position:]
+
+    def opens_block_in_parens(text, depth):
+        """True if text has a '{' or ';' while a '(' is open: a lambda or statement, not a signature."""
+        if '{' not in text and ';' not in text:
+            return False
+        for c in text:
+            if c == '(':
+                depth += 1
+            elif c == ')':
+                depth -= 1
+            elif depth > 0 and (c == '{' or c == ';'):
+                return True
+        return False
+
+    for line in lines:
+        starts_in_literal = state is not None and state[0] != 'comment'
+        starts_in_comment = state is not None and not starts_in_literal
+
+        if state is None and (not needs_lex(line) or line.lstrip().startswith('#')):
+            pieces = None
+            code = line
+            paren_delta = line.count('(') - line.count(')') if '(' in line or ')' in line else 0
+            line_comment = dropped = False
+        else:
+            pieces, code, paren_delta, line_comment, dropped, state = _lex_csharp_line(
+                line, state, remove_comments, remove_xml_docs, remove_trailing_comments)
+
+        # Lines carrying a multi-line string literal are passed through untouched
+        if starts_in_literal or (state is not None and state[0] != 'comment'):
+            if signature is not None:
+                flush_signature()
+                signature = None
+            text = render(pieces, code)
+            compressed_lines.append(text if starts_in_literal else indent(text))
+            last_line_comment = last_namespace = False
+            continue
+
+        stripped = code.strip()
+
+        if not stripped:
+            if pieces and any(kind == _COMMENT for _, kind in pieces):
+                # Comment-only line
+                if signature is not None:
+                    flush_signature()
+                    signature = None
+                text = render(pieces, code).rstrip()
+                compressed_lines.append(text if starts_in_comment else indent(text))
+                last_line_comment = line_comment
+                last_namespace = False
+                continue
+            if dropped or signature is not None:
+                continue
+            # Skip consecutive empty lines
+            if remove_empty_lines and (not compressed_lines or not compressed_lines[-1]):
+                continue
+            compressed_lines.append('')
+            last_line_comment = last_namespace = False
+            continue
+
+        first = stripped[0]
+
+        # Skip regions
+        if first == '#' and remove_regions and (stripped.startswith('#region') or
+                                                stripped.startswith('#endregion')):
+            continue
+
+        # Skip common using statements
+        if first == 'u' and stripped in common_usings:
+            continue
+
+        # Skip attribute lines, keeping the important ones
+        if first == '[' and remove_attributes and _is_removable_attribute_line(code, preserved_attributes):
+            continue
+
+        # Join multi-line method signatures
+        if signature is not None:
+            scope_text = code if pieces is None else code_only(pieces)
+            if opens_block_in_parens(scope_text, signature_depth):
+                # Not a signature after all: emit the lines held back as they are
+                compressed_lines.extend(part.rstrip() if trim_whitespace else part for part in signature)
+                signature = None
+                last_line_comment = last_namespace = False
+            else:
+                signature.append(indent(render(pieces, code)))
+                signature_depth += paren_delta
+                track_scopes(scope_text)
+                if signature_depth <= 0 or line_comment or len(signature) > _CS_MAX_SIGNATURE_LINES:
+                    flush_signature()
+                    signature = None
+                    last_line_comment = line_comment
+                    last_namespace = False
+                continue
+        elif compress_signatures:
+            scope_text = code if pieces is None else code_only(pieces)
+            if (paren_delta > 0 and not line_comment and member_scopes[-1] and
+                    _CS_DECLARATION_HINT_RE.search(code) and not _CS_EXPRESSION_START_RE.match(scope_text) and
+                    not opens_block_in_parens(scope_text, 0)):
+                text = indent(render(pieces, code))
+                signature = [text]
+                signature_indent = text[:len(text) - len(text.lstrip())]
+                signature_depth = paren_delta
+                track_scopes(scope_text)
+                continue
+        if compress_signatures:
+            if stripped == '}':
+                if len(member_scopes) > 1:
+                    member_scopes.pop()
+                last_code = ''
+            elif '{' in scope_text or '}' in scope_text:
+                track_scopes(scope_text)
+            else:
+                last_code = scope_text
+
+        # Compress braces (and namespace braces) onto the previous line
+        if stripped == '{' and compressed_lines and not line_comment:
             last_line = compressed_lines[-1]
-            if last_line.strip() and not last_line.strip().endswith('{'):
+            if ((compress_braces or (compress_namespaces and last_namespace)) and
+                    last_line.strip() and not last_line.rstrip().endswith('{') and not last_line_comment):
                 compressed_lines[-1] = last_line + ' {'
-                i += 1
+                last_namespace = False
                 continue
-        
-        compressed_lines.append(line)
-        i += 1
-    
+
+        # Lone braces have nothing to shorten
+        text = render(pieces, code) if pieces is not None or len(stripped) > 1 else code
+        if trim_whitespace:
+            text = text.rstrip()
+        compressed_lines.append(indent(text))
+        last_line_comment = line_comment
+        last_namespace = first == 'n' and stripped.startswith('namespace')
+
+    if signature is not None:
+        flush_signature()
+
     # Remove trailing empty lines
     while compressed_lines and not compressed_lines[-1].strip():
         compressed_lines.pop()
-    
+
     return '\n'.join(compressed_lines)
 
 
+# Standard compression - aggressive but unambiguous abbreviations
+# (word, abbreviation, keyword): keyword entries only apply when followed by
+# whitespace, which collapses to one space (or vanishes with an empty abbreviation)
+# NOTE: 'private' is removed entirely as it's the C# default
+# NOTE: 'internal' is NOT shortened to avoid 'int' type conflict
+MODIFIER_ABBREVIATIONS = [
+    ('private', '', True),            # private is default, remove entirely
+    ('public', 'pub', True),          # pub = public
+    ('protected', 'prot', True),      # prot = protected
+    ('static', 'stat', True),         # stat = static
+    ('virtual', 'virt', True),        # virt = virtual
+    ('abstract', 'abs', True),        # abs = abstract
+    ('override', 'ovr', True),        # ovr = override
+    ('readonly', 'ro', True),         # ro = readonly
+    ('const', 'const', True),         # keep const - it's short
+    ('sealed', 'seal', True),         # seal = sealed
+    ('async', 'async', True),         # keep async - important
+    ('partial', '', True),            # partial can be removed - not critical for understanding
+]
+
+# Extreme mode: even more aggressive
+EXTREME_ABBREVIATIONS = [
+    ('return', 'ret', True),          # ret = return (common in asm)
+    ('SerializeField', 'SF', False),  # SF = SerializeField (Unity)
+]
+
+
+class ModifierRewriter:
+    """Rewrites modifiers and keywords to their abbreviations in a single scan.
+    
+    All entries compile into one alternation regex with a lookup table, so a
+    line is scanned once no matter how many abbreviations are configured.
+    Later entries override earlier ones for the same word.
+    """
+    
+    def __init__(self, entries):
+        self.entries = []
+        self._keywords = {}
+        self._words = {}
+        for word, abbreviation, keyword in entries:
+            self._keywords.pop(word, None)
+            self._words.pop(word, None)
+            self.entries = [e for e in self.entries if e[0] != word]
+            self.entries.append((word, abbreviation, keyword))
+            if keyword:
+                self._keywords[word] = f"{abbreviation} " if abbreviation else ''
+            else:
+                self._words[word] = abbreviation
+        
+        alternatives = []
+        if self._keywords:
+            alternatives.append(r'(?P<k>%s)\s+' % self._alternation(self._keywords))
+        if self._words:
+            alternatives.append(r'(?P<w>%s)\b' % self._alternation(self._words))
+        self._pattern = re.compile(r'\b(?:%s)' % '|'.join(alternatives)) if alternatives else None
+    
+    @staticmethod
+    def _alternation(words):
+        # Longest first so no word is shadowed by a shorter prefix
+        return '|'.join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+    
+    def _replace(self, match):
+        word = match.group('k') if self._keywords else None
+        if word is not None:
+            return self._keywords[word]
+        return self._words[match.group('w')]
+    
+    def rewrite(self, text):
+        """Return text with every configured word abbreviated."""
+        if self._pattern is None:
+            return text
+        return self._pattern.sub(self._replace, text)
+    
+    def legend(self):
+        """Header legend lines describing the active abbreviations."""
+        pairs = [f"{short}={word}" for word, short, _ in self.entries if short and short != word]
+        omitted = [word for word, short, _ in self.entries if not short]
+        lines = ["  " + " | ".join(pairs[i:i + 3]) for i in range(0, len(pairs), 3)]
+        if omitted:
+            lines.append(f"  ({' & '.join(omitted)} {'is' if len(omitted) == 1 else 'are'} omitted, "
+                         f"internal kept as-is)")
+        return lines
+
+
+_MODIFIER_REWRITERS = {}
+
+
+def get_modifier_rewriter(compression_settings):
+    """Return the (cached) ModifierRewriter for a profile's compression settings.
+    
+    Custom abbreviations come from the "custom_abbreviations" setting
+    ({"word": "abbr"}) and are matched as whole words.
+    """
+    extreme = bool(compression_settings.get("extreme_compression", False))
+    custom = compression_settings.get("custom_abbreviations") or {}
+    key = (extreme, tuple(sorted(custom.items())))
+    rewriter = _MODIFIER_REWRITERS.get(key)
+    if rewriter is None:
+        entries = list(MODIFIER_ABBREVIATIONS)
+        if extreme:
+            entries.extend(EXTREME_ABBREVIATIONS)
+        entries.extend((word, abbreviation, False) for word, abbreviation in custom.items())
+        rewriter = _MODIFIER_REWRITERS[key] = ModifierRewriter(entries)
+    return rewriter
+
+
 def shorten_modifiers(line, compression_settings):
     """Shorten access modifiers and keywords.
     
@@ -550,496 +1393,4247 @@ def shorten_modifiers(line, compression_settings):
     """
     if not compression_settings.get("shorten_modifiers", True):
         return line
-    
-    # Standard compression - aggressive but unambiguous abbreviations
-    # NOTE: 'private' is removed entirely as it's the C# default
-    # NOTE: 'internal' is NOT shortened to avoid 'int' type conflict
-    replacements = [
-        (r'\bprivate\s+', ''),           # private is default, remove entirely
-        (r'\bprotected\s+', 'prot '),    # prot = protected
-        (r'\bpublic\s+', 'pub '),         # pub = public
-        (r'\bstatic\s+', 'stat '),        # stat = static
-        (r'\bvirtual\s+', 'virt '),       # virt = virtual
-        (r'\babstract\s+', 'abs '),       # abs = abstract  
-        (r'\boverride\s+', 'ovr '),       # ovr = override
-        (r'\breadonly\s+', 'ro '),        # ro = readonly
-        (r'\bconst\s+', 'const '),        # keep const - it's short
-        (r'\bsealed\s+', 'seal '),        # seal = sealed
-        (r'\basync\s+', 'async '),        # keep async - important
-        (r'\bpartial\s+', ''),            # partial can be removed - not critical for understanding
-    ]
-    
-    if compression_settings.get("extreme_compression", False):
-        # Extreme mode: even more aggressive
-        extreme_replacements = [
-            (r'\breturn\s+', 'ret '),         # ret = return (common in asm)
-            (r'\bSerializeField\b', 'SF'),    # SF = SerializeField (Unity)
-        ]
-        replacements.extend(extreme_replacements)
-    
-    for pattern, replacement in replacements:
-        line = re.sub(pattern, replacement, line)
-    
-    return line
+    return get_modifier_rewriter(compression_settings).rewrite(line)
+
+
+CHARS_PER_TOKEN = 4  # Rough estimate: 1 token ≈ 4 chars
+
 
+def estimate_tokens(char_count, chars_per_token=CHARS_PER_TOKEN):
+    """Rough token count for a number of characters."""
+    return char_count // max(1, chars_per_token)
 
-def calculate_compression_stats(original_size, compressed_size):
-    """Calculate compression statistics."""
+
+def calculate_compression_stats(original_size, compressed_size, original_tokens=None, compressed_tokens=None):
+    """Calculate compression statistics.
+    
+    Token counts come from the configured tokenizer when given; otherwise
+    they are estimated from the character counts.
+    """
     saved = original_size - compressed_size
     percentage = (saved / original_size * 100) if original_size > 0 else 0
-    tokens_saved = saved // 4  # Rough estimate: 1 token ≈ 4 chars
+    exact_tokens = original_tokens is not None and compressed_tokens is not None
+    if not exact_tokens:
+        original_tokens = estimate_tokens(original_size)
+        compressed_tokens = estimate_tokens(compressed_size)
     return {
         'original': original_size,
         'compressed': compressed_size,
         'saved': saved,
         'percentage': percentage,
-        'tokens_saved': tokens_saved
+        'original_tokens': original_tokens,
+        'compressed_tokens': compressed_tokens,
+        'tokens_saved': original_tokens - compressed_tokens,
+        'exact_tokens': exact_tokens
     }
 
 
 # =============================================================================
-# FILE COLLECTION
+# SKELETON MODE
 # =============================================================================
 
-def collect_files(project_path, profile):
-    """Collect all files matching profile criteria."""
-    files = []
-    directories = profile.get("directories", [])
-    blacklist = profile.get("blacklist_directories", [])
-    include_ext = [ext.lower() for ext in profile.get("include_extensions", [])]
-    exclude_ext = [ext.lower() for ext in profile.get("exclude_extensions", [])]
-    
-    for directory in directories:
-        scan_path = os.path.join(project_path, directory)
-        
-        if not os.path.exists(scan_path):
-            print(f"  ⚠ Directory not found: {directory}")
-            continue
-        
-        for root, dirs, filenames in os.walk(scan_path):
-            # Remove blacklisted directories from traversal
-            dirs[:] = [d for d in dirs if d not in blacklist and 
-                       not any(bl in os.path.join(root, d) for bl in blacklist)]
-            
-            for filename in filenames:
-                file_ext = os.path.splitext(filename)[1].lower()
-                
-                # Check inclusion/exclusion
-                if include_ext and file_ext not in include_ext:
-                    continue
-                if file_ext in exclude_ext:
-                    continue
-                
-                full_path = os.path.join(root, filename)
-                rel_path = os.path.relpath(full_path, project_path)
-                
-                # Extract metadata for code files
-                metadata = extract_file_metadata(full_path, file_ext)
-                
-                files.append({
-                    'full_path': full_path,
-                    'rel_path': rel_path,
-                    'filename': filename,
-                    'extension': file_ext,
-                    **metadata
-                })
-    
-    # Sort by namespace (if available), then by path
-    # Use empty string for None namespaces to ensure proper sorting
-    return sorted(files, key=lambda x: (x.get('namespace') or '', x['rel_path']))
+_CS_BRACE_RE = re.compile(r'[{}]')
+_CS_ASSIGNMENT_RE = re.compile(r'(?<![=!<>])=(?!=)')
 
 
-def extract_file_metadata(file_path, extension):
-    """Extract metadata from file (namespace, class name, etc.)."""
-    filename_without_ext = os.path.splitext(os.path.basename(file_path))[0]
+@functools.lru_cache(maxsize=None)
+def _compile_skeleton_keep(entries):
+    """Split skeleton_keep into (type names, path regex or None).
     
-    metadata = {
-        'namespace': None,  # None instead of 'Unknown' - we'll handle display later
+    Entries containing '/', glob characters or ending in .cs are path globs,
+    matched against the end of the file path; anything else is a type name.
+    """
+    type_names = set()
+    patterns = []
+    for entry in entries:
+        if '/' in entry or entry.endswith('.cs') or _GLOB_CHARS_RE.search(entry):
+            patterns.append(_glob_to_regex('**/' + entry.strip('/')))
+        else:
+            type_names.add(entry)
+    if not patterns:
+        return frozenset(type_names), None
+    flags = re.IGNORECASE if os.name == 'nt' else 0
+    return frozenset(type_names), re.compile('(?:' + '|'.join(patterns) + ')$', flags)
+
+
+def _matching_brace(masked, open_index):
+    """Index of the '}' closing the '{' at open_index, or -1 if unbalanced."""
+    depth = 0
+    for match in _CS_BRACE_RE.finditer(masked, open_index):
+        if match.group() == '{':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return match.start()
+    return -1
+
+
+def _strip_groups(text, opening, closing):
+    """text with every (nested) opening...closing group removed."""
+    depth = 0
+    kept = []
+    for char in text:
+        if char == opening:
+            depth += 1
+        elif char == closing and depth:
+            depth -= 1
+        elif not depth:
+            kept.append(char)
+    return ''.join(kept)
+
+
+def _skeleton_block_kind(header, scope, keep_types):
+    """How skeletonize_csharp treats the block a header opens.
+    
+    'namespace' and 'type' blocks are descended into, 'property' blocks too
+    (their accessor blocks are bodies), 'body' blocks are elided and 'keep'
+    blocks (enums, kept types, initializers, anything unrecognised) are
+    copied verbatim.
+    """
+    declaration = _classify_declaration(header, 'namespace', ())
+    if declaration:
+        kind, name, _ = declaration
+        if kind == 'namespace':
+            return 'namespace' if scope == 'namespace' else 'keep'
+        return 'keep' if kind == 'enum' or name in keep_types else 'type'
+    if scope not in ('type', 'property'):
+        return 'keep'
+    
+    text = '\n'.join(line for line in header.split('\n') if not line.strip().startswith('#'))
+    signature = _strip_groups(text, '[', ']')
+    # Field/property initializers and expression bodies (collection
+    # initializers, lambdas, switch expressions) are data, not bodies
+    if _CS_ASSIGNMENT_RE.search(_strip_groups(signature, '(', ')')):
+        return 'keep'
+    if scope == 'property' or '(' in signature:
+        return 'body'
+    return 'property' if signature.strip() else 'keep'
+
+
+def skeletonize_csharp(content, keep_types=()):
+    """Elide method, constructor and accessor bodies from C# source.
+    
+    Type declarations, fields, properties and signatures are kept; each
+    non-empty body becomes { /* N lines */ }, N counting its non-empty lines.
+    Enums, initializers and the types named in keep_types are left intact.
+    Braces are matched on masked text, so comments and string literals don't
+    count, and lambdas or local functions disappear with their method body.
+    Unbalanced input (e.g. braces split across #if branches) is copied
+    unchanged from the first block that can't be matched.
+    """
+    masked = _mask_csharp(content)
+    pieces = []
+    copied = 0
+    header_start = 0
+    scopes = ['namespace']
+    position = 0
+    while True:
+        match = _CS_SYMBOL_DELIMITER_RE.search(masked, position)
+        if not match:
+            break
+        position = match.end()
+        token = match.group()
+        if token == '{':
+            kind = _skeleton_block_kind(masked[header_start:match.start()], scopes[-1], keep_types)
+            if kind in ('body', 'keep'):
+                close = _matching_brace(masked, match.start())
+                if close < 0:
+                    break
+                body = content[position:close]
+                if kind == 'body' and body.strip():
+                    line_count = sum(1 for line in body.split('\n') if line.strip())
+                    pieces.append(content[copied:position])
+                    pieces.append(f" /* {line_count} line{'s' if line_count != 1 else ''} */ ")
+                    copied = close
+                position = close + 1
+            else:
+                scopes.append(kind)
+        elif token == '}' and len(scopes) > 1:
+            scopes.pop()
+        header_start = position
+    
+    pieces.append(content[copied:])
+    return ''.join(pieces)
+
+
+# =============================================================================
+# TOKEN COUNTING
+# =============================================================================
+
+# Pre-tokenizer in the style of cl100k_base. The stdlib re module has no
+# \p{L}/\p{N} classes, so letters are [^\W\d_] and numbers are \d.
+BPE_PRETOKENIZE_PATTERN = (
+    r"'(?i:[sdmt]|ll|ve|re)"
+    r"|(?:[^\r\n\w]|_)?[^\W\d_]+"
+    r"|\d{1,3}"
+    r"| ?(?:[^\s\w]|_)+[\r\n]*"
+    r"|\s*[\r\n]+"
+    r"|\s+(?!\S)"
+    r"|\s+"
+)
+
+
+class EstimateTokenizer:
+    """Character-based token estimate; needs no vocabulary."""
+    
+    exact = False
+    
+    def __init__(self, chars_per_token=CHARS_PER_TOKEN):
+        self.chars_per_token = max(1, int(chars_per_token))
+        self.name = f"estimate, {self.chars_per_token} chars/token"
+        self.fingerprint = f"estimate-{self.chars_per_token}"
+    
+    def count(self, text):
+        return estimate_tokens(len(text), self.chars_per_token)
+
+
+class BPETokenizer:
+    """Offline byte-level BPE token counter.
+    
+    Loads a tiktoken-format vocabulary ("<base64 token> <rank>" per line, e.g.
+    cl100k_base.tiktoken). Text is split by the pre-tokenizer regex and each
+    piece is merged lowest-rank-first; piece counts are memoized, so the many
+    identifiers a project repeats are only merged once.
+    """
+    
+    exact = True
+    MAX_MEMO_ENTRIES = 1 << 18
+    
+    def __init__(self, vocab_path, pattern=None):
+        self.ranks = {}
+        with open(vocab_path, 'rb') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    try:
+                        self.ranks[base64.b64decode(parts[0])] = int(parts[1])
+                    except ValueError:
+                        continue
+        if not self.ranks:
+            raise ValueError(f"no tokens found in {vocab_path}")
+        self.pattern = re.compile(pattern or BPE_PRETOKENIZE_PATTERN)
+        self.name = f"bpe, {os.path.basename(vocab_path)}"
+        stat = os.stat(vocab_path)
+        identity = f"{os.path.abspath(vocab_path)}|{stat.st_size}|{stat.st_mtime_ns}|{self.pattern.pattern}"
+        self.fingerprint = "bpe-" + hashlib.sha1(identity.encode('utf-8')).hexdigest()[:16]
+        self._memo = {}
+    
+    def _merge_count(self, piece):
+        """Number of tokens a byte string merges down to."""
+        ranks = self.ranks
+        bounds = list(range(len(piece) + 1))  # token i is piece[bounds[i]:bounds[i + 1]]
+        while len(bounds) > 2:
+            best_rank = None
+            best_index = -1
+            for i in range(len(bounds) - 2):
+                rank = ranks.get(piece[bounds[i]:bounds[i + 2]])
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best_rank, best_index = rank, i
+            if best_rank is None:
+                break
+            del bounds[best_index + 1]
+        return len(bounds) - 1
+    
+    def count(self, text):
+        memo = self._memo
+        ranks = self.ranks
+        total = 0
+        for piece in self.pattern.findall(text):
+            n = memo.get(piece)
+            if n is None:
+                data = piece.encode('utf-8')
+                n = 1 if data in ranks else self._merge_count(data)
+                if len(memo) >= self.MAX_MEMO_ENTRIES:
+                    memo.clear()
+                memo[piece] = n
+            total += n
+        return total
+
+
+_TOKENIZERS = {}
+
+
+def resolve_tokenizer_settings(global_settings, project_path):
+    """global.tokenizer with the vocabulary path made absolute.
+    
+    A relative vocab_file is looked up in the project, then next to this script.
+    """
+    config = dict(global_settings.get("tokenizer") or {})
+    vocab_file = config.get("vocab_file") or ""
+    if vocab_file and not os.path.isabs(vocab_file):
+        candidates = [os.path.join(project_path, vocab_file), os.path.join(SCRIPT_DIR, vocab_file)]
+        config["vocab_file"] = next((c for c in candidates if os.path.exists(c)), candidates[0])
+    return config
+
+
+def get_tokenizer(tokenizer_settings):
+    """Tokenizer for resolved tokenizer settings (loaded once per process).
+    
+    Falls back to the character estimate when the BPE vocabulary is missing.
+    """
+    tokenizer_settings = tokenizer_settings or {}
+    key = json.dumps(tokenizer_settings, sort_keys=True)
+    tokenizer = _TOKENIZERS.get(key)
+    if tokenizer is None:
+        chars_per_token = tokenizer_settings.get("chars_per_token", CHARS_PER_TOKEN)
+        if tokenizer_settings.get("type", "estimate") == "bpe":
+            try:
+                tokenizer = BPETokenizer(tokenizer_settings.get("vocab_file", ""),
+                                         tokenizer_settings.get("pattern"))
+            except (OSError, ValueError, re.error) as e:
+                print(f"  ⚠ BPE vocabulary unavailable ({e}), estimating tokens instead")
+        if tokenizer is None:
+            tokenizer = EstimateTokenizer(chars_per_token)
+        _TOKENIZERS[key] = tokenizer
+    return tokenizer
+
+
+class TokenCountCache:
+    """Token counts keyed on the SHA-1 of the counted text.
+    
+    Stored per tokenizer in <cache dir>/tokens/<fingerprint>.json, so files
+    whose content is unchanged are never re-tokenized, whichever profile or
+    compression settings produced them.
+    """
+    
+    def __init__(self, tokenizer, cache_dir=None):
+        self.tokenizer = tokenizer
+        self.path = None
+        if cache_dir and tokenizer.exact:
+            self.path = os.path.join(cache_dir, "tokens", f"{tokenizer.fingerprint}.json")
+        self.counts = {}
+        self.used = set()
+        self.dirty = False
+        if self.path:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.counts = json.load(f)
+            except (OSError, ValueError):
+                pass
+    
+    def lookup(self, digest):
+        """Cached count for a content hash, or None."""
+        count = self.counts.get(digest) if digest else None
+        if count is not None:
+            self.used.add(digest)
+        return count
+    
+    def add(self, digest, count):
+        if digest and self.counts.get(digest) != count:
+            self.counts[digest] = count
+            self.dirty = True
+        self.used.add(digest)
+    
+    def count(self, text, digest=None):
+        """Token count of text, served from the cache when its hash is known."""
+        if not self.tokenizer.exact:
+            return self.tokenizer.count(text)
+        digest = digest or hashlib.sha1(text.encode('utf-8')).hexdigest()
+        count = self.lookup(digest)
+        if count is None:
+            count = self.tokenizer.count(text)
+            self.add(digest, count)
+        return count
+    
+    def save(self):
+        """Persist counts, dropping stale ones once they outnumber the live ones."""
+        if not self.path or not self.dirty:
+            return
+        if len(self.counts) > 2 * len(self.used) + 10000:
+            self.counts = {d: c for d, c in self.counts.items() if d in self.used}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        write_file_atomic(self.path, json.dumps(self.counts, separators=(',', ':')).encode('utf-8'))
+        self.dirty = False
+
+
+# =============================================================================
+# EXTRACTION CACHE
+# =============================================================================
+
+# Bump whenever compressor output changes so stale cache entries are dropped
+CACHE_VERSION = 2
+
+
+def hash_compression_settings(compression_settings):
+    """Stable hash of a profile's compression settings (part of the cache key)."""
+    payload = json.dumps({'cache_version': CACHE_VERSION, 'compression': compression_settings},
+                         sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def write_file_atomic(path, data):
+    """Write bytes to path via a temp file + rename so readers never see partial files."""
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+class ExtractionCache:
+    """Sidecar cache of per-file compressed output and metadata.
+
+    Layout (inside the cache directory):
+        <profile>.json        manifest: rel_path -> size, mtime, metadata, object hash
+        objects/ab/abcd...    compressed file bodies, stored once per unique content
+
+    An entry is only valid while the file's size and mtime are unchanged and
+    the profile's compression settings hash to the same value.
+    """
+
+    def __init__(self, cache_dir, profile_name, compression_settings):
+        self.cache_dir = cache_dir
+        self.profile_name = profile_name
+        self.settings_hash = hash_compression_settings(compression_settings)
+        self.manifest_path = os.path.join(cache_dir, f"{profile_name}.json")
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.entries = {}
+        self.new_entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        if manifest.get('settings_hash') == self.settings_hash:
+            self.entries = manifest.get('files', {})
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def get(self, rel_path, size, mtime_ns):
+        """Return the cached entry for a file, or None if missing/stale."""
+        entry = self.new_entries.get(rel_path) or self.entries.get(rel_path)
+        if entry and entry['size'] == size and entry['mtime_ns'] == mtime_ns:
+            return entry
+        return None
+
+    def content_size(self, entry):
+        """Byte size of an entry's cached body (None if the object is gone)."""
+        try:
+            return os.path.getsize(self._object_path(entry['object']))
+        except OSError:
+            return None
+
+    def read_content(self, entry):
+        """Load the cached compressed body for an entry (None if the object is gone)."""
+        try:
+            with open(self._object_path(entry['object']), 'rb') as f:
+                return f.read().decode('utf-8')
+        except OSError:
+            return None
+
+    def put(self, file_info, result):
+        """Store a freshly processed file (a process_file() result)."""
+        data = result['content'].encode('utf-8')
+        digest = hashlib.sha1(data).hexdigest()
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            write_file_atomic(object_path, data)
+
+        self.new_entries[file_info['rel_path']] = {
+            'size': file_info['size'],
+            'mtime_ns': file_info['mtime_ns'],
+            'metadata': {'namespace': file_info.get('namespace'),
+                         'main_class': file_info.get('main_class')},
+            'original_size': result['original_size'],
+            'usings': sorted(result['usings']),
+            'source_hash': result['source_hash'],
+            'symbols': result.get('symbols'),
+            'references': result.get('references'),
+            'object': digest
+        }
+
+    def keep(self, rel_path, entry):
+        """Carry a still-valid entry over into the manifest written by save()."""
+        self.new_entries[rel_path] = entry
+
+    def save(self):
+        """Write the manifest for this run.
+        
+        Objects no longer referenced are left for prune_cache_objects(), which
+        runs once all profiles of a run are done (objects are shared).
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        manifest = {
+            'cache_version': CACHE_VERSION,
+            'settings_hash': self.settings_hash,
+            'files': self.new_entries
+        }
+        write_file_atomic(self.manifest_path,
+                          json.dumps(manifest, separators=(',', ':')).encode('utf-8'))
+        self.entries = self.new_entries
+        self.new_entries = {}
+
+
+def prune_cache_objects(cache_dir):
+    """Delete cached objects that no profile manifest references; returns how many."""
+    objects_dir = os.path.join(cache_dir, "objects")
+    if not os.path.isdir(objects_dir):
+        return 0
+    referenced = set()
+    for manifest_path in glob.glob(os.path.join(cache_dir, "*.json")):
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return 0  # Never delete objects while a manifest is unreadable
+        if 'settings_hash' not in manifest:
+            continue  # An index sharing the directory (references.json, search.json, ...)
+        referenced.update(e.get('object') for e in manifest.get('files', {}).values())
+    removed = 0
+    for object_path in glob.glob(os.path.join(objects_dir, "*", "*")):
+        if os.path.basename(object_path) not in referenced:
+            try:
+                os.remove(object_path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def open_cache(project_path, profile_name, compression_settings, global_settings):
+    """Open the extraction cache for a profile, or None if caching is disabled."""
+    if not global_settings.get("cache_enabled", True):
+        return None
+    cache_dir = os.path.join(project_path, global_settings.get("cache_directory", "_extractor_cache"))
+    return ExtractionCache(cache_dir, profile_name, compression_settings)
+
+
+# =============================================================================
+# FILE COLLECTION
+# =============================================================================
+
+_GLOB_CHARS_RE = re.compile(r'[*?\[]')
+
+
+def _glob_to_regex(pattern):
+    """Regex source for a '/'-separated glob: * and ? stay within a segment, ** spans segments."""
+    regex = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('/**', i) and i + 3 == len(pattern):
+            regex.append('(?:/.*)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            regex.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            regex.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            regex.append('[^/]')
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            chars = pattern[i + 1:end]
+            if chars.startswith('!'):
+                chars = '^' + chars[1:]
+            regex.append('[' + chars.replace('\\', '\\\\') + ']')
+            i = end + 1
+        else:
+            regex.append(re.escape(pattern[i]))
+            i += 1
+    return ''.join(regex)
+
+
+class PathMatcher:
+    """A profile's blacklist_directories and whitelist_patterns, compiled once.
+    
+    Paths are project-relative with '/' separators. A blacklist entry is a
+    directory name matched at any depth ("Plugins"), a path matched at any
+    depth ("Scripts/Old") or a glob ("**/TextMesh Pro/Examples & Extras/**").
+    Names are a set lookup and paths plus globs are a single regex, so testing
+    a directory costs O(path length) however long the blacklist is.
+    Whitelist patterns are file globs; without any, every file is selected.
+    """
+    
+    def __init__(self, blacklist=(), whitelist=()):
+        flags = re.IGNORECASE if os.name == 'nt' else 0
+        self._fold = str.lower if flags else str
+        self.names = set()
+        patterns = []
+        for entry in blacklist:
+            entry = entry.replace('\\', '/').strip('/')
+            if not entry:
+                continue
+            if _GLOB_CHARS_RE.search(entry):
+                patterns.append(_glob_to_regex(entry))
+            elif '/' in entry:
+                patterns.append('(?:.*/)?' + re.escape(entry))
+            else:
+                self.names.add(self._fold(entry))
+        self._blacklist_re = re.compile('|'.join(patterns), flags) if patterns else None
+        whitelist = [entry.replace('\\', '/').strip('/') for entry in whitelist if entry.strip('/\\')]
+        self._whitelist_re = re.compile('|'.join(_glob_to_regex(entry) for entry in whitelist), flags) \
+            if whitelist else None
+        self.has_blacklist = bool(self.names or self._blacklist_re)
+        self.has_whitelist = self._whitelist_re is not None
+    
+    def skips_directory(self, rel_dir):
+        if self._fold(rel_dir.rpartition('/')[2]) in self.names:
+            return True
+        return self._blacklist_re is not None and self._blacklist_re.fullmatch(rel_dir) is not None
+    
+    def selects_file(self, rel_path):
+        return self._whitelist_re is None or self._whitelist_re.fullmatch(rel_path) is not None
+
+
+@functools.lru_cache(maxsize=64)
+def _compile_path_matcher(blacklist, whitelist):
+    return PathMatcher(blacklist, whitelist)
+
+
+def get_path_matcher(profile):
+    """The (cached) PathMatcher for a profile's blacklist and whitelist."""
+    return _compile_path_matcher(tuple(profile.get("blacklist_directories", [])),
+                                 tuple(profile.get("whitelist_patterns", [])))
+
+
+def _rel_dir(directory):
+    """Project-relative '/'-separated form of a directory setting."""
+    rel_dir = os.path.normpath(directory).replace(os.sep, '/')
+    return '' if rel_dir == '.' else rel_dir
+
+
+def make_directory_pruner(profiles):
+    """Directory filter for a FileIndex shared by several profiles.
+    
+    A directory is pruned from the walk only when every profile that walks
+    it blacklists it, and never when it is (or contains) a profile directory.
+    """
+    scopes = [([_rel_dir(d) for d in profile.get("directories", [])], get_path_matcher(profile))
+              for profile in profiles.values()]
+    if not any(matcher.has_blacklist for _, matcher in scopes):
+        return None
+    
+    def prune(rel_dir):
+        covering = []
+        for tops, matcher in scopes:
+            for top in tops:
+                if top == rel_dir or top.startswith(rel_dir + '/'):
+                    return False
+                if rel_dir.startswith(top + '/'):
+                    covering.append(matcher)
+                    break
+        return bool(covering) and all(matcher.skips_directory(rel_dir) for matcher in covering)
+    return prune
+
+
+class FileIndex:
+    """One directory walk per run, shared by every profile.
+    
+    The union of all profile directories is walked once with os.scandir;
+    a directory nested inside another root (e.g. Assets/Scripts/A_ToolkitUI
+    inside Assets/Scripts) is not walked again. Directory entries are kept so
+    each file is stat'ed at most once, and profiles filter the index by
+    blacklist and extension without touching the disk.
+    
+    With tracked_paths (full paths, e.g. from tracked_files()) the tree is
+    built from that list instead of walking the disk. prune (see
+    make_directory_pruner) is called with each directory's project-relative
+    path; directories it returns True for are neither listed nor descended.
+    """
+    
+    def __init__(self, project_path, directories, tracked_paths=None, prune=None):
+        self.project_path = project_path
+        self.dirs = {}  # full dir path -> (parent full path or None, name, [DirEntry of files])
+        self.children = {}  # full dir path -> [child full dir paths]
+        self.rel_dirs = {}  # full dir path -> project-relative path with '/' separators
+        self.tracked = tracked_paths is not None
+        self.pruned = 0
+        self._prune = prune
+        self._stats = {}
+        
+        roots = sorted({os.path.normpath(os.path.join(project_path, d)) for d in directories})
+        walked = []
+        for root in roots:
+            if any(root == w or root.startswith(w + os.sep) for w in walked):
+                continue
+            if os.path.isdir(root):
+                walked.append(root)
+        if tracked_paths is None:
+            for root in walked:
+                self._walk(root)
+        else:
+            self._add_tracked(walked, tracked_paths)
+    
+    def _root_rel_dir(self, root):
+        return _rel_dir(os.path.relpath(root, self.project_path))
+    
+    def _is_pruned(self, rel_dir):
+        if self._prune is not None and self._prune(rel_dir):
+            self.pruned += 1
+            return True
+        return False
+    
+    def _add_tracked(self, roots, tracked_paths):
+        for root in roots:
+            self.dirs[root] = (None, os.path.basename(root), [])
+            self.children[root] = []
+            self.rel_dirs[root] = self._root_rel_dir(root)
+        pruned = set()
+        for full_path in tracked_paths:
+            directory = os.path.dirname(full_path)
+            if not any(directory == root or directory.startswith(root + os.sep) for root in roots):
+                continue
+            # Register missing parent directories, outermost first
+            missing = []
+            while directory not in self.dirs and directory not in pruned:
+                missing.append(directory)
+                directory = os.path.dirname(directory)
+            if directory in pruned:
+                continue
+            for path in reversed(missing):
+                parent = os.path.dirname(path)
+                rel_dir = f"{self.rel_dirs[parent]}/{os.path.basename(path)}".lstrip('/')
+                if self._is_pruned(rel_dir):
+                    pruned.add(path)
+                    break
+                self.dirs[path] = (parent, os.path.basename(path), [])
+                self.children[parent].append(path)
+                self.children[path] = []
+                self.rel_dirs[path] = rel_dir
+            else:
+                self.dirs[os.path.dirname(full_path)][2].append(TrackedFile(full_path))
+    
+    def _walk(self, root):
+        stack = [(root, None, os.path.basename(root), self._root_rel_dir(root))]
+        while stack:
+            path, parent, name, rel_dir = stack.pop()
+            files = []
+            subdirs = []
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        try:
+                            # Like os.walk: symlinked directories are listed, not followed
+                            if entry.is_dir():
+                                if not entry.is_symlink():
+                                    subdirs.append(entry)
+                            else:
+                                files.append(entry)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+            self.dirs[path] = (parent, name, files)
+            self.rel_dirs[path] = rel_dir
+            # Pruned subdirectories are dropped before they are listed
+            children = []
+            for entry in subdirs:
+                child_rel_dir = f"{rel_dir}/{entry.name}".lstrip('/')
+                if not self._is_pruned(child_rel_dir):
+                    children.append((entry.path, path, entry.name, child_rel_dir))
+            self.children[path] = [child[0] for child in children]
+            stack.extend(reversed(children))
+    
+    @property
+    def file_count(self):
+        return sum(len(files) for _, _, files in self.dirs.values())
+    
+    def has_directory(self, directory):
+        return os.path.normpath(os.path.join(self.project_path, directory)) in self.dirs
+    
+    def stat(self, entry):
+        """(size, mtime_ns) of a file entry, or (-1, -1) if it cannot be stat'ed."""
+        result = self._stats.get(entry.path)
+        if result is None:
+            try:
+                st = entry.stat()
+                result = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                result = (-1, -1)
+            self._stats[entry.path] = result
+        return result
+    
+    def iter_dirs(self, directory, matcher=None):
+        """Full paths of a directory and its subdirectories, skipping blacklisted ones.
+        
+        matcher is a PathMatcher; subdirectories it skips are not descended.
+        """
+        top = os.path.normpath(os.path.join(self.project_path, directory))
+        if top not in self.dirs:
+            return
+        check = matcher is not None and matcher.has_blacklist
+        stack = [top]
+        while stack:
+            path = stack.pop()
+            yield path
+            for child in reversed(self.children[path]):
+                if child not in self.dirs:
+                    continue  # could not be listed
+                if check and matcher.skips_directory(self.rel_dirs[child]):
+                    continue
+                stack.append(child)
+    
+    def iter_files(self, directory, matcher=None):
+        """File entries under a directory, skipping blacklisted subdirectories."""
+        for path in self.iter_dirs(directory, matcher):
+            yield from self.dirs[path][2]
+    
+    def profile_files(self, profile):
+        """(DirEntry, lower-case extension) of every indexed file a profile selects."""
+        matcher = get_path_matcher(profile)
+        include_ext = [ext.lower() for ext in profile.get("include_extensions", [])]
+        exclude_ext = [ext.lower() for ext in profile.get("exclude_extensions", [])]
+        for directory in profile.get("directories", []):
+            for path in self.iter_dirs(directory, matcher):
+                for entry in self.dirs[path][2]:
+                    file_ext = os.path.splitext(entry.name)[1].lower()
+                    
+                    # Check inclusion/exclusion
+                    if include_ext and file_ext not in include_ext:
+                        continue
+                    if file_ext in exclude_ext:
+                        continue
+                    if matcher.has_whitelist and not matcher.selects_file(
+                            f"{self.rel_dirs[path]}/{entry.name}".lstrip('/')):
+                        continue
+                    # Tracked files may have been deleted from the work tree
+                    if self.tracked and self.stat(entry)[0] < 0:
+                        continue
+                    yield entry, file_ext
+
+
+def collect_files(project_path, profile, cache=None, file_index=None, log=print):
+    """Collect all files matching profile criteria.
+    
+    Files come from the shared FileIndex when given (one is built for this
+    profile otherwise). Metadata for unchanged files comes from the cache;
+    for the rest it starts from the filename and is filled in by
+    process_file(), so files are ordered with sort_files() after processing.
+    """
+    files = []
+    directories = profile.get("directories", [])
+    
+    if file_index is None:
+        file_index = FileIndex(project_path, directories)
+    
+    for directory in directories:
+        if not file_index.has_directory(directory):
+            log(f"  ⚠ Directory not found: {directory}")
+    
+    for entry, file_ext in file_index.profile_files(profile):
+        filename = entry.name
+        full_path = entry.path
+        rel_path = os.path.relpath(full_path, project_path)
+        size, mtime_ns = file_index.stat(entry)
+        
+        # Metadata of unchanged files comes from the cache
+        cache_entry = cache.get(rel_path, size, mtime_ns) if cache else None
+        if cache_entry:
+            metadata = dict(cache_entry['metadata'])
+        else:
+            metadata = {'namespace': None, 'main_class': os.path.splitext(filename)[0]}
+        
+        files.append({
+            'full_path': full_path,
+            'rel_path': rel_path,
+            'filename': filename,
+            'extension': file_ext,
+            'size': size,
+            'mtime_ns': mtime_ns,
+            **metadata
+        })
+    
+    return files
+
+
+def sort_files(files):
+    """Order files by namespace (if available), then by path."""
+    # Use empty string for None namespaces to ensure proper sorting
+    return sorted(files, key=lambda x: (x.get('namespace') or '', x['rel_path']))
+
+
+METADATA_PREVIEW_CHARS = 3000  # Namespace/class declarations are near the top
+
+_NAMESPACE_RE = re.compile(r'namespace\s+([\w.]+)\s*[{;]')
+_MAIN_CLASS_PATTERNS = [
+    re.compile(r'public\s+(?:abstract\s+)?(?:partial\s+)?(?:sealed\s+)?(?:class|interface|struct|enum)\s+(\w+)'),
+    re.compile(r'internal\s+(?:abstract\s+)?(?:partial\s+)?(?:sealed\s+)?(?:class|interface|struct|enum)\s+(\w+)'),
+    re.compile(r'(?:abstract\s+)?(?:partial\s+)?(?:sealed\s+)?(?:class|interface|struct|enum)\s+(\w+)'),
+]
+
+
+def detect_file_metadata(content, file_path, extension):
+    """Extract metadata (namespace, class name) from a file's already-loaded content."""
+    filename_without_ext = os.path.splitext(os.path.basename(file_path))[0]
+    
+    metadata = {
+        'namespace': None,  # None instead of 'Unknown' - we'll handle display later
         'main_class': filename_without_ext
     }
     
-    if extension != '.cs':
-        return metadata
+    if extension != '.cs':
+        return metadata
+    
+    content_preview = content[:METADATA_PREVIEW_CHARS]
+    
+    # Find namespace (handle file-scoped namespaces too)
+    # Standard: namespace Foo.Bar { ... }
+    # File-scoped: namespace Foo.Bar;
+    ns_match = _NAMESPACE_RE.search(content_preview)
+    if ns_match:
+        metadata['namespace'] = ns_match.group(1)
+    
+    # Find main class/interface/struct/enum
+    # Priority: public > internal > private
+    for pattern in _MAIN_CLASS_PATTERNS:
+        class_match = pattern.search(content_preview)
+        if class_match:
+            metadata['main_class'] = class_match.group(1)
+            break
+    
+    return metadata
+
+
+# =============================================================================
+# GIT
+# =============================================================================
+
+class TrackedFile:
+    """os.DirEntry stand-in for a file listed in the git index."""
+    
+    __slots__ = ('path', 'name')
+    
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+    
+    def stat(self):
+        return os.stat(self.path)
+
+
+def find_git_dir(path):
+    """(work tree root, git dir) of the repository containing path, or (None, None)."""
+    path = os.path.abspath(path)
+    while True:
+        dot_git = os.path.join(path, '.git')
+        if os.path.isdir(dot_git):
+            return path, dot_git
+        if os.path.isfile(dot_git):
+            # Linked work trees and submodules: .git is a "gitdir: <path>" file
+            try:
+                with open(dot_git, 'r', encoding='utf-8') as f:
+                    line = f.readline().strip()
+            except OSError:
+                return None, None
+            if line.startswith('gitdir:'):
+                return path, os.path.normpath(os.path.join(path, line[len('gitdir:'):].strip()))
+            return None, None
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None, None
+        path = parent
+
+
+_GIT_INDEX_ENTRY = struct.Struct('>10I20sH')  # stat fields, blob SHA-1, flags
+
+
+def _read_index_varint(data, pos):
+    byte = data[pos]
+    pos += 1
+    value = byte & 0x7f
+    while byte & 0x80:
+        byte = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (byte & 0x7f)
+    return value, pos
+
+
+def read_git_index(git_dir):
+    """Stage-0 entries of the git index: {path: (blob SHA-1, size, mtime_ns)}.
+    
+    Paths are relative to the work tree with '/' separators. Index versions
+    2 to 4 are read directly, without running git; skip-worktree entries
+    (sparse checkouts) are left out. Raises ValueError for anything else.
+    """
+    with open(os.path.join(git_dir, 'index'), 'rb') as f:
+        data = f.read()
+    if data[:4] != b'DIRC':
+        raise ValueError("not a git index")
+    version, count = struct.unpack_from('>II', data, 4)
+    if version not in (2, 3, 4):
+        raise ValueError(f"unsupported git index version {version}")
+    
+    entries = {}
+    pos = 12
+    previous = b''
+    try:
+        for _ in range(count):
+            start = pos
+            fields = _GIT_INDEX_ENTRY.unpack_from(data, pos)
+            flags = fields[11]
+            pos += _GIT_INDEX_ENTRY.size
+            extended = 0
+            if version >= 3 and flags & 0x4000:
+                extended = struct.unpack_from('>H', data, pos)[0]
+                pos += 2
+            if version == 4:
+                # Paths are stored as "drop N bytes of the previous path, append this"
+                strip, pos = _read_index_varint(data, pos)
+                end = data.index(b'\0', pos)
+                path = previous[:len(previous) - strip] + data[pos:end]
+                pos = end + 1
+            else:
+                end = data.index(b'\0', pos)
+                path = data[pos:end]
+                pos = start + ((end - start) // 8 + 1) * 8  # NUL-padded to 8 bytes
+            previous = path
+            if (flags >> 12) & 3 or extended & 0x4000:  # merge stage or skip-worktree
+                continue
+            mtime_ns = fields[2] * 1000000000 + fields[3]
+            entries[path.decode('utf-8', 'surrogateescape')] = (fields[10].hex(), fields[9], mtime_ns)
+    except (struct.error, IndexError) as e:
+        raise ValueError(f"truncated git index ({e})")
+    return entries
+
+
+def _project_prefix(project_path, work_tree):
+    """Path of project_path inside the work tree as a git path prefix ('' or 'dir/')."""
+    prefix = os.path.relpath(os.path.abspath(project_path), work_tree).replace(os.sep, '/')
+    return '' if prefix == '.' else prefix + '/'
+
+
+def tracked_files(project_path):
+    """Full paths of the project's files tracked by git, or None without a readable index."""
+    work_tree, git_dir = find_git_dir(project_path)
+    if not git_dir:
+        return None
+    try:
+        entries = read_git_index(git_dir)
+    except (OSError, ValueError):
+        return None
+    prefix = _project_prefix(project_path, work_tree)
+    return [os.path.normpath(os.path.join(project_path, *path[len(prefix):].split('/')))
+            for path in entries if path.startswith(prefix)]
+
+
+def build_file_index(project_path, profiles, global_settings, log=print):
+    """FileIndex over the profiles' directories using the configured discovery.
+    
+    discovery is "filesystem" or "git"; either way, directories every
+    covering profile blacklists are pruned up front.
+    """
+    directories = [d for p in profiles.values() for d in p.get("directories", [])]
+    prune = make_directory_pruner(profiles)
+    if global_settings.get("discovery", "filesystem") == "git":
+        tracked = tracked_files(project_path)
+        if tracked is not None:
+            return FileIndex(project_path, directories, tracked, prune)
+        log("⚠ No readable git index found, discovering files on disk")
+    return FileIndex(project_path, directories, prune=prune)
+
+
+def _git(work_tree, *args):
+    """stdout of a git command; raises ValueError with git's message on failure."""
+    completed = subprocess.run(['git', '-C', work_tree, *args], capture_output=True)
+    if completed.returncode != 0:
+        message = completed.stderr.decode('utf-8', 'replace').strip()
+        raise ValueError(message.splitlines()[-1] if message else f"git {args[0]} failed")
+    return completed.stdout
+
+
+def git_blob_sha(data):
+    """The SHA-1 git gives a blob with this content."""
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+
+def git_tree_blobs(work_tree, ref):
+    """{path: blob SHA-1} of every file in ref's tree, from one `git ls-tree` call."""
+    blobs = {}
+    for record in _git(work_tree, 'ls-tree', '-r', '-z', '--full-tree', ref).split(b'\0'):
+        if not record:
+            continue
+        info, path = record.split(b'\t', 1)
+        _, kind, sha = info.split()
+        if kind == b'blob':
+            blobs[path.decode('utf-8', 'surrogateescape')] = sha.decode('ascii')
+    return blobs
+
+
+def profile_selects(profile, rel_path):
+    """Whether a project-relative '/'-separated path, existing or not, is one a profile would pick up."""
+    file_ext = os.path.splitext(rel_path)[1].lower()
+    include_ext = [ext.lower() for ext in profile.get("include_extensions", [])]
+    if include_ext and file_ext not in include_ext:
+        return False
+    if file_ext in [ext.lower() for ext in profile.get("exclude_extensions", [])]:
+        return False
+    
+    matcher = get_path_matcher(profile)
+    if not matcher.selects_file(rel_path):
+        return False
+    for directory in profile.get("directories", []):
+        top = _rel_dir(directory)
+        prefix = f"{top}/" if top else ""
+        if not rel_path.startswith(prefix):
+            continue
+        # Every directory below top has to pass the blacklist, as in FileIndex.iter_dirs
+        path = top
+        for part in rel_path[len(prefix):].split('/')[:-1]:
+            path = f"{path}/{part}".lstrip('/')
+            if matcher.skips_directory(path):
+                break
+        else:
+            return True
+    return False
+
+
+def changed_since(project_path, profiles, file_index, ref):
+    """What changed in each profile's files since a git ref.
+    
+    Returns (abbreviated commit, {profile name: (added, modified, deleted)})
+    with project-relative paths. A file's current blob hash comes from the
+    git index when its size and mtime still match the index entry, so only
+    files touched since git last looked at them are read and hashed.
+    Raises ValueError (or OSError if git can't run) when the ref can't be read.
+    """
+    work_tree, git_dir = find_git_dir(project_path)
+    if not git_dir:
+        raise ValueError(f"{project_path} is not inside a git repository")
+    prefix = _project_prefix(project_path, work_tree)
+    commit = _git(work_tree, 'rev-parse', '--verify', '--short', f"{ref}^{{commit}}").decode('ascii').strip()
+    ref_blobs = {path[len(prefix):]: sha for path, sha in git_tree_blobs(work_tree, ref).items()
+                 if path.startswith(prefix)}
+    try:
+        index = read_git_index(git_dir)
+        index_mtime_ns = os.stat(os.path.join(git_dir, 'index')).st_mtime_ns
+    except (OSError, ValueError):
+        index, index_mtime_ns = {}, 0
+    
+    def current_sha(key, full_path, size, mtime_ns):
+        cached = index.get(prefix + key)
+        # Entries modified in the same tick the index was written are "racy"; hash those
+        if cached and cached[1] == size and cached[2] == mtime_ns and mtime_ns < index_mtime_ns:
+            return cached[0]
+        with open(full_path, 'rb') as f:
+            data = f.read()
+        sha = git_blob_sha(data)
+        if sha != ref_blobs.get(key) and b'\r\n' in data:
+            sha = git_blob_sha(data.replace(b'\r\n', b'\n'))  # checked out with text=auto / autocrlf
+        return sha
+    
+    changes = {}
+    for name, profile in profiles.items():
+        added, modified, current = [], [], set()
+        for entry, _ in file_index.profile_files(profile):
+            rel_path = os.path.relpath(entry.path, project_path)
+            key = rel_path.replace(os.sep, '/')
+            current.add(key)
+            if key not in ref_blobs:
+                added.append(rel_path)
+                continue
+            size, mtime_ns = file_index.stat(entry)
+            try:
+                if current_sha(key, entry.path, size, mtime_ns) != ref_blobs[key]:
+                    modified.append(rel_path)
+            except OSError:
+                continue
+        deleted = [key.replace('/', os.sep) for key in sorted(ref_blobs)
+                   if key not in current and profile_selects(profile, key)]
+        changes[name] = (sorted(added), sorted(modified), deleted)
+    return commit, changes
+
+
+def plan_delta_profiles(project_path, profiles, file_index, ref):
+    """Restrict profiles to the files changed since ref.
+    
+    Returns ({name: delta profile}, {name: set of rel_paths}) like
+    plan_seeded_profiles(). Delta profiles write "<output>_delta" with the
+    added, modified and deleted files listed in the header. Profiles whose
+    only changes are deletions get a header-only output right away.
+    """
+    commit, changes = changed_since(project_path, profiles, file_index, ref)
+    delta_profiles = {}
+    only_files = {}
+    for name, profile in profiles.items():
+        added, modified, deleted = changes[name]
+        if not (added or modified or deleted):
+            print(f"✓ {name}: no changes since {ref}")
+            continue
+        print(f"Δ {name}: {len(added)} added, {len(modified)} modified, {len(deleted)} deleted since {ref} ({commit})")
+        
+        lines = [f"DELTA EXTRACTION: changes since {ref} ({commit})"]
+        for title, paths in (("ADDED", added), ("MODIFIED", modified), ("DELETED", deleted)):
+            if paths:
+                lines.append(f"\n{title} ({len(paths)}):")
+                lines.extend(f"- {path}" for path in paths)
+        delta_header = '\n'.join(lines) + "\n\n"
+        
+        base_filename = profile.get("output_filename", f"EXTRACTED_{name}")
+        if not (added or modified):
+            output_filename = f"{base_filename}_delta.txt"
+            try:
+                write_file_atomic(os.path.join(project_path, output_filename), delta_header.encode('utf-8'))
+                print(f"  Only deletions; saved to: {output_filename}")
+            except OSError as e:
+                print(f"  ✗ Error: Could not write to output file. {e}")
+            continue
+        
+        delta = dict(profile)
+        delta["output_filename"] = f"{base_filename}_delta"
+        delta["part_output_filename"] = f"{base_filename}_delta_part"
+        delta["description"] = f"{profile.get('description', name)} - changes since {ref}"
+        # Paths may contain braces; the header is run through str.format()
+        delta["header_text"] = (delta_header.replace('{', '{{').replace('}', '}}')
+                                + profile.get("header_text", "Extracted files\n"))
+        delta_profiles[name] = delta
+        only_files[name] = set(added) | set(modified)
+    return delta_profiles, only_files
+
+
+# =============================================================================
+# TABLE OF CONTENTS
+# =============================================================================
+
+TOC_HEADING = "TABLE OF CONTENTS:"
+
+
+def create_table_of_contents(files, file_locations, profile):
+    """Create table of contents.
+    
+    Files carrying a 'tokens' count (real tokenizer counts) list it next to
+    their line number.
+    """
+    toc = []
+    current_namespace = "__INITIAL__"  # Sentinel value
+    compact = profile.get("compact_toc", False)
+    compression_enabled = profile.get("compression", {}).get("enabled", False)
+    
+    if not files:
+        toc.append("No matching files were found.")
+        return toc
+    
+    for file_info in files:
+        # Group by namespace for code files
+        if file_info.get('extension') == '.cs' and compression_enabled:
+            namespace = file_info.get('namespace')
+            if namespace != current_namespace:
+                current_namespace = namespace
+                if namespace:
+                    toc.append(f"\n[{namespace}]")
+                else:
+                    toc.append(f"\n[Global Scope]")  # Better than "Unknown" or "//"
+        
+        location = file_locations.get(file_info['rel_path'], {})
+        line_info = f"L{location.get('line_num', '?')}"
+        tokens = file_info.get('tokens')
+        
+        # Shorten path for display
+        short_path = file_info['rel_path']
+        for prefix in ["Assets/Scripts/", "Assets/Editor/", "Assets/"]:
+            if short_path.startswith(prefix):
+                short_path = short_path[len(prefix):]
+                break
+        
+        if compact and file_info.get('extension') == '.cs':
+            dir_path = os.path.dirname(short_path)
+            if tokens is not None:
+                line_info += f" {tokens}t"
+            if dir_path:
+                toc.append(f"  {file_info['main_class']} ({dir_path}/) {line_info}")
+            else:
+                toc.append(f"  {file_info['main_class']} {line_info}")
+        elif tokens is not None:
+            toc.append(f"- {short_path} (Line: {line_info}, {tokens:,} tokens)")
+        else:
+            toc.append(f"- {short_path} (Line: {line_info})")
+    
+    toc.append("")
+    return toc
+
+
+# =============================================================================
+# FILE CLEANUP
+# =============================================================================
+
+# Optional "_<timestamp>" suffix of outputs written with include_timestamp_in_filename
+_OUTPUT_TIMESTAMP_PATTERN = r'(?:_\d{8}_\d{6})?'
+
+
+def clean_previous_files(project_path, profile_name, profile, global_settings, timestamp, log=print):
+    """Clean up previous output files for a profile.
+    
+    Only the profile's own names are matched: the output (plain or
+    timestamped, in any output format), its numbered parts, part index and
+    symbol indexes. Outputs of targeted runs ("<output>_seed_*", "_delta",
+    "_query", "_refs_*") share the prefix but are left alone.
+    """
+    output_filename = profile.get("output_filename", f"EXTRACTED_{profile_name}")
+    part_filename = profile.get("part_output_filename") or f"{output_filename}_part"
+    
+    own_names = re.compile(
+        rf"{re.escape(output_filename)}{_OUTPUT_TIMESTAMP_PATTERN}(?:\.txt|\.index\.json|\.jsonl|\.pack)|"
+        rf"{re.escape(part_filename)}(?:\d+|_index){_OUTPUT_TIMESTAMP_PATTERN}(?:\.txt|\.index\.json)")
+    
+    files_to_clean = []
+    for prefix in (output_filename, part_filename):
+        for path in glob.glob(glob.escape(os.path.join(project_path, prefix)) + '*'):
+            if own_names.fullmatch(os.path.basename(path)) and path not in files_to_clean:
+                files_to_clean.append(path)
+    
+    if not files_to_clean:
+        return
+    
+    # Backup if enabled
+    if global_settings.get("backup_previous_files", False):
+        try:
+            store = open_backup_store(project_path, global_settings)
+            snapshot_id, total_size, new_size = store.snapshot(profile_name, timestamp, files_to_clean)
+            log(f"  📦 Backed up {len(files_to_clean)} file(s) as {snapshot_id} "
+                f"({format_size(total_size)}, {format_size(new_size)} new)")
+        except (OSError, ValueError) as e:
+            log(f"  ⚠ Failed to backup previous files: {e}")
+    
+    # Remove files
+    for file_path in files_to_clean:
+        try:
+            os.remove(file_path)
+            log(f"  🗑 Removed: {os.path.basename(file_path)}")
+        except Exception as e:
+            log(f"  ⚠ Failed to remove {os.path.basename(file_path)}: {e}")
+
+
+# =============================================================================
+# BACKUP STORE
+# =============================================================================
+
+BACKUP_STORE_VERSION = 1
+
+# Chunks end at a line whose CRC-32 has these low bits clear (about 1 line in
+# 128), so an edit only changes the chunks around it
+BACKUP_CHUNK_MASK = 0x7f
+BACKUP_MIN_CHUNK = 2048
+BACKUP_MAX_CHUNK = 65536
+
+_BACKUP_CODECS = {'none': b'N', 'zlib': b'Z', 'lzma': b'L'}
+
+
+def split_chunks(data):
+    """Split bytes into content-defined chunks at line boundaries."""
+    chunks = []
+    start = pos = 0
+    while pos < len(data):
+        end = data.find(b'\n', pos, start + BACKUP_MAX_CHUNK)
+        if end < 0:
+            # No line break before the size limit (or the end of the data)
+            pos = min(len(data), start + BACKUP_MAX_CHUNK)
+            cut = True
+        else:
+            line_end = end + 1
+            cut = (line_end - start >= BACKUP_MIN_CHUNK
+                   and not zlib.crc32(data[pos:line_end]) & BACKUP_CHUNK_MASK)
+            pos = line_end
+        if cut or pos >= len(data):
+            chunks.append(data[start:pos])
+            start = pos
+    return chunks
+
+
+class BackupStore:
+    """Snapshots of output files, stored as deduplicated chunks.
+    
+    Layout under root: chunks/<2 hex>/<sha256> holds each unique chunk once
+    (one codec byte, then the possibly compressed data) and
+    snapshots/<id>.json lists, per file, its size, SHA-256 and chunk ids.
+    Outputs that barely change between runs share almost all their chunks,
+    so a snapshot costs little more than its manifest.
+    """
+    
+    def __init__(self, root, compression='zlib'):
+        if compression not in _BACKUP_CODECS:
+            raise ValueError(f"unknown backup_compression '{compression}'")
+        self.root = root
+        self.compression = compression
+        self.chunks_dir = os.path.join(root, "chunks")
+        self.snapshots_dir = os.path.join(root, "snapshots")
+    
+    def _chunk_path(self, digest):
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+    
+    def _encode(self, data):
+        if self.compression == 'zlib':
+            return b'Z' + zlib.compress(data, 6)
+        if self.compression == 'lzma':
+            import lzma
+            return b'L' + lzma.compress(data)
+        return b'N' + data
+    
+    def read_chunk(self, digest):
+        with open(self._chunk_path(digest), 'rb') as f:
+            stored = f.read()
+        codec, payload = stored[:1], stored[1:]
+        if codec == b'Z':
+            data = zlib.decompress(payload)
+        elif codec == b'L':
+            import lzma
+            data = lzma.decompress(payload)
+        else:
+            data = payload
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"backup chunk {digest[:12]} is corrupt")
+        return data
+    
+    def snapshot(self, profile_name, timestamp, file_paths):
+        """Store the given files as one snapshot; returns (id, total bytes, bytes newly stored)."""
+        files = []
+        total_size = new_size = 0
+        for file_path in file_paths:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            chunk_ids = []
+            for chunk in split_chunks(data):
+                digest = hashlib.sha256(chunk).hexdigest()
+                chunk_path = self._chunk_path(digest)
+                if not os.path.exists(chunk_path):
+                    os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+                    stored = self._encode(chunk)
+                    write_file_atomic(chunk_path, stored)
+                    new_size += len(stored)
+                chunk_ids.append(digest)
+            files.append({'name': os.path.basename(file_path), 'size': len(data),
+                          'sha256': hashlib.sha256(data).hexdigest(), 'chunks': chunk_ids})
+            total_size += len(data)
+        
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        snapshot_id = f"{timestamp}_{profile_name}"
+        suffix = 1
+        while os.path.exists(os.path.join(self.snapshots_dir, f"{snapshot_id}.json")):
+            suffix += 1
+            snapshot_id = f"{timestamp}_{profile_name}_{suffix}"
+        manifest = {'version': BACKUP_STORE_VERSION, 'id': snapshot_id, 'profile': profile_name,
+                    'created': datetime.datetime.now().isoformat(timespec='seconds'), 'files': files}
+        manifest_data = json.dumps(manifest, separators=(',', ':')).encode('utf-8')
+        write_file_atomic(os.path.join(self.snapshots_dir, f"{snapshot_id}.json"), manifest_data)
+        return snapshot_id, total_size, new_size + len(manifest_data)
+    
+    def snapshots(self):
+        """All snapshot manifests, oldest first."""
+        manifests = []
+        for path in glob.glob(os.path.join(self.snapshots_dir, "*.json")):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if manifest.get('version') == BACKUP_STORE_VERSION:
+                manifests.append(manifest)
+        return sorted(manifests, key=lambda m: (m['created'], m['id']))
+    
+    def find(self, query, profile_name=None):
+        """The snapshot named by an id, a unique id prefix or "latest" (optionally per profile)."""
+        manifests = [m for m in self.snapshots() if not profile_name or m['profile'] == profile_name]
+        if query == 'latest':
+            return manifests[-1] if manifests else None
+        exact = [m for m in manifests if m['id'] == query]
+        if exact:
+            return exact[0]
+        matches = [m for m in manifests if m['id'].startswith(query)]
+        if len(matches) > 1:
+            raise ValueError(f"'{query}' matches {len(matches)} snapshots: "
+                             f"{', '.join(m['id'] for m in matches[:5])}")
+        return matches[0] if matches else None
+    
+    def restore(self, manifest, target_dir):
+        """Write a snapshot's files into target_dir; returns their paths."""
+        os.makedirs(target_dir, exist_ok=True)
+        restored = []
+        for entry in manifest['files']:
+            data = b''.join(self.read_chunk(digest) for digest in entry['chunks'])
+            if hashlib.sha256(data).hexdigest() != entry['sha256']:
+                raise ValueError(f"{entry['name']} does not match its checksum")
+            path = os.path.join(target_dir, entry['name'])
+            write_file_atomic(path, data)
+            restored.append(path)
+        return restored
+    
+    def stored_size(self):
+        total = 0
+        for directory in (self.chunks_dir, self.snapshots_dir):
+            for dirpath, _, filenames in os.walk(directory):
+                total += sum(os.path.getsize(os.path.join(dirpath, name)) for name in filenames)
+        return total
+    
+    def apply_retention(self, keep=0, max_age_days=0):
+        """Drop old snapshots, then chunks no snapshot uses; returns (snapshots, chunks) removed."""
+        manifests = self.snapshots()
+        cutoff = None
+        if max_age_days:
+            cutoff = (datetime.datetime.now() - datetime.timedelta(days=max_age_days)).isoformat(timespec='seconds')
+        
+        by_profile = {}
+        for manifest in manifests:
+            by_profile.setdefault(manifest['profile'], []).append(manifest)
+        expired = []
+        for profile_manifests in by_profile.values():
+            for index, manifest in enumerate(reversed(profile_manifests)):
+                if (keep and index >= keep) or (cutoff and manifest['created'] < cutoff):
+                    expired.append(manifest)
+        for manifest in expired:
+            try:
+                os.remove(os.path.join(self.snapshots_dir, f"{manifest['id']}.json"))
+            except OSError:
+                pass
+        
+        expired_ids = {m['id'] for m in expired}
+        referenced = {digest for m in manifests if m['id'] not in expired_ids
+                      for entry in m['files'] for digest in entry['chunks']}
+        removed_chunks = 0
+        for path in glob.glob(os.path.join(self.chunks_dir, "*", "*")):
+            if os.path.basename(path) not in referenced:
+                try:
+                    os.remove(path)
+                    removed_chunks += 1
+                except OSError:
+                    pass
+        return len(expired), removed_chunks
+
+
+def open_backup_store(project_path, global_settings):
+    return BackupStore(os.path.join(project_path, global_settings.get("backup_directory", "_extractor_backups")),
+                       global_settings.get("backup_compression", "zlib"))
+
+
+def list_backups(project_path, profile_filter=None):
+    """Print the snapshots in the backup store."""
+    store = open_backup_store(project_path, load_settings().get("global", {}))
+    manifests = [m for m in store.snapshots() if not profile_filter or m['profile'] == profile_filter]
+    
+    print("\n" + "=" * 60)
+    print("BACKUP SNAPSHOTS")
+    print("=" * 60)
+    if not manifests:
+        print(f"\nNo snapshots in {store.root}")
+        return
+    
+    logical_size = 0
+    for manifest in manifests:
+        size = sum(entry['size'] for entry in manifest['files'])
+        logical_size += size
+        names = ', '.join(entry['name'] for entry in manifest['files'])
+        print(f"  {manifest['id']:<40} {format_size(size):>8}  {names}")
+    print(f"\n{len(manifests)} snapshot(s), {format_size(logical_size)} of outputs "
+          f"stored in {format_size(store.stored_size())}")
+
+
+def restore_backup(project_path, query, target_dir=None, profile_filter=None):
+    """Restore a snapshot's files (into the project unless target_dir is given)."""
+    store = open_backup_store(project_path, load_settings().get("global", {}))
+    try:
+        manifest = store.find(query, profile_filter)
+        if manifest is None:
+            print(f"✗ No backup snapshot matches '{query}'. Run with --backups to list them.")
+            return False
+        restored = store.restore(manifest, target_dir or project_path)
+    except (OSError, ValueError) as e:
+        print(f"✗ Error: Could not restore backup. {e}")
+        return False
+    print(f"✓ Restored snapshot {manifest['id']}:")
+    for path in restored:
+        print(f"   - {path}")
+    return True
+
+
+# =============================================================================
+# OUTPUT WRITER
+# =============================================================================
+
+class StreamingOutputWriter:
+    """Streams file blocks to a temp file, then lays out header + TOC in front.
+    
+    The output is a '\\n'-joined sequence of lines: a prefix (header, TOC,
+    section separator) followed by one block per file. Blocks are written to
+    a temp file as soon as they are produced, in any order, while their byte
+    and line counts are tracked, so memory use does not grow with the
+    project. write_output() writes a prefix, copies the requested blocks in
+    order and atomically renames the result into place.
+    """
+    
+    COPY_CHUNK_SIZE = 1 << 20
+    
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.body_path = f"{output_path}.{os.getpid()}.body.tmp"
+        self.blocks = {}  # key -> (offset in temp file, byte length, line count, char count)
+        self.bytes_written = 0
+        self._body = open(self.body_path, 'wb')
+        self._offset = 0
+    
+    def add_block(self, key, lines):
+        """Append a block made of the given lines."""
+        text = '\n'.join(lines)
+        data = text.encode('utf-8')
+        self._body.write(data)
+        self.blocks[key] = (self._offset, len(data), len(lines), len(text))
+        self._offset += len(data)
+    
+    def block_chars(self, key):
+        """Character count of a block (without the joining newline)."""
+        return self.blocks[key][3]
+    
+    def layout(self, order, prefix_line_count, prefix_byte_count=0):
+        """Final position of each block: 1-based start line, line count, byte offset and length."""
+        locations = {}
+        line_num = prefix_line_count + 1
+        offset = prefix_byte_count + 1
+        for key in order:
+            _, length, line_count, _ = self.blocks[key]
+            locations[key] = {'line_num': line_num, 'line_count': line_count,
+                              'offset': offset, 'length': length}
+            line_num += line_count
+            offset += length + 1
+        return locations
+    
+    def write_output(self, output_path, prefix_lines, order):
+        """Write prefix + the given blocks to output_path atomically; returns bytes written.
+        
+        May be called several times (e.g. once per part) before discard().
+        """
+        self._body.close()
+        temp_path = f"{output_path}.{os.getpid()}.tmp"
+        try:
+            with open(self.body_path, 'rb') as body, open(temp_path, 'wb') as out:
+                prefix = '\n'.join(prefix_lines).encode('utf-8')
+                out.write(prefix)
+                written = len(prefix)
+                for key in order:
+                    offset, remaining, _, _ = self.blocks[key]
+                    out.write(b'\n')
+                    body.seek(offset)
+                    while remaining > 0:
+                        chunk = body.read(min(remaining, self.COPY_CHUNK_SIZE))
+                        if not chunk:
+                            break
+                        out.write(chunk)
+                        remaining -= len(chunk)
+                    written += 1 + self.blocks[key][1]
+            os.replace(temp_path, output_path)
+            self.bytes_written += written
+            return written
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    
+    def read_blocks(self, order):
+        """Yield (key, bytes) of the given blocks, in order; blocks can still be added afterwards."""
+        self._body.flush()
+        with open(self.body_path, 'rb') as body:
+            for key in order:
+                offset, length, _, _ = self.blocks[key]
+                body.seek(offset)
+                yield key, body.read(length)
+    
+    def discard(self):
+        """Drop everything written so far."""
+        self._body.close()
+        if os.path.exists(self.body_path):
+            os.remove(self.body_path)
+
+
+def render_file_block(rel_path, content=None, error=None):
+    """Lines of one file's block in the output."""
+    lines = ["/" * 60, f"// FILE: {rel_path}", ""]
+    if error is None:
+        lines.extend(content.split('\n'))
+    else:
+        lines.append(f"// ERROR: Could not read file. {error}")
+    lines.append("")
+    return lines
+
+
+def layout_output(writer, files, profile, header_lines):
+    """Lines before the first block (header, TOC, separator) and each block's location.
+    
+    Returns (prefix_lines, {rel_path: location}) for an output holding the
+    given files' blocks in order.
+    """
+    separator_lines = ["=" * 80, "FILES", "=" * 80, ""]
+    order = [file_info['rel_path'] for file_info in files]
+    
+    # Lay out the TOC with exact line numbers. The number of TOC lines does not
+    # depend on the line numbers it lists, so a dry run gives the prefix length.
+    toc_lines = []
+    if profile.get("include_toc", True):
+        toc_lines = '\n'.join(create_table_of_contents(files, {}, profile)).split('\n') + [""]
+    prefix_line_count = len(header_lines) + len(toc_lines) + len(separator_lines)
+    block_locations = writer.layout(order, prefix_line_count)
+    
+    # TOC entries point at each file's "// FILE:" line
+    file_locations = {key: {'line_num': loc['line_num'] + 1} for key, loc in block_locations.items()}
+    if toc_lines:
+        toc_lines = '\n'.join(create_table_of_contents(files, file_locations, profile)).split('\n') + [""]
+    
+    # With the prefix final, lay out again to get byte offsets as well
+    prefix_lines = header_lines + toc_lines + separator_lines
+    block_locations = writer.layout(order, prefix_line_count, len('\n'.join(prefix_lines).encode('utf-8')))
+    return prefix_lines, block_locations
+
+
+def write_output_file(writer, output_path, files, profile, header_lines):
+    """Write header, TOC and the given files' blocks to output_path.
+    
+    Returns {rel_path: location} describing each block in the written file.
+    """
+    prefix_lines, block_locations = layout_output(writer, files, profile, header_lines)
+    writer.write_output(output_path, prefix_lines, [file_info['rel_path'] for file_info in files])
+    return block_locations
+
+
+def plan_parts(files, file_costs, budgets, overhead):
+    """Greedily pack files (in order) into parts that stay within every budget.
+    
+    file_costs maps rel_path to a tuple of costs, one per budget; overhead is
+    the per-part cost of the header and separators. Files are never split, so
+    a single file larger than the budget gets a part of its own.
+    """
+    parts = [[]]
+    used = list(overhead)
+    for file_info in files:
+        costs = file_costs[file_info['rel_path']]
+        fits = all(u + c <= b for u, c, b in zip(used, costs, budgets))
+        if parts[-1] and not fits:
+            parts.append([])
+            used = list(overhead)
+        parts[-1].append(file_info)
+        used = [u + c for u, c in zip(used, costs)]
+    return parts
+
+
+def write_part_index(index_path, base_filename, parts):
+    """Write the index that maps every class to the part file containing it.
+    
+    parts is a list of (part_filename, files, block_locations, char_count).
+    """
+    lines = [
+        f"PART INDEX: {base_filename} ({len(parts)} parts)",
+        "",
+        "PARTS:"
+    ]
+    entries = []
+    for part_filename, files, locations, char_count in parts:
+        lines.append(f"  {part_filename}  ({len(files)} files, {char_count:,} chars)")
+        for file_info in files:
+            entries.append((file_info['main_class'].lower(), file_info['main_class'], part_filename,
+                            locations[file_info['rel_path']]['line_num'] + 1, file_info['rel_path']))
+    lines += ["", "CLASS -> PART:"]
+    for _, main_class, part_filename, line_num, rel_path in sorted(entries):
+        lines.append(f"  {main_class} -> {part_filename} L{line_num} ({rel_path})")
+    write_file_atomic(index_path, ('\n'.join(lines) + '\n').encode('utf-8'))
+
+
+# Structured outputs (profile "output_format") for tools rather than LLMs
+OUTPUT_EXTENSIONS = {'txt': '.txt', 'jsonl': '.jsonl', 'packed': '.pack'}
+STRUCTURED_FORMAT_VERSION = 1
+
+PACKED_MAGIC = b'UXPK'
+_PACKED_HEADER = struct.Struct('<4sHHIIQ')  # magic, version, flags, record count, header length, table offset
+_PACKED_TABLE_ENTRY = struct.Struct('<QII')  # record offset, metadata length, content length
+_PACKED_LENGTH = struct.Struct('<I')
+
+
+def structured_header(profile_name, profile, project_name, stats, usings, tokenizer_name, file_count):
+    """Run-level metadata written first by the jsonl and packed formats."""
+    return {
+        'type': 'header',
+        'format_version': STRUCTURED_FORMAT_VERSION,
+        'profile': profile_name,
+        'description': profile.get('description', ''),
+        'project': project_name,
+        'generated': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'tokenizer': tokenizer_name,
+        'stats': stats,
+        'usings': sorted(usings),
+        'files': file_count
+    }
+
+
+def structured_record(file_info, file_stat=None, error=None):
+    """Per-file metadata of the jsonl and packed formats (everything but the content)."""
+    original_size, compressed_size, _, _, tokens = file_stat or (0, 0, None, None, None)
+    return {
+        'type': 'file',
+        'path': file_info['rel_path'].replace(os.sep, '/'),
+        'extension': file_info.get('extension', ''),
+        'namespace': file_info.get('namespace'),
+        'main_class': file_info.get('main_class'),
+        'original_size': original_size,
+        'compressed_size': compressed_size,
+        'tokens': tokens,
+        'error': error
+    }
+
+
+def write_jsonl_output(writer, output_path, header, files, records):
+    """Write the header and one {..., "content"} line per file; returns bytes written.
+    
+    records maps rel_path to a structured_record(); contents come from the
+    writer's blocks (the bare file content for structured formats).
+    """
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    written = 0
+    try:
+        with open(temp_path, 'wb') as out:
+            def emit(record):
+                nonlocal written
+                line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+                out.write(line)
+                written += len(line)
+            
+            emit(header)
+            for key, content in writer.read_blocks([f['rel_path'] for f in files]):
+                emit(dict(records[key], content=content.decode('utf-8')))
+        os.replace(temp_path, output_path)
+        return written
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def write_packed_output(writer, output_path, header, files, records):
+    """Write a packed container; returns bytes written.
+    
+    Layout (little-endian): a fixed header (magic "UXPK", version, flags,
+    record count, header JSON length, offset table position), the header
+    JSON, then per file a u32-length-prefixed metadata JSON followed by a
+    u32-length-prefixed UTF-8 content, and finally the offset table with
+    (record offset, metadata length, content length) per file.
+    """
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    header_data = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    table = []
+    try:
+        with open(temp_path, 'wb') as out:
+            out.write(_PACKED_HEADER.pack(PACKED_MAGIC, STRUCTURED_FORMAT_VERSION, 0, len(files),
+                                          len(header_data), 0))
+            out.write(header_data)
+            offset = _PACKED_HEADER.size + len(header_data)
+            for key, content in writer.read_blocks([f['rel_path'] for f in files]):
+                meta = json.dumps(records[key], ensure_ascii=False).encode('utf-8')
+                out.write(_PACKED_LENGTH.pack(len(meta)) + meta + _PACKED_LENGTH.pack(len(content)))
+                out.write(content)
+                table.append(_PACKED_TABLE_ENTRY.pack(offset, len(meta), len(content)))
+                offset += 2 * _PACKED_LENGTH.size + len(meta) + len(content)
+            out.write(b''.join(table))
+            # The table position is only known now
+            out.seek(0)
+            out.write(_PACKED_HEADER.pack(PACKED_MAGIC, STRUCTURED_FORMAT_VERSION, 0, len(files),
+                                          len(header_data), offset))
+        os.replace(temp_path, output_path)
+        return offset + len(table) * _PACKED_TABLE_ENTRY.size
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class PackedOutputReader:
+    """Random access to a packed output through mmap.
+    
+    reader.header is the run metadata; len(reader), reader[i] and iteration
+    give {metadata..., 'content'} dicts; metadata(i) and content(i) read one
+    half of a record without decoding the other; find(path) looks up a file.
+    
+        with PackedOutputReader("Unity_EXTRACTED_scripts.pack") as reader:
+            print(reader.find("Assets/Scripts/PlantSystem/Growth/PlantGrowth.cs")['content'])
+    """
+    
+    def __init__(self, path):
+        import mmap
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.count, header_length, self._table = _PACKED_HEADER.unpack_from(self._map, 0)
+        if magic != PACKED_MAGIC or version != STRUCTURED_FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {STRUCTURED_FORMAT_VERSION} packed output")
+        self.header = json.loads(self._map[_PACKED_HEADER.size:_PACKED_HEADER.size + header_length])
+        self._paths = None
+    
+    def _entry(self, i):
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return _PACKED_TABLE_ENTRY.unpack_from(self._map, self._table + i * _PACKED_TABLE_ENTRY.size)
+    
+    def metadata(self, i):
+        offset, meta_length, _ = self._entry(i)
+        start = offset + _PACKED_LENGTH.size
+        return json.loads(self._map[start:start + meta_length])
+    
+    def content(self, i):
+        offset, meta_length, content_length = self._entry(i)
+        start = offset + 2 * _PACKED_LENGTH.size + meta_length
+        return self._map[start:start + content_length].decode('utf-8')
+    
+    def __len__(self):
+        return self.count
+    
+    def __getitem__(self, i):
+        return dict(self.metadata(i), content=self.content(i))
+    
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+    
+    def find(self, path):
+        """The record for a project-relative path, or None."""
+        if self._paths is None:
+            self._paths = {self.metadata(i)['path']: i for i in range(self.count)}
+        i = self._paths.get(path.replace(os.sep, '/'))
+        return None if i is None else self[i]
+    
+    def close(self):
+        self._map.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+def build_header_lines(profile, project_name, compression_settings, stats, usings, tokenizer_name,
+                       part_label=None, packing_note=None):
+    """Format the profile's header text (plus usings and legend) into lines.
+    
+    stats is a calculate_compression_stats() result for the files covered;
+    packing_note describes how the files were packed into a context budget.
+    """
+    compression_enabled = compression_settings.get("enabled", False)
+    
+    header_text = profile.get("header_text", "Extracted files\n")
+    try:
+        header_text = header_text.format(
+            project_name=project_name,
+            extraction_date=datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            original_size=stats['original'],
+            compressed_size=stats['compressed'],
+            saved_percent=stats['percentage'],
+            original_tokens=stats['original_tokens'],
+            compressed_tokens=stats['compressed_tokens'],
+            tokens_saved=stats['tokens_saved'],
+            tokenizer=tokenizer_name
+        )
+    except KeyError:
+        pass  # Some placeholders may not be in all headers
+    
+    if part_label:
+        header_text = f"{part_label}\n\n{header_text}"
+    
+    # Extra sections go above a trailing "TABLE OF CONTENTS:" heading
+    toc_heading = ""
+    if header_text.rstrip().endswith(TOC_HEADING):
+        header_text = header_text.rstrip()[:-len(TOC_HEADING)].rstrip('\n')
+        toc_heading = f"\n\n{TOC_HEADING}"
+    
+    # Add discovered usings to header if compression is enabled
+    if compression_enabled and usings:
+        usings_section = "\n\nProject-specific using statements (add these when needed):\n"
+        for using in sorted(usings):
+            usings_section += f"{using}\n"
+        header_text += usings_section
+    
+    # Add modifier legend if shortening is enabled
+    if compression_enabled and compression_settings.get("shorten_modifiers", True):
+        legend_lines = get_modifier_rewriter(compression_settings).legend()
+        header_text += "\n\nMODIFIER LEGEND:\n" + "\n".join(legend_lines) + "\n"
+    
+    if compression_enabled and compression_settings.get("skeleton", False):
+        header_text += ("\nSKELETON MODE: method and accessor bodies are replaced with { /* N lines */ };"
+                        " request full files by path when the implementation matters.\n")
+    
+    if packing_note:
+        header_text += f"\n{packing_note}\n"
+    
+    header_text = header_text.rstrip('\n') + toc_heading if toc_heading else header_text
+    return header_text.split('\n')
+
+
+# =============================================================================
+# SYMBOL INDEX
+# =============================================================================
+
+SYMBOL_INDEX_VERSION = 1
+
+_CS_SYMBOL_DELIMITER_RE = re.compile(r'[{};]')
+_CS_TYPE_DECL_RE = re.compile(r'\b(class|struct|interface|enum|record)\s+(\w+)')
+_CS_NAMESPACE_DECL_RE = re.compile(r'^namespace\b')
+_CS_LEADING_ATTRIBUTES_RE = re.compile(r'^(?:\[[^\[\]]*(?:\[[^\[\]]*\][^\[\]]*)*\]\s*)+')
+_CS_METHOD_SIGNATURE_RE = re.compile(
+    r'^(?P<prefix>(?:(?:\([^()]*\)|[\w<>\[\],.?])+\s+)*)(?P<name>\w+)\s*(?:<[^()]*>)?\s*\([^;{}]*\)\s*'
+    r'(?:where\s[^;{}]*|:\s*(?:base|this)\s*\([^;{}]*\)\s*)?$')
+_CS_NOT_METHOD_NAMES = {
+    'if', 'for', 'foreach', 'while', 'switch', 'catch', 'using', 'lock', 'fixed', 'return',
+    'nameof', 'typeof', 'sizeof', 'default', 'checked', 'unchecked', 'base', 'this', 'new', 'when'
+}
+_CS_TYPE_SCOPES = ('class', 'struct', 'interface', 'record')
+SYMBOL_KINDS = _CS_TYPE_SCOPES + ('enum', 'method')
+
+
+def _mask_csharp(content):
+    """content with comments, literals and a BOM blanked out, offsets unchanged."""
+    if content.startswith('\ufeff'):
+        content = ' ' + content[1:]
+    masked_lines = []
+    state = None
+    for line in content.split('\n'):
+        if state is None and not _CS_NEEDS_LEX_RE.search(line):
+            masked_lines.append(line)
+            continue
+        pieces, _, _, _, _, state = _lex_csharp_line(line, state, False, False)
+        masked_lines.append(''.join(text if kind == _CODE else ' ' * len(text) for text, kind in pieces))
+    return '\n'.join(masked_lines)
+
+
+def _classify_declaration(header, scope, type_names):
+    """(kind, name, offset) if a header opens a type or method, else None.
+    
+    offset is where the declaration (including leading attributes) starts
+    within the header; preprocessor lines before it are skipped.
+    """
+    offset = 0
+    text_lines = []
+    for line in header.split('\n'):
+        stripped = line.strip()
+        if not text_lines and (not stripped or stripped.startswith('#')):
+            offset += len(line) + 1
+            continue
+        if not stripped.startswith('#'):
+            text_lines.append(stripped)
+    text = ' '.join(' '.join(text_lines).split())
+    if not text:
+        return None
+    
+    declaration = _CS_LEADING_ATTRIBUTES_RE.sub('', text)
+    if _CS_NAMESPACE_DECL_RE.match(declaration):
+        return 'namespace', None, offset
+    if scope in _CS_TYPE_SCOPES or scope == 'namespace':
+        type_match = _CS_TYPE_DECL_RE.search(declaration.split(' where ')[0])
+        if type_match and '(' not in declaration[:type_match.start()]:
+            return type_match.group(1), type_match.group(2), offset
+    if scope in _CS_TYPE_SCOPES:
+        method_match = _CS_METHOD_SIGNATURE_RE.match(declaration)
+        if method_match:
+            name = method_match.group('name')
+            if name not in _CS_NOT_METHOD_NAMES and (method_match.group('prefix') or name in type_names):
+                return 'method', name, offset
+    return None
+
+
+def find_csharp_symbols(content):
+    """Types and methods declared in C# source.
+    
+    Returns [(name, kind, container, start, end)] with character offsets:
+    start is the beginning of the declaration's first line (attributes
+    included), end is just past its closing brace, or past the ';' of an
+    expression-bodied method. container is the enclosing type's name.
+    Comments and literals are masked first, so braces inside them don't count.
+    """
+    masked = _mask_csharp(content)
+    type_names = {m.group(2) for m in _CS_TYPE_DECL_RE.finditer(masked)}
+    symbols = []
+    stack = []  # one (kind, name, start) per open brace; kind None for plain blocks
+    header_start = 0
+    
+    for match in _CS_SYMBOL_DELIMITER_RE.finditer(masked):
+        pos = match.start()
+        delimiter = match.group()
+        if delimiter == '}':
+            if stack:
+                kind, name, start = stack.pop()
+                if kind in SYMBOL_KINDS:
+                    container = next((n for k, n, _ in reversed(stack) if k in _CS_TYPE_SCOPES), None)
+                    symbols.append((name, kind, container, start, pos + 1))
+            header_start = pos + 1
+            continue
+        
+        scope = stack[-1][0] if stack else 'namespace'
+        header = masked[header_start:pos]
+        if delimiter == '{':
+            declaration = None
+            if scope in _CS_TYPE_SCOPES or scope == 'namespace':
+                declaration = _classify_declaration(header, scope, type_names)
+            if declaration:
+                kind, name, offset = declaration
+                start = masked.rfind('\n', 0, header_start + offset) + 1
+                stack.append((kind, name, start))
+            else:
+                stack.append((None, None, pos))
+        elif scope in _CS_TYPE_SCOPES and '=>' in header:
+            # Expression-bodied method: "int Area() => w * h;"
+            declaration = _classify_declaration(header[:header.index('=>')], scope, type_names)
+            if declaration and declaration[0] == 'method':
+                _, name, offset = declaration
+                start = masked.rfind('\n', 0, header_start + offset) + 1
+                container = next((n for k, n, _ in reversed(stack) if k in _CS_TYPE_SCOPES), None)
+                symbols.append((name, 'method', container, start, pos + 1))
+        header_start = pos + 1
+    
+    symbols.sort(key=lambda symbol: symbol[3])
+    return symbols
+
+
+def index_csharp_symbols(content):
+    """find_csharp_symbols() as [name, kind, container, byte offset, byte length, line offset].
+    
+    Offsets are relative to the start of content, so they can be cached with
+    the compressed file and placed into any output later.
+    """
+    ascii_only = content.isascii()
+    indexed = []
+    for name, kind, container, start, end in find_csharp_symbols(content):
+        if ascii_only:
+            byte_start, byte_length = start, end - start
+        else:
+            byte_start = len(content[:start].encode('utf-8'))
+            byte_length = len(content[start:end].encode('utf-8'))
+        indexed.append([name, kind, container, byte_start, byte_length, content.count('\n', 0, start)])
+    return indexed
+
+
+def symbol_index_path(output_path):
+    """Sidecar index written next to an output file."""
+    return f"{os.path.splitext(output_path)[0]}.index.json"
+
+
+def write_symbol_index(output_path, files, block_locations, file_symbols):
+    """Write the byte-offset index for one output file.
+    
+    Every file block and every symbol gets its offset, length and line in the
+    output, so --get can slice it out without parsing. file_symbols maps
+    rel_path to index_csharp_symbols() results for the written content.
+    """
+    index_files = {}
+    index_symbols = []
+    for file_info in files:
+        rel_path = file_info['rel_path']
+        location = block_locations[rel_path]
+        index_files[rel_path] = [location['offset'], location['length'], location['line_num'] + 1]
+        # The block starts with the marker line, the "// FILE:" line and a blank line
+        content_offset = location['offset'] + len(f"{'/' * 60}\n// FILE: {rel_path}\n\n".encode('utf-8'))
+        content_line = location['line_num'] + 3
+        for name, kind, container, offset, length, line in file_symbols.get(rel_path) or ():
+            index_symbols.append([name, kind, container, content_offset + offset, length,
+                                  content_line + line, rel_path])
+    
+    index = {
+        'version': SYMBOL_INDEX_VERSION,
+        'output': os.path.basename(output_path),
+        'files': index_files,
+        'symbols': index_symbols
+    }
+    write_file_atomic(symbol_index_path(output_path),
+                      json.dumps(index, separators=(',', ':')).encode('utf-8'))
+
+
+def _load_symbol_indexes(project_path):
+    indexes = []
+    for index_path in sorted(glob.glob(os.path.join(project_path, "*.index.json"))):
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if index.get('version') == SYMBOL_INDEX_VERSION:
+            indexes.append(index)
+    return indexes
+
+
+def find_indexed_block(project_path, query):
+    """Locate a file or symbol in the outputs' sidecar indexes.
+    
+    query is a project-relative path (or a path suffix such as
+    "PlantSystem/PlantGrowth.cs"), a type or method name, or Type.Method.
+    Returns a list of (output_filename, offset, length, description), best
+    match first: paths, then types, then methods.
+    """
+    wanted = query.replace('\\', '/').strip('/').lower()
+    container, _, member = query.rpartition('.') if '.' in query and '/' not in wanted else ('', '', query)
+    path_hits, type_hits, method_hits = [], [], []
+    for index in _load_symbol_indexes(project_path):
+        output = index['output']
+        for rel_path, (offset, length, line) in index['files'].items():
+            normalized = rel_path.replace('\\', '/').lower()
+            if normalized == wanted or normalized.endswith('/' + wanted):
+                path_hits.append((output, offset, length, f"{rel_path} ({output} L{line})"))
+        for name, kind, owner, offset, length, line, rel_path in index['symbols']:
+            if container:
+                if name != member or owner != container.rpartition('.')[2]:
+                    continue
+            elif name != query:
+                continue
+            label = f"{kind} {owner + '.' if owner else ''}{name} in {rel_path} ({output} L{line})"
+            (method_hits if kind == 'method' else type_hits).append((output, offset, length, label))
+    return path_hits + type_hits + method_hits
+
+
+def read_indexed_block(project_path, output_filename, offset, length):
+    """Bytes of one block, sliced from the memory-mapped output file."""
+    import mmap
+    with open(os.path.join(project_path, output_filename), 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return mapped[offset:offset + length]
+
+
+def get_block(project_path, query):
+    """--get: print one file or symbol block from the latest extraction output."""
+    matches = find_indexed_block(project_path, query)
+    if not matches:
+        print(f"✗ '{query}' not found in any extraction index (*.index.json). Run an extraction first.",
+              file=sys.stderr)
+        return False
+    output_filename, offset, length, label = matches[0]
+    try:
+        data = read_indexed_block(project_path, output_filename, offset, length)
+    except (OSError, ValueError) as e:
+        print(f"✗ Could not read {output_filename}: {e}", file=sys.stderr)
+        return False
+    print(f"// {label}", file=sys.stderr)
+    for _, _, _, other in matches[1:]:
+        print(f"//   also: {other}", file=sys.stderr)
+    sys.stdout.flush()
+    sys.stdout.buffer.write(data if data.endswith(b'\n') else data + b'\n')
+    sys.stdout.flush()
+    return True
+
+
+# =============================================================================
+# METRICS
+# =============================================================================
+
+METRICS_TOP_FILES = 10  # Files listed per ranking in --timings / --metrics-json
+
+
+class StageTimer:
+    """Wall and CPU time per stage, plus byte counters and per-file costs.
+    
+    Stages are recorded as laps: lap(name) charges the time since the
+    previous lap (or creation) to name, so a function is instrumented by
+    calling lap() at the end of each stage. CPU time comes from clock:
+    time.thread_time for a profile (profiles may run on their own threads),
+    time.process_time for the whole run. Time spent in worker processes is
+    only visible through the per-file seconds.
+    """
+    
+    enabled = True
+    
+    def __init__(self, cpu_clock=time.thread_time):
+        self.cpu_clock = cpu_clock
+        self.stages = {}  # name -> [wall seconds, CPU seconds]
+        self.counters = {}
+        self.files = []  # (rel_path, seconds or None, original size, compressed size)
+        self._wall_start = self._wall = time.perf_counter()
+        self._cpu_start = self._cpu = cpu_clock()
+    
+    def lap(self, stage):
+        wall, cpu = time.perf_counter(), self.cpu_clock()
+        totals = self.stages.setdefault(stage, [0.0, 0.0])
+        totals[0] += wall - self._wall
+        totals[1] += cpu - self._cpu
+        self._wall, self._cpu = wall, cpu
+    
+    def add(self, counter, amount):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+    
+    def file(self, rel_path, seconds, original_size, compressed_size):
+        self.files.append((rel_path, seconds, original_size, compressed_size))
+    
+    def summary(self):
+        return {
+            'wall': round(self._wall - self._wall_start, 6),
+            'cpu': round(self._cpu - self._cpu_start, 6),
+            'stages': {name: {'wall': round(wall, 6), 'cpu': round(cpu, 6)}
+                       for name, (wall, cpu) in self.stages.items()},
+            **self.counters
+        }
+
+
+class NullTimer:
+    """Stand-in for StageTimer when timings are off; every call is a no-op."""
+    
+    enabled = False
+    
+    def lap(self, stage):
+        pass
+    
+    def add(self, counter, amount):
+        pass
+    
+    def file(self, rel_path, seconds, original_size, compressed_size):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class RunMetrics:
+    """Timers for one run: run-level stages plus one StageTimer per profile."""
+    
+    def __init__(self):
+        self.run = StageTimer(time.process_time)
+        self.profiles = {}
+    
+    def profile(self, profile_name):
+        timer = self.profiles[profile_name] = StageTimer()
+        return timer
+    
+    def report(self, top=METRICS_TOP_FILES):
+        """Everything collected, as a JSON-ready dict."""
+        files = [(name, *entry) for name, timer in self.profiles.items() for entry in timer.files]
+        timed = [entry for entry in files if entry[2] is not None]
+        return {
+            'total': {'wall': round(self.run._wall - self.run._wall_start, 6),
+                      'cpu': round(self.run._cpu - self.run._cpu_start, 6)},
+            'stages': self.run.summary()['stages'],
+            'profiles': {name: timer.summary() for name, timer in self.profiles.items()},
+            'slowest_files': [
+                {'profile': name, 'path': rel_path, 'seconds': round(seconds, 6),
+                 'original_size': original_size, 'compressed_size': compressed_size}
+                for name, rel_path, seconds, original_size, compressed_size
+                in sorted(timed, key=lambda entry: -entry[2])[:top]],
+            'largest_files': [
+                {'profile': name, 'path': rel_path, 'original_size': original_size,
+                 'compressed_size': compressed_size}
+                for name, rel_path, _, original_size, compressed_size
+                in sorted(files, key=lambda entry: -entry[4])[:top]]
+        }
+
+
+def print_timings(report):
+    """Console version of a RunMetrics report."""
+    def stage_lines(stages):
+        for name, times in stages.items():
+            print(f"      {name:<12} {times['wall']:>8.3f}s wall {times['cpu']:>8.3f}s CPU")
+    
+    print(f"\n⏱ Timings: {report['total']['wall']:.3f}s wall, {report['total']['cpu']:.3f}s CPU")
+    print("   Run:")
+    stage_lines(report['stages'])
+    for profile_name, profile in report['profiles'].items():
+        print(f"   Profile {profile_name}: {profile['wall']:.3f}s wall, {profile['cpu']:.3f}s CPU, "
+              f"read {format_size(profile.get('bytes_read', 0))}, "
+              f"wrote {format_size(profile.get('bytes_written', 0))}")
+        stage_lines(profile['stages'])
+    if report['slowest_files']:
+        print("   Slowest files to process:")
+        for entry in report['slowest_files']:
+            print(f"      {entry['seconds'] * 1000:>8.1f}ms  {entry['path']} ({entry['profile']})")
+    if report['largest_files']:
+        print("   Largest compressed files:")
+        for entry in report['largest_files']:
+            print(f"      {format_size(entry['compressed_size']):>8}  {entry['path']} ({entry['profile']})")
+
+
+def write_metrics_json(path, report):
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"✓ Metrics saved to: {path}")
+    except OSError as e:
+        print(f"⚠ Warning: Could not write metrics file. {e}")
+
+
+# =============================================================================
+# EXTRACTION
+# =============================================================================
+
+MIN_TASKS_PER_WORKER = 4
+MMAP_MIN_SIZE = 1 << 20
+
+
+def read_source(file_path, mmap_min_size=MMAP_MIN_SIZE):
+    """Load a source file with one read and one decode.
+    
+    Files of at least mmap_min_size bytes (0 disables) are memory-mapped and
+    decoded straight from the mapping. Line endings are normalized to '\\n'
+    like text-mode reads.
+    """
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if mmap_min_size and size >= mmap_min_size:
+            import mmap
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                text = str(mapped, 'utf-8')
+        else:
+            text = f.read().decode('utf-8')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+# Up to the last line break followed by a non-space character (a pre-token boundary)
+_TOKEN_BOUNDARY_RE = re.compile(r'.*\n(?=\S)', re.DOTALL)
+
+
+class SourceLineStream:
+    """Iterates a source file's lines without loading the whole file.
+    
+    The streaming counterpart of read_source: line endings are normalized the
+    same way, and while the lines go by the stream measures the text (size,
+    SHA-1 and, given tokenizer_settings, a token count) so the result matches
+    what process_file reports for files it reads in one go.
+    
+    Tokens are counted per chunk, cut after the last line break followed by
+    a non-space character; the rest is carried into the next chunk. Pieces
+    of BPE_PRETOKENIZE_PATTERN never span such a break, so such cuts don't
+    change the count. Text without one (e.g. the indented body of a
+    single-document asset) is carried for at most CHUNK_CHARS and then cut
+    at the last line break, which can shift the count by a token or so per
+    cut; a custom pre-tokenizer pattern makes the count approximate too.
+    """
+    
+    CHUNK_CHARS = 1 << 20
+    
+    def __init__(self, file_path, tokenizer_settings=None):
+        self.file_path = file_path
+        self.size = 0
+        self.tokens = 0 if tokenizer_settings else None
+        self._tokenizer = get_tokenizer(tokenizer_settings) if tokenizer_settings else None
+        self._sha1 = hashlib.sha1()
+        self._uncounted = ''
+    
+    def _token_boundary(self, text, start):
+        """Index just past the last line break followed by a non-space character, or 0.
+        
+        Only text[start:] is searched; past CHUNK_CHARS any last line break will do.
+        """
+        match = _TOKEN_BOUNDARY_RE.match(text, start)
+        if match:
+            return match.end()
+        if len(text) > self.CHUNK_CHARS:
+            return text.rfind('\n') + 1
+        return 0
+    
+    def __iter__(self):
+        remainder = ''
+        with open(self.file_path, 'r', encoding='utf-8', newline=None) as f:
+            while True:
+                chunk = f.read(self.CHUNK_CHARS)
+                if not chunk:
+                    break
+                self.size += len(chunk)
+                self._sha1.update(chunk.encode('utf-8'))
+                if self._tokenizer:
+                    text = self._uncounted + chunk
+                    cut = self._token_boundary(text, max(0, len(self._uncounted) - 1))
+                    self.tokens += self._tokenizer.count(text[:cut])
+                    self._uncounted = text[cut:]
+                lines = (remainder + chunk).split('\n')
+                remainder = lines.pop()
+                yield from lines
+        if self._tokenizer and self._uncounted:
+            self.tokens += self._tokenizer.count(self._uncounted)
+            self._uncounted = ''
+        if remainder:
+            yield remainder
+    
+    def hexdigest(self):
+        return self._sha1.hexdigest()
+
+
+def find_usings(content, common_usings, max_lines=50):
+    """Non-common using statements in the first max_lines lines."""
+    usings = set()
+    for line in content.split('\n', max_lines)[:max_lines]:
+        stripped = line.strip()
+        if stripped.startswith('using ') and stripped.endswith(';'):
+            if stripped not in common_usings:
+                usings.add(stripped)
+    return usings
+
+
+def process_file(file_path, file_ext, compression_settings, tokenizer_settings=None, mmap_min_size=MMAP_MIN_SIZE,
+                 find_symbols=False, measure=False, find_references=False):
+    """Read and compress a single file.
+    
+    Kept at module level so it can run in worker processes. The file is read
+    once; metadata, usings, compression and token counts all work from that
+    buffer, except Unity YAML files, which are streamed through
+    compress_unity_yaml when compression is on. Returns a dict with original_size, content, usings, metadata,
+    error and source_hash (SHA-1 of the original text); original_tokens is
+    filled in when tokenizer_settings are given, symbols (see
+    index_csharp_symbols) for C# files when find_symbols is set, references
+    (see csharp_identifier_lines) for C# files when find_references is set,
+    and seconds (time spent on the file) when measure is set.
+    """
+    start = time.perf_counter() if measure else None
+    compression_enabled = compression_settings.get("enabled", False)
+    stream = None
+    try:
+        if compression_enabled and file_ext in UNITY_YAML_EXTENSIONS:
+            # Scenes and data assets run to many megabytes: compress them as
+            # they are read instead of loading them whole
+            stream = SourceLineStream(file_path, tokenizer_settings)
+            processed_content = compress_unity_yaml(stream, compression_settings)
+            original_content = ''
+        else:
+            original_content = read_source(file_path, mmap_min_size)
+    except Exception as e:
+        return {'original_size': 0, 'content': '', 'usings': [], 'error': str(e),
+                'metadata': detect_file_metadata('', file_path, file_ext),
+                'source_hash': None, 'original_tokens': None, 'symbols': None, 'references': None,
+                'seconds': time.perf_counter() - start if measure else None}
+    
+    metadata = detect_file_metadata(original_content, file_path, file_ext)
+    
+    # Track non-common usings in C# files
+    usings = set()
+    if file_ext == '.cs' and compression_enabled:
+        usings = find_usings(original_content, set(compression_settings.get("common_usings", [])))
+    
+    original_tokens = None
+    if stream is not None:
+        original_size, source_hash, original_tokens = stream.size, stream.hexdigest(), stream.tokens
+    else:
+        # Apply compression based on file type
+        if compression_enabled:
+            processed_content = compress_content(original_content, compression_settings, file_ext, file_path)
+        else:
+            processed_content = original_content
+        if tokenizer_settings:
+            original_tokens = get_tokenizer(tokenizer_settings).count(original_content)
+        original_size = len(original_content)
+        source_hash = hashlib.sha1(original_content.encode('utf-8')).hexdigest()
+    
+    result = {
+        'original_size': original_size,
+        'content': processed_content,
+        'usings': sorted(usings),
+        'metadata': metadata,
+        'error': None,
+        'source_hash': source_hash,
+        'original_tokens': original_tokens,
+        'symbols': index_csharp_symbols(processed_content) if find_symbols and file_ext == '.cs' else None,
+        'references': csharp_identifier_lines(original_content) if find_references and file_ext == '.cs' else None
+    }
+    if measure:
+        result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def _process_file_task(task):
+    return process_file(*task)
+
+
+def process_files(tasks, workers=1, executor=None, log=print):
+    """Run process_file over tuples of its arguments, yielding results in order.
+    
+    With more than one worker the tasks are sent to a process pool in chunks
+    (the given executor, or a pool started for this batch); results come back
+    in submission order, so output matches a serial run.
+    """
+    # Small batches are not worth the pool start-up cost
+    workers = min(workers, len(tasks) // MIN_TASKS_PER_WORKER)
+    if workers > 1:
+        chunksize = max(1, len(tasks) // (workers * 4))
+        if executor is not None:
+            yield from executor.map(_process_file_task, tasks, chunksize=chunksize)
+            return
+        executor = create_process_pool(workers, log)
+        if executor is not None:
+            with executor:
+                yield from executor.map(_process_file_task, tasks, chunksize=chunksize)
+            return
+    for task in tasks:
+        yield process_file(*task)
+
+
+def create_process_pool(workers, log=print):
+    """A process pool with the given number of workers, or None if unavailable."""
+    from concurrent.futures import ProcessPoolExecutor
+    try:
+        return ProcessPoolExecutor(max_workers=workers)
+    except (OSError, RuntimeError, NotImplementedError) as e:
+        log(f"  ⚠ Worker pool unavailable ({e}), processing serially")
+        return None
+
+
+def resolve_workers(global_settings, jobs=None):
+    """Number of worker processes: --jobs overrides global.workers, 0 means all cores."""
+    workers = global_settings.get("workers", 1) if jobs is None else jobs
+    try:
+        workers = int(workers)
+    except (TypeError, ValueError):
+        workers = 1
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def extract_profile(project_path, profile_name, profile, global_settings, use_cache=True, workers=1,
+                    token_cache=None, file_index=None, executor=None, log=print, only_files=None, metrics=None,
+                    guid_index=None, xref=None, relevance=None):
+    """Extract files for a single profile.
+    
+    Shared run state is optional: token_cache is a TokenCountCache (without
+    one, tokens are counted with global.tokenizer and nothing is persisted),
+    file_index the run's FileIndex (built for this profile if None) and
+    executor a process pool used instead of starting one. Console output goes
+    through log, so concurrent profiles can buffer it. only_files restricts
+    the run to a set of rel_paths (e.g. a --seed closure); metrics is the
+    run's RunMetrics when timings are collected. guid_index, a GuidIndex,
+    resolves asset references in Unity YAML output; xref, a
+    CrossReferenceIndex, is updated with the identifiers of C# files.
+    relevance ({rel_path: score}, e.g. from a --query) raises the priority
+    of files when the profile is packed into a context budget.
+    """
+    # The timer is created here so CPU time is measured on this profile's thread
+    timer = metrics.profile(profile_name) if metrics else NULL_TIMER
+    
+    log(f"\n{'='*60}")
+    log(f"EXTRACTING: {profile_name.upper()}")
+    log(f"Description: {profile.get('description', 'No description')}")
+    log(f"{'='*60}")
+    
+    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    project_name = os.path.basename(project_path)
+    
+    # Clean previous files
+    if global_settings.get("clean_previous_files", True):
+        clean_previous_files(project_path, profile_name, profile, global_settings, timestamp, log)
+    timer.lap("clean")
+    
+    # Collect files
+    log(f"\nScanning directories: {', '.join(profile.get('directories', []))}")
+    log(f"Extensions: {', '.join(profile.get('include_extensions', []))}")
+    
+    # Compression settings
+    compression_settings = profile.get("compression", {"enabled": False})
+    compression_enabled = compression_settings.get("enabled", False)
+    
+    cache = open_cache(project_path, profile_name, compression_settings, global_settings) if use_cache else None
+    
+    tokenizer_settings = resolve_tokenizer_settings(global_settings, project_path)
+    if token_cache is None:
+        token_cache = TokenCountCache(get_tokenizer(tokenizer_settings))
+    exact_tokens = token_cache.tokenizer.exact
+    mmap_min_size = global_settings.get("mmap_min_size", MMAP_MIN_SIZE) or 0
+    write_index = global_settings.get("write_symbol_index", True)
+    
+    files = collect_files(project_path, profile, cache, file_index, log)
+    
+    if only_files is not None:
+        # Carry over cache entries of files left out, so a partial run doesn't evict them
+        if cache:
+            for file_info in files:
+                if file_info['rel_path'] not in only_files:
+                    entry = cache.get(file_info['rel_path'], file_info['size'], file_info['mtime_ns'])
+                    if entry:
+                        cache.keep(file_info['rel_path'], entry)
+        files = [file_info for file_info in files if file_info['rel_path'] in only_files]
+    timer.lap("collect")
+    
+    if not files:
+        log("\n⚠ No files found matching the criteria.")
+        log("  Check your settings file to ensure paths are correct.")
+        return None
+    
+    log(f"✓ Found {len(files)} files to extract")
+    
+    # Generate filename
+    output_format = profile.get("output_format", "txt")
+    if output_format not in OUTPUT_EXTENSIONS:
+        log(f"  ⚠ Unknown output_format '{output_format}', writing txt")
+        output_format = "txt"
+    structured = output_format != "txt"
+    write_index = write_index and not structured  # byte offsets only make sense for txt
+    extension = OUTPUT_EXTENSIONS[output_format]
+    base_filename = profile.get("output_filename", f"EXTRACTED_{profile_name}")
+    if global_settings.get("include_timestamp_in_filename", False):
+        output_filename = f"{base_filename}_{timestamp}{extension}"
+    else:
+        output_filename = f"{base_filename}{extension}"
+    output_path = os.path.join(project_path, output_filename)
+    
+    # File bodies are streamed to disk; header and TOC are laid out at the end
+    try:
+        writer = StreamingOutputWriter(output_path)
+    except OSError as e:
+        log(f"\n✗ Error: Could not write to output file. {e}")
+        return None
+    
+    # Process files
+    total_original_size = 0
+    total_compressed_size = 0
+    total_original_tokens = 0
+    total_compressed_tokens = 0
+    discovered_usings = set()  # Track non-common usings for header
+    
+    file_stats = {}  # rel_path -> (original size, compressed size, usings, original tokens, compressed tokens)
+    file_symbols = {}  # rel_path -> index_csharp_symbols() of the written content
+    file_errors = {}  # rel_path -> read error
+    
+    def add_result(file_info, result):
+        nonlocal total_original_size, total_compressed_size, total_original_tokens, total_compressed_tokens
+        processed_content = result['content']
+        content_object = result.get('object')
+        if guid_index is not None and file_info['extension'] in UNITY_YAML_EXTENSIONS:
+            # Resolved after the cache, so moving an asset doesn't invalidate its referrers
+            resolved_content = guid_index.resolve(processed_content)
+            if resolved_content != processed_content:
+                processed_content, content_object = resolved_content, None
+        if result['error'] is None:
+            discovered_usings.update(result['usings'])
+            total_original_size += result['original_size']
+            total_compressed_size += len(processed_content)
+            original_tokens = compressed_tokens = None
+            if exact_tokens:
+                original_tokens = result['original_tokens']
+                if original_tokens is None:
+                    original_tokens = count_source_tokens(file_info, result['source_hash'])
+                else:
+                    token_cache.add(result['source_hash'], original_tokens)
+                compressed_tokens = token_cache.count(processed_content, content_object)
+                file_info['tokens'] = compressed_tokens
+                total_original_tokens += original_tokens
+                total_compressed_tokens += compressed_tokens
+            file_stats[file_info['rel_path']] = (result['original_size'], len(processed_content), result['usings'],
+                                                 original_tokens, compressed_tokens)
+            if xref is not None and result.get('references') is not None:
+                xref.update(file_info['rel_path'], file_info['size'], file_info['mtime_ns'], result['references'])
+            if result.get('symbols'):
+                file_symbols[file_info['rel_path']] = result['symbols']
+        else:
+            file_errors[file_info['rel_path']] = result['error']
+        if structured:
+            # Structured formats store the bare content; metadata goes beside it
+            writer.add_block(file_info['rel_path'], [processed_content])
+        else:
+            writer.add_block(file_info['rel_path'],
+                             render_file_block(file_info['rel_path'], processed_content, result['error']))
+    
+    def count_source_tokens(file_info, source_hash):
+        # Cache hits only know the source hash; re-read the file if its count is unknown
+        count = token_cache.lookup(source_hash)
+        if count is None:
+            try:
+                count = token_cache.count(read_source(file_info['full_path'], mmap_min_size))
+            except (OSError, UnicodeDecodeError):
+                count = 0
+        return count
+    
+    try:
+        # Serve unchanged files from the cache, queue the rest for processing
+        pending = []
+        for file_info in files:
+            entry = cache.get(file_info['rel_path'], file_info['size'], file_info['mtime_ns']) if cache else None
+            cached_content = cache.read_content(entry) if entry else None
+            if cached_content is not None:
+                if write_index and entry.get('symbols') is None and file_info['extension'] == '.cs':
+                    entry = dict(entry, symbols=index_csharp_symbols(cached_content))
+                references = None
+                if xref is not None and file_info['extension'] == '.cs' and not xref.is_current(
+                        file_info['rel_path'], file_info['size'], file_info['mtime_ns']):
+                    references = entry.get('references')
+                    if references is None:
+                        # Entries cached before the index existed: scan the source once
+                        try:
+                            references = csharp_identifier_lines(read_source(file_info['full_path'], mmap_min_size))
+                        except (OSError, UnicodeDecodeError):
+                            references = {}
+                        entry = dict(entry, references=references)
+                cache.keep(file_info['rel_path'], entry)
+                cache.hits += 1
+                add_result(file_info, {'original_size': entry['original_size'], 'content': cached_content,
+                                       'usings': entry['usings'], 'error': None,
+                                       'source_hash': entry.get('source_hash'), 'original_tokens': None,
+                                       'symbols': entry.get('symbols') if write_index else None,
+                                       'references': references, 'object': entry['object']})
+                if timer.enabled:
+                    timer.add('bytes_read', len(cached_content.encode('utf-8')))
+                    timer.file(file_info['rel_path'], None, entry['original_size'], len(cached_content))
+            else:
+                pending.append(file_info)
+        timer.lap("cache")
+        
+        worker_tokenizer = tokenizer_settings if exact_tokens else None
+        tasks = [(f['full_path'], f.get('extension', ''), compression_settings, worker_tokenizer, mmap_min_size,
+                  write_index, timer.enabled, xref is not None) for f in pending]
+        if workers > 1 and len(tasks) >= 2 * MIN_TASKS_PER_WORKER:
+            log(f"✓ Processing {len(tasks)} files on up to {workers} workers")
+        for file_info, result in zip(pending, process_files(tasks, workers, executor, log)):
+            file_info.update(result['metadata'])
+            add_result(file_info, result)
+            if cache and result['error'] is None:
+                cache.put(file_info, result)
+                cache.misses += 1
+            if timer.enabled:
+                timer.add('bytes_read', file_info['size'])
+                timer.file(file_info['rel_path'], result['seconds'], result['original_size'],
+                           len(result['content']))
+        timer.lap("compress")
+    except OSError as e:
+        writer.discard()
+        log(f"\n✗ Error: Could not write to output file. {e}")
+        return None
+    
+    # Namespaces of re-processed files are only known now
+    files = sort_files(files)
     
+    if cache:
+        try:
+            cache.save()
+            log(f"✓ Cache: {cache.hits} unchanged, {cache.misses} re-processed")
+        except OSError as e:
+            log(f"⚠ Warning: Could not update extraction cache. {e}")
+    timer.lap("cache")
+    
+    def output_stats():
+        if exact_tokens:
+            return calculate_compression_stats(total_original_size, total_compressed_size,
+                                               total_original_tokens, total_compressed_tokens)
+        return calculate_compression_stats(total_original_size, total_compressed_size)
+    
+    # Pack into the context budget: when not everything fits, priorities decide
+    # which files stay whole, which shrink to a skeleton or a stub, and which go
+    packing = profile.get("packing") or {}
+    packing_note = None
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content_preview = f.read(3000)  # Read more for better detection
+        budget = packing_budget(packing.get("budget"))
+    except argparse.ArgumentTypeError as e:
+        log(f"⚠ Ignoring packing budget: {e}")
+        budget = None
+    if budget and structured:
+        log("⚠ Packing into a budget applies to txt output only; writing every file")
+        budget = None
+    if budget:
+        start = time.perf_counter()
+        limit, unit = budget
+        tokenizer = token_cache.tokenizer
+        
+        def measure(text):
+            return tokenizer.count(text) if unit == 'tokens' else len(text)
+        
+        # A file costs its content plus the block markers and TOC entry around it
+        fixed_costs = {}
+        full_costs = {}
+        for file_info in files:
+            rel_path = file_info['rel_path']
+            markers = '\n'.join(render_file_block(rel_path, ''))
+            toc_entry = '\n'.join(create_table_of_contents([file_info], {rel_path: {'line_num': 10 ** 7}}, profile))
+            fixed_costs[rel_path] = measure(f"{markers}\n{toc_entry}\n")
+            content_chars = writer.block_chars(rel_path) - len(markers)
+            if unit == 'tokens' and exact_tokens and file_info.get('tokens') is not None:
+                content_cost = file_info['tokens']
+            elif unit == 'tokens':
+                content_cost = estimate_tokens(content_chars, getattr(tokenizer, 'chars_per_token', CHARS_PER_TOKEN))
+            else:
+                content_cost = content_chars
+            full_costs[rel_path] = fixed_costs[rel_path] + content_cost
+        
+        def output_cost(files, packing_note=None):
+            # The output as it will be written: actual header, TOC and blocks
+            header_lines = build_header_lines(profile, project_name, compression_settings, output_stats(),
+                                              discovered_usings, tokenizer.name, packing_note=packing_note)
+            prefix = '\n'.join(layout_output(writer, files, profile, header_lines)[0])
+            if unit == 'chars':
+                return len(prefix) + sum(1 + writer.block_chars(f['rel_path']) for f in files)
+            blocks = [block.decode('utf-8') for _, block in writer.read_blocks([f['rel_path'] for f in files])]
+            return tokenizer.count('\n'.join([prefix] + blocks))
+        
+        def note(counts, left_out):
+            return (f"CONTEXT BUDGET: packed into {limit:,} {unit} by priority - {counts['full']} files in "
+                    f"full, {counts['skeleton']} as skeletons (bodies replaced with {{ /* N lines */ }}), "
+                    f"{counts['stub']} elided, {left_out} left out; request any of them by path.")
+        
+        # Header, packing note and separators; the TOC entries are in the file costs
+        worst_counts = dict.fromkeys(('full', 'skeleton', 'stub'), len(files))
+        header_lines = build_header_lines(profile, project_name, compression_settings, output_stats(),
+                                          discovered_usings, tokenizer.name, packing_note=note(worst_counts, len(files)))
+        overhead = measure('\n'.join(header_lines + ["", "=" * 80, "FILES", "=" * 80, ""]))
+        
+        total_cost = sum(full_costs.values()) + overhead
+        if total_cost <= limit:
+            total_cost = output_cost(files)
+        if total_cost <= limit:
+            log(f"✓ Packing: everything fits the budget ({total_cost:,} of {limit:,} {unit})")
+        else:
+            priorities = file_priorities(files, packing, relevance)
+            skeleton_value = packing.get("skeleton_value", 0.5)
+            stub_value = packing.get("stub_value", 0.05)
+            
+            # C# files fall back to their skeleton, unless the output already is one
+            skeletons = {}
+            if not compression_settings.get("skeleton", False):
+                keep_types, keep_paths = _compile_skeleton_keep(tuple(compression_settings.get("skeleton_keep", [])))
+                candidates = [f['rel_path'] for f in files if f['rel_path'] in file_stats and f['extension'] == '.cs'
+                              and not (keep_paths and keep_paths.match(f['rel_path'].replace('\\', '/')))]
+                for rel_path, block in writer.read_blocks(candidates):
+                    # The content sits between the marker lines and the closing blank line
+                    content = block.decode('utf-8').split('\n', 3)[3][:-1]
+                    skeleton = skeletonize_csharp(content, keep_types)
+                    if len(skeleton) < len(content):
+                        skeletons[rel_path] = skeleton
             
-            # Find namespace (handle file-scoped namespaces too)
-            # Standard: namespace Foo.Bar { ... }
-            # File-scoped: namespace Foo.Bar;
-            ns_match = re.search(r'namespace\s+([\w.]+)\s*[{;]', content_preview)
-            if ns_match:
-                metadata['namespace'] = ns_match.group(1)
+            # Every file can stay whole, become a skeleton or a one-line stub, or be left out
+            items = {}
+            variants = {}
+            kinds = {}
+            for file_info in files:
+                rel_path = file_info['rel_path']
+                priority = priorities[rel_path]
+                options = [(full_costs[rel_path], priority)]
+                variants[rel_path] = [None]
+                kinds[rel_path] = ['full']
+                if rel_path in skeletons:
+                    options.append((fixed_costs[rel_path] + measure(skeletons[rel_path]), priority * skeleton_value))
+                    variants[rel_path].append(skeletons[rel_path])
+                    kinds[rel_path].append('skeleton')
+                if rel_path in file_stats:
+                    stub = ELIDED_STUB.format(chars=file_stats[rel_path][1])
+                    options.append((fixed_costs[rel_path] + measure(stub), priority * stub_value))
+                    variants[rel_path].append(stub)
+                    kinds[rel_path].append('stub')
+                items[rel_path] = options
+            chosen = pack_choices(items, limit - overhead)
             
-            # Find main class/interface/struct/enum
-            # Priority: public > internal > private
-            class_patterns = [
-                r'public\s+(?:abstract\s+)?(?:partial\s+)?(?:sealed\s+)?(?:class|interface|struct|enum)\s+(\w+)',
-                r'internal\s+(?:abstract\s+)?(?:partial\s+)?(?:sealed\s+)?(?:class|interface|struct|enum)\s+(\w+)',
-                r'(?:abstract\s+)?(?:partial\s+)?(?:sealed\s+)?(?:class|interface|struct|enum)\s+(\w+)',
-            ]
+            def apply_choice(file_info, choice):
+                # Rewrite the block of a file that shrank, or drop it when left out
+                nonlocal total_original_size, total_compressed_size, total_original_tokens, total_compressed_tokens
+                rel_path = file_info['rel_path']
+                stat = file_stats.get(rel_path)
+                if choice is None:
+                    file_stats.pop(rel_path, None)
+                    file_symbols.pop(rel_path, None)
+                    file_errors.pop(rel_path, None)
+                    if stat:
+                        total_original_size -= stat[0]
+                        total_compressed_size -= stat[1]
+                        if exact_tokens:
+                            total_original_tokens -= stat[3]
+                            total_compressed_tokens -= stat[4]
+                    return
+                content = variants[rel_path][choice]
+                if kinds[rel_path][choice] == 'skeleton':
+                    if rel_path in file_symbols:
+                        file_symbols[rel_path] = index_csharp_symbols(content)
+                else:
+                    file_symbols.pop(rel_path, None)
+                tokens = None
+                if exact_tokens:
+                    tokens = tokenizer.count(content)
+                    total_compressed_tokens += tokens - stat[4]
+                    file_info['tokens'] = tokens
+                total_compressed_size += len(content) - stat[1]
+                file_stats[rel_path] = (stat[0], len(content), stat[2], stat[3], tokens)
+                writer.add_block(rel_path, render_file_block(rel_path, content))
             
-            for pattern in class_patterns:
-                class_match = re.search(pattern, content_preview)
-                if class_match:
-                    metadata['main_class'] = class_match.group(1)
+            # Apply the choices, then measure the output as written; while it is
+            # over the budget, step the least valuable files down to a cheaper option
+            applied = {file_info['rel_path']: 0 for file_info in files}
+            all_files = files
+            while True:
+                for file_info in all_files:
+                    rel_path = file_info['rel_path']
+                    if rel_path in applied and chosen.get(rel_path) != applied[rel_path]:
+                        apply_choice(file_info, chosen.get(rel_path))
+                        if rel_path in chosen:
+                            applied[rel_path] = chosen[rel_path]
+                        else:
+                            del applied[rel_path]
+                files = [file_info for file_info in all_files if file_info['rel_path'] in applied]
+                left_out = len(all_files) - len(files)
+                if left_out:
+                    discovered_usings = set()
+                    for stat in file_stats.values():
+                        discovered_usings.update(stat[2])
+                counts = {'full': 0, 'skeleton': 0, 'stub': 0}
+                for rel_path, choice in applied.items():
+                    counts[kinds[rel_path][choice]] += 1
+                packing_note = note(counts, left_out)
+                excess = output_cost(files, packing_note) - limit
+                if excess <= 0 or not applied:
                     break
-                    
-    except Exception:
-        pass
+                for rel_path in sorted(applied, key=lambda key: (items[key][applied[key]][1], key)):
+                    options = items[rel_path]
+                    cost = options[applied[rel_path]][0]
+                    cheaper = [index for index, option in enumerate(options) if option[0] < cost]
+                    if cheaper:
+                        chosen[rel_path] = max(cheaper, key=lambda index: options[index][1])
+                        excess -= cost - options[chosen[rel_path]][0]
+                    else:
+                        chosen.pop(rel_path, None)
+                        excess -= cost
+                    if excess <= 0:
+                        break
+            log(f"✓ Packed into {limit:,} {unit}: {counts['full']} full, {counts['skeleton']} skeleton, "
+                f"{counts['stub']} elided, {left_out} left out ({(time.perf_counter() - start) * 1000:.0f} ms)")
+        timer.lap("pack")
     
-    return metadata
+    stats = output_stats()
+    tokenizer_name = token_cache.tokenizer.name
+    header_lines = build_header_lines(profile, project_name, compression_settings, stats, discovered_usings,
+                                      tokenizer_name, packing_note=packing_note)
+    
+    # Split into parts when the output would exceed the character/token budget
+    if structured:
+        parts = [files]
+    else:
+        max_chars = global_settings.get("max_chars_per_file", 0) or 0
+        max_tokens = global_settings.get("max_tokens_per_file", 0) or 0
+        budgets = (max_chars or float('inf'), max_tokens or float('inf'))
+        file_costs = {}
+        for file_info in files:
+            toc_entry = '\n'.join(create_table_of_contents(
+                [file_info], {file_info['rel_path']: {'line_num': 10 ** 7}}, profile))
+            chars = writer.block_chars(file_info['rel_path']) + 1 + len(toc_entry) + 1
+            if exact_tokens and file_info.get('tokens') is not None:
+                # Body count is already known; count the block markers and TOC entry around it
+                markers = '\n'.join(render_file_block(file_info['rel_path'], '')) + '\n' + toc_entry
+                tokens = file_info['tokens'] + token_cache.tokenizer.count(markers)
+            else:
+                tokens = estimate_tokens(chars)
+            file_costs[file_info['rel_path']] = (chars, tokens)
+        # Per-part header (plus a part label) and separators, with some slack
+        header_text = '\n'.join(header_lines)
+        overhead_chars = len(header_text) + 200
+        overhead_tokens = token_cache.tokenizer.count(header_text) + estimate_tokens(200)
+        parts = plan_parts(files, file_costs, budgets, (overhead_chars, overhead_tokens))
+    timer.lap("layout")
+    
+    def save_symbol_index(path, written_files, locations):
+        if not write_index:
+            return
+        try:
+            write_symbol_index(path, written_files, locations, file_symbols)
+        except OSError as e:
+            log(f"⚠ Warning: Could not write symbol index for {os.path.basename(path)}. {e}")
+    
+    # Write output
+    try:
+        if structured:
+            header = structured_header(profile_name, profile, project_name, stats, discovered_usings,
+                                       tokenizer_name, len(files))
+            records = {f['rel_path']: structured_record(f, file_stats.get(f['rel_path']),
+                                                        file_errors.get(f['rel_path']))
+                       for f in files}
+            write_structured = write_jsonl_output if output_format == "jsonl" else write_packed_output
+            writer.bytes_written += write_structured(writer, output_path, header, files, records)
+            log(f"\n✓ Success! Output saved to: {output_filename}")
+            part_files = []
+        elif len(parts) == 1:
+            locations = write_output_file(writer, output_path, files, profile, header_lines)
+            save_symbol_index(output_path, files, locations)
+            log(f"\n✓ Success! Output saved to: {output_filename}")
+            part_files = []
+        else:
+            part_base = profile.get("part_output_filename") or f"{base_filename}_part"
+            suffix = f"_{timestamp}" if global_settings.get("include_timestamp_in_filename", False) else ""
+            part_entries = []
+            for number, part_files_info in enumerate(parts, 1):
+                part_filename = f"{part_base}{number}{suffix}.txt"
+                part_stats = [file_stats[f['rel_path']] for f in part_files_info if f['rel_path'] in file_stats]
+                part_usings = set()
+                for _, _, usings, _, _ in part_stats:
+                    part_usings.update(usings)
+                part_sizes = (sum(s[0] for s in part_stats), sum(s[1] for s in part_stats))
+                if exact_tokens:
+                    part_totals = calculate_compression_stats(*part_sizes, sum(s[3] for s in part_stats),
+                                                              sum(s[4] for s in part_stats))
+                else:
+                    part_totals = calculate_compression_stats(*part_sizes)
+                part_header = build_header_lines(
+                    profile, project_name, compression_settings, part_totals, part_usings, tokenizer_name,
+                    part_label=f"PART {number} OF {len(parts)} - class index: {part_base}_index{suffix}.txt",
+                    packing_note=packing_note)
+                part_path = os.path.join(project_path, part_filename)
+                locations = write_output_file(writer, part_path, part_files_info, profile, part_header)
+                save_symbol_index(part_path, part_files_info, locations)
+                part_chars = sum(file_costs[f['rel_path']][0] for f in part_files_info)
+                part_entries.append((part_filename, part_files_info, locations, part_chars))
+            
+            output_filename = f"{part_base}_index{suffix}.txt"
+            write_part_index(os.path.join(project_path, output_filename), base_filename, part_entries)
+            part_files = [entry[0] for entry in part_entries]
+            log(f"\n✓ Success! Output split into {len(parts)} parts ({part_files[0]} ... {part_files[-1]})")
+            log(f"  Class index: {output_filename}")
+        timer.lap("write")
+        timer.add('bytes_written', writer.bytes_written)
+        timer.add('files', len(files))
+        timer.add('files_processed', len(pending))
+        
+        # Show stats
+        if global_settings.get("show_compression_stats", True) and compression_enabled:
+            log(f"\n📊 Compression Statistics:")
+            log(f"   Original:   {total_original_size:>10,} chars ({format_size(total_original_size)})")
+            log(f"   Compressed: {total_compressed_size:>10,} chars ({format_size(total_compressed_size)})")
+            log(f"   Saved:      {stats['saved']:>10,} chars ({stats['percentage']:.1f}%)")
+            if exact_tokens:
+                log(f"   Tokens:     {stats['original_tokens']:>10,} → {stats['compressed_tokens']:,} "
+                      f"({tokenizer_name})")
+                log(f"   Tokens saved:      {stats['tokens_saved']:,}")
+            else:
+                log(f"   Est. tokens saved: ~{stats['tokens_saved']:,}")
+        
+        return {
+            'output_file': output_filename,
+            'part_files': part_files,
+            'files_processed': len(files),
+            'original_size': total_original_size,
+            'compressed_size': total_compressed_size,
+            'stats': stats
+        }
+        
+    except IOError as e:
+        log(f"\n✗ Error: Could not write to output file. {e}")
+        return None
+    finally:
+        writer.discard()
+
+
+def select_profiles(profiles, profile_filter=None):
+    """Profiles to run: the named one(s), or every enabled profile.
+    
+    Returns None (after printing an error) if a named profile does not exist.
+    """
+    if not profile_filter:
+        return {k: v for k, v in profiles.items() if v.get("enabled", False)}
+    names = [profile_filter] if isinstance(profile_filter, str) else list(profile_filter)
+    for name in names:
+        if name not in profiles:
+            print(f"\n✗ Error: Profile '{name}' not found.")
+            print(f"  Available profiles: {', '.join(profiles.keys())}")
+            return None
+    return {name: profiles[name] for name in names}
+
+
+class BufferedLog:
+    """Collects one profile's console output so concurrent profiles don't interleave."""
+    
+    def __init__(self):
+        self.lines = []
+    
+    def __call__(self, message=""):
+        self.lines.append(str(message))
+    
+    def flush(self):
+        if self.lines:
+            print('\n'.join(self.lines))
+            self.lines = []
+
+
+def run_profiles_concurrently(project_path, profiles_to_run, global_settings, use_cache, workers,
+                              token_cache, file_index, executor, only_files=None, metrics=None, guid_index=None,
+                              xref=None, relevance=None):
+    """Run extract_profile for every profile on its own thread.
+    
+    Profiles share the file index, token cache and process pool. Each
+    profile's log is printed as one block, in profile order, once it finishes.
+    only_files optionally maps profile names to the rel_paths they're limited
+    to; metrics, guid_index, xref and relevance are passed on to
+    extract_profile.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    
+    results = {}
+    logs = {name: BufferedLog() for name in profiles_to_run}
+    with ThreadPoolExecutor(max_workers=len(profiles_to_run)) as pool:
+        futures = {
+            name: pool.submit(extract_profile, project_path, name, profile, global_settings, use_cache,
+                              workers, token_cache, file_index, executor, logs[name],
+                              (only_files or {}).get(name), metrics, guid_index, xref, relevance)
+            for name, profile in profiles_to_run.items()
+        }
+        for name, future in futures.items():
+            try:
+                result = future.result()
+            finally:
+                logs[name].flush()
+            if result:
+                results[name] = result
+    return results
+
+
+def run_extraction(project_path, profile_filter=None, use_cache=True, jobs=None, seeds=None, depth=1,
+                   timings=False, metrics_path=None, since=None, query=None, budget=None, refs=None):
+    """Run extraction for specified profiles (a profile name, a list of names, or all enabled).
+    
+    With seeds, each profile is limited to the files declaring those types
+    plus whatever they reference within depth hops (see TypeReferenceGraph).
+    With since (a git ref), only files changed since then are extracted,
+    to "<output>_delta" outputs (see plan_delta_profiles). With query, only
+    the best-ranked files for it that fit budget are extracted, to
+    "<output>_query" outputs (see plan_query_profiles). With refs (symbol
+    names), only the files using them are extracted, to "<output>_refs_<Symbol>"
+    outputs (see plan_refs_profiles). A budget packs every profile's output
+    into it, by priority (see pack_choices). timings prints
+    per-stage timings at the end; metrics_path writes them as JSON.
+    """
+    metrics = RunMetrics() if timings or metrics_path else None
+    timer = metrics.run if metrics else NULL_TIMER
+    settings = load_settings()
+    global_settings = settings.get("global", {})
+    profiles = settings.get("profiles", {})
+    workers = resolve_workers(global_settings, jobs)
+    
+    results = {}
+    
+    print("\n" + "=" * 60)
+    print("UNITY ULTIMATE EXTRACTOR")
+    print("=" * 60)
+    print(f"Project: {project_path}")
+    print(f"Time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    
+    # Determine which profiles to run
+    profiles_to_run = select_profiles(profiles, profile_filter)
+    if profiles_to_run is None:
+        return results
+    
+    if not profiles_to_run:
+        print("\n⚠ No enabled profiles found. Check your settings file.")
+        return results
+    
+    print(f"\nProfiles to run: {', '.join(profiles_to_run.keys())}")
+    
+    # Walk every profile directory once; profiles filter this shared index
+    file_index = build_file_index(project_path, profiles_to_run, global_settings)
+    print(f"✓ Indexed {file_index.file_count} files in {len(file_index.dirs)} directories"
+          f"{' (git index)' if file_index.tracked else ''}"
+          f"{f', {file_index.pruned} blacklisted skipped' if file_index.pruned else ''}")
+    timer.lap("index")
+    
+    # Token counts are shared by all profiles and persisted with the cache
+    tokenizer = get_tokenizer(resolve_tokenizer_settings(global_settings, project_path))
+    cache_dir = None
+    if use_cache and global_settings.get("cache_enabled", True):
+        cache_dir = os.path.join(project_path, global_settings.get("cache_directory", "_extractor_cache"))
+    token_cache = TokenCountCache(tokenizer, cache_dir)
+    if tokenizer.exact:
+        print(f"Tokenizer: {tokenizer.name}")
+    timer.lap("tokenizer")
+    
+    # Seeded runs: narrow every profile to the reference closure of the seed types
+    only_files = None
+    if seeds:
+        graph = TypeReferenceGraph(cache_dir)
+        profiles_to_run, only_files = plan_seeded_profiles(
+            project_path, profiles_to_run, file_index, seeds, depth, graph,
+            global_settings.get("mmap_min_size", MMAP_MIN_SIZE))
+        print(f"✓ Reference graph: {len(graph.files)} C# files ({graph.scanned} scanned)")
+        try:
+            graph.save()
+        except OSError as e:
+            print(f"⚠ Warning: Could not update reference graph cache. {e}")
+        if not profiles_to_run:
+            print(f"\n⚠ No profile declares {', '.join(seeds)}.")
+            return results
+        timer.lap("seed graph")
+    
+    # Delta runs: only files added or modified since the ref
+    if since:
+        try:
+            profiles_to_run, only_files = plan_delta_profiles(project_path, profiles_to_run, file_index, since)
+        except (OSError, ValueError) as e:
+            print(f"\n✗ Error: Could not compare with {since}. {e}")
+            return results
+        if not profiles_to_run:
+            print(f"\n✓ No added or modified files to extract since {since}.")
+            return results
+        timer.lap("git delta")
+    
+    # Identifier cross-references, kept up to date by every extraction
+    xref = None
+    if refs or global_settings.get("write_xref_index", True):
+        xref = CrossReferenceIndex(cache_dir)
+    
+    # Refs runs: only the files using the given symbols
+    if refs:
+        profiles_to_run, only_files = plan_refs_profiles(project_path, profiles_to_run, file_index, refs, xref,
+                                                         global_settings.get("mmap_min_size", MMAP_MIN_SIZE))
+        if not profiles_to_run:
+            print(f"\n⚠ No file uses {', '.join(refs)}.")
+            xref.save()
+            return results
+        timer.lap("refs")
+    
+    # Asset references in Unity YAML output are resolved through the .meta files
+    guid_index = None
+    if any(uses_guid_index(profile) for profile in profiles_to_run.values()):
+        guid_index = GuidIndex(cache_dir)
+        guid_index.update(project_path)
+        print(f"✓ GUID index: {len(guid_index.paths)} assets ({guid_index.scanned} .meta files read)")
+        try:
+            guid_index.save()
+        except OSError as e:
+            print(f"⚠ Warning: Could not update GUID index cache. {e}")
+        timer.lap("guid index")
+    
+    # Query runs: only the best-ranked files for the search terms, within the budget
+    relevance = None
+    if query:
+        index = SearchIndex(cache_dir)
+        profiles_to_run, only_files = plan_query_profiles(project_path, profiles_to_run, file_index, query, budget,
+                                                          index, global_settings, token_cache)
+        relevance = dict(index.search(query))
+        try:
+            index.save()
+        except OSError as e:
+            print(f"⚠ Warning: Could not update search index cache. {e}")
+        if not profiles_to_run:
+            print(f"\n⚠ No files match \"{query}\".")
+            return results
+        timer.lap("search")
+    
+    # A budget packs each profile's output into it by priority; after a query
+    # this trims what the header and TOC add on top of the selected files
+    if budget:
+        profiles_to_run = {name: dict(profile, packing=dict(profile.get("packing") or {}, budget=budget))
+                           for name, profile in profiles_to_run.items()}
+    
+    # Run each profile; file compression for all of them shares one process pool
+    executor = create_process_pool(workers) if workers > 1 else None
+    try:
+        if len(profiles_to_run) > 1 and global_settings.get("parallel_profiles", True):
+            results = run_profiles_concurrently(project_path, profiles_to_run, global_settings, use_cache,
+                                                workers, token_cache, file_index, executor, only_files,
+                                                metrics, guid_index, xref, relevance)
+        else:
+            for profile_name, profile in profiles_to_run.items():
+                result = extract_profile(project_path, profile_name, profile, global_settings, use_cache,
+                                         workers, token_cache, file_index, executor,
+                                         only_files=(only_files or {}).get(profile_name), metrics=metrics,
+                                         guid_index=guid_index, xref=xref, relevance=relevance)
+                if result:
+                    results[profile_name] = result
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    timer.lap("profiles")
+    
+    # Shared cache state is written once every profile is done
+    try:
+        token_cache.save()
+    except OSError as e:
+        print(f"⚠ Warning: Could not update token count cache. {e}")
+    if xref is not None:
+        xref.prune(project_path)
+        try:
+            xref.save()
+        except OSError as e:
+            print(f"⚠ Warning: Could not update cross-reference index. {e}")
+    if cache_dir:
+        prune_cache_objects(cache_dir)
+    timer.lap("cache")
+    
+    # Backup retention runs once, after every profile has taken its snapshot
+    if global_settings.get("backup_previous_files", False):
+        try:
+            removed_snapshots, removed_chunks = open_backup_store(project_path, global_settings).apply_retention(
+                global_settings.get("backup_keep", 0), global_settings.get("backup_max_age_days", 0))
+            if removed_snapshots:
+                print(f"📦 Backup retention: removed {removed_snapshots} snapshot(s), {removed_chunks} chunk(s)")
+        except (OSError, ValueError) as e:
+            print(f"⚠ Warning: Could not apply backup retention. {e}")
+        timer.lap("backups")
+    
+    # Summary
+    if results:
+        print("\n" + "=" * 60)
+        print("EXTRACTION COMPLETE")
+        print("=" * 60)
+        
+        total_files = sum(r['files_processed'] for r in results.values())
+        total_original = sum(r['original_size'] for r in results.values())
+        total_compressed = sum(r['compressed_size'] for r in results.values())
+        
+        print(f"\n📁 Total files processed: {total_files}")
+        print(f"📄 Output files created:")
+        for profile_name, result in results.items():
+            print(f"   - {result['output_file']}")
+            for part_file in result.get('part_files', []):
+                print(f"     · {part_file}")
+        
+        if total_original > total_compressed:
+            all_stats = [r['stats'] for r in results.values()]
+            if all(s['exact_tokens'] for s in all_stats):
+                overall_stats = calculate_compression_stats(
+                    total_original, total_compressed,
+                    sum(s['original_tokens'] for s in all_stats), sum(s['compressed_tokens'] for s in all_stats))
+                tokens_note = f"{overall_stats['tokens_saved']:,} tokens saved"
+            else:
+                overall_stats = calculate_compression_stats(total_original, total_compressed)
+                tokens_note = f"~{overall_stats['tokens_saved']:,} tokens saved"
+            print(f"\n📊 Overall compression: {overall_stats['percentage']:.1f}% reduction")
+            print(f"   ({tokens_note})")
+    
+    if metrics:
+        report = metrics.report()
+        if timings:
+            print_timings(report)
+        if metrics_path:
+            write_metrics_json(metrics_path, report)
+    
+    return results
 
 
 # =============================================================================
-# TABLE OF CONTENTS
+# TYPE REFERENCE GRAPH
 # =============================================================================
 
-def create_table_of_contents(files, file_locations, profile):
-    """Create table of contents."""
-    toc = []
-    current_namespace = "__INITIAL__"  # Sentinel value
-    compact = profile.get("compact_toc", False)
-    compression_enabled = profile.get("compression", {}).get("enabled", False)
+REFERENCE_GRAPH_VERSION = 1
+
+# Type names are PascalCase by convention, so only capitalized identifiers are kept
+_CS_TYPE_REFERENCE_RE = re.compile(r'\b[A-Z_]\w*')
+
+
+class TypeReferenceGraph:
+    """Which types each C# file declares and which type-like names it uses.
     
-    if not files:
-        toc.append("No matching files were found.")
-        return toc
+    Per-file facts are cached in <cache dir>/references.json keyed on size
+    and mtime, so only changed files are read and re-scanned. Comments and
+    literals are masked before scanning, so names mentioned there don't
+    create edges.
+    """
     
-    for file_info in files:
-        # Group by namespace for code files
-        if file_info.get('extension') == '.cs' and compression_enabled:
-            namespace = file_info.get('namespace')
-            if namespace != current_namespace:
-                current_namespace = namespace
-                if namespace:
-                    toc.append(f"\n[{namespace}]")
-                else:
-                    toc.append(f"\n[Global Scope]")  # Better than "Unknown" or "//"
-        
-        location = file_locations.get(file_info['rel_path'], {})
-        line_info = f"L{location.get('line_num', '?')}"
+    def __init__(self, cache_dir=None):
+        self.path = os.path.join(cache_dir, "references.json") if cache_dir else None
+        self.files = {}  # rel_path -> {'size', 'mtime_ns', 'declares', 'references'}
+        self.scanned = 0
+        self._dirty = False
+        if self.path:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == REFERENCE_GRAPH_VERSION:
+                    self.files = data.get('files', {})
+            except (OSError, ValueError):
+                pass
+    
+    def update(self, sources, mmap_min_size=MMAP_MIN_SIZE):
+        """Bring the graph up to date for [(rel_path, full_path, size, mtime_ns)] C# sources.
         
-        # Shorten path for display
-        short_path = file_info['rel_path']
-        for prefix in ["Assets/Scripts/", "Assets/Editor/", "Assets/"]:
-            if short_path.startswith(prefix):
-                short_path = short_path[len(prefix):]
-                break
+        Files not listed are dropped from the graph.
+        """
+        current = {}
+        for rel_path, full_path, size, mtime_ns in sources:
+            facts = self.files.get(rel_path)
+            if not facts or facts['size'] != size or facts['mtime_ns'] != mtime_ns:
+                try:
+                    masked = _mask_csharp(read_source(full_path, mmap_min_size))
+                except (OSError, UnicodeDecodeError):
+                    masked = ''
+                declares = sorted({m.group(2) for m in _CS_TYPE_DECL_RE.finditer(masked)})
+                references = sorted(set(_CS_TYPE_REFERENCE_RE.findall(masked)) - set(declares))
+                facts = {'size': size, 'mtime_ns': mtime_ns, 'declares': declares, 'references': references}
+                self.scanned += 1
+                self._dirty = True
+            current[rel_path] = facts
+        if len(current) != len(self.files):
+            self._dirty = True
+        self.files = current
+    
+    def declaring_files(self):
+        """{type name: {rel_path, ...}} (partial types can span several files)."""
+        declared = {}
+        for rel_path, facts in self.files.items():
+            for name in facts['declares']:
+                declared.setdefault(name, set()).add(rel_path)
+        return declared
+    
+    def closure(self, seeds, depth):
+        """{rel_path: hops} for files within depth reference hops of the seed types."""
+        declared = self.declaring_files()
+        hops = {}
+        frontier = []
+        for seed in seeds:
+            for rel_path in declared.get(seed, ()):
+                if rel_path not in hops:
+                    hops[rel_path] = 0
+                    frontier.append(rel_path)
+        for hop in range(1, depth + 1):
+            next_frontier = []
+            for rel_path in frontier:
+                for name in self.files[rel_path]['references']:
+                    for target in declared.get(name, ()):
+                        if target not in hops:
+                            hops[target] = hop
+                            next_frontier.append(target)
+            frontier = next_frontier
+        return hops
+    
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = {'version': REFERENCE_GRAPH_VERSION, 'files': self.files}
+        write_file_atomic(self.path, json.dumps(data, separators=(',', ':')).encode('utf-8'))
+        self._dirty = False
+
+
+def plan_seeded_profiles(project_path, profiles, file_index, seeds, depth, graph, mmap_min_size=MMAP_MIN_SIZE):
+    """Restrict profiles to the reference closure of the seed types.
+    
+    Returns ({name: seeded profile}, {name: set of rel_paths}). Seeded
+    profiles write to "<output>_seed_<Type>" so the full outputs are left
+    alone; profiles that don't declare any seed type are skipped.
+    """
+    sources = {}
+    for profile in profiles.values():
+        for entry, file_ext in file_index.profile_files(profile):
+            if file_ext == '.cs':
+                rel_path = os.path.relpath(entry.path, project_path)
+                sources[rel_path] = (rel_path, entry.path) + file_index.stat(entry)
+    graph.update(sources.values(), mmap_min_size)
+    hops = graph.closure(seeds, depth)
+    
+    seed_label = '_'.join(re.sub(r'\W', '', seed) for seed in seeds)
+    seeded_profiles = {}
+    only_files = {}
+    for name, profile in profiles.items():
+        profile_paths = {os.path.relpath(entry.path, project_path)
+                         for entry, _ in file_index.profile_files(profile)}
+        selected = {rel_path for rel_path in profile_paths if rel_path in hops}
+        if not any(hops[rel_path] == 0 for rel_path in selected):
+            print(f"⚠ Skipping {name}: none of {', '.join(seeds)} is declared in its files")
+            continue
+        seeded = dict(profile)
+        base_filename = profile.get("output_filename", f"EXTRACTED_{name}")
+        seeded["output_filename"] = f"{base_filename}_seed_{seed_label}"
+        seeded["part_output_filename"] = f"{base_filename}_seed_{seed_label}_part"
+        seeded["description"] = f"{profile.get('description', name)} - seed {', '.join(seeds)}, depth {depth}"
+        # The header is a format template; keep braces in the seed names literal
+        seed_names = ', '.join(seeds).replace('{', '{{').replace('}', '}}')
+        seeded["header_text"] = (f"SEED EXTRACTION: {seed_names} and the types "
+                                 f"{'it references' if len(seeds) == 1 else 'they reference'} "
+                                 f"within {depth} hop(s) - {len(selected)} of {len(profile_paths)} files\n\n"
+                                 + profile.get("header_text", "Extracted files\n"))
+        seeded_profiles[name] = seeded
+        only_files[name] = selected
+        print(f"🌱 {name}: {len(selected)} of {len(profile_paths)} files within {depth} hop(s) of {', '.join(seeds)}")
+    return seeded_profiles, only_files
+
+
+# =============================================================================
+# GUID INDEX
+# =============================================================================
+
+GUID_INDEX_VERSION = 1
+
+# Directories whose .meta files give assets their GUIDs
+GUID_INDEX_DIRECTORIES = ("Assets", "Packages")
+
+_META_GUID_RE = re.compile(r'^guid: ([0-9a-fA-F]{32})', re.MULTILINE)
+_YAML_GUID_REFERENCE_RE = re.compile(r'@([0-9a-fA-F]{32})\b')
+
+# Unity's built-in resource files have fixed GUIDs and no .meta file
+BUILTIN_GUIDS = {
+    "0000000000000000e000000000000000": "builtin",
+    "0000000000000000f000000000000000": "builtin"
+}
+
+
+def uses_guid_index(profile):
+    """Whether a profile's output has asset references for a GuidIndex to resolve."""
+    compression = profile.get("compression", {})
+    return (compression.get("enabled", False) and compression.get("yaml_resolve_guids", False)
+            and any(ext in UNITY_YAML_EXTENSIONS for ext in profile.get("include_extensions", [])))
+
+
+class GuidIndex:
+    """Asset GUID -> project path, read from the .meta file beside every asset.
+    
+    Per-file GUIDs are cached in <cache dir>/guids.json keyed on the .meta
+    file's mtime, so an update only stats the .meta files and reads the new
+    or changed ones. resolve() rewrites compress_unity_yaml's @<guid>
+    references to @<asset path>, or @<class name> for scripts.
+    """
+    
+    def __init__(self, cache_dir=None):
+        self.path = os.path.join(cache_dir, "guids.json") if cache_dir else None
+        self.metas = {}  # rel_path of the .meta file -> [mtime_ns, guid]
+        self.scanned = 0
+        self._dirty = False
+        self._paths = None
+        if self.path:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == GUID_INDEX_VERSION:
+                    self.metas = data.get('metas', {})
+            except (OSError, ValueError):
+                pass
+    
+    def update(self, project_path, directories=GUID_INDEX_DIRECTORIES):
+        """Re-read changed .meta files under directories; vanished ones are dropped."""
+        current = {}
+        pending = [os.path.join(project_path, d) for d in directories]
+        while pending:
+            try:
+                entries = list(os.scandir(pending.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                # Unity ignores hidden folders and folders ending in '~'
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir():
+                    if not entry.name.endswith('~'):
+                        pending.append(entry.path)
+                    continue
+                if not entry.name.endswith('.meta'):
+                    continue
+                rel_path = os.path.relpath(entry.path, project_path).replace(os.sep, '/')
+                try:
+                    mtime_ns = entry.stat().st_mtime_ns
+                except OSError:
+                    continue
+                known = self.metas.get(rel_path)
+                if not known or known[0] != mtime_ns:
+                    try:
+                        with open(entry.path, 'r', encoding='utf-8', errors='replace') as f:
+                            match = _META_GUID_RE.search(f.read())
+                    except OSError:
+                        continue
+                    known = [mtime_ns, match.group(1).lower() if match else None]
+                    self.scanned += 1
+                    self._dirty = True
+                current[rel_path] = known
+        if len(current) != len(self.metas):
+            self._dirty = True
+        self.metas = current
+        self._paths = None
+    
+    @property
+    def paths(self):
+        """{guid: asset rel_path}."""
+        if self._paths is None:
+            self._paths = {guid: rel_path[:-len('.meta')] for rel_path, (_, guid) in self.metas.items() if guid}
+        return self._paths
+    
+    def label(self, guid):
+        """Readable name for an asset GUID, or None if it isn't known."""
+        guid = guid.lower()
+        if guid in BUILTIN_GUIDS:
+            return BUILTIN_GUIDS[guid]
+        rel_path = self.paths.get(guid)
+        if rel_path and rel_path.endswith('.cs'):
+            # A MonoBehaviour's class is named after its script file
+            return os.path.splitext(os.path.basename(rel_path))[0]
+        return rel_path
+    
+    def resolve(self, content):
+        """content with @<guid> references replaced by their label()."""
+        if '@' not in content:
+            return content
         
-        if compact and file_info.get('extension') == '.cs':
-            dir_path = os.path.dirname(short_path)
-            if dir_path:
-                toc.append(f"  {file_info['main_class']} ({dir_path}/) {line_info}")
-            else:
-                toc.append(f"  {file_info['main_class']} {line_info}")
-        else:
-            toc.append(f"- {short_path} (Line: {line_info})")
+        def replace(match):
+            label = self.label(match.group(1))
+            return f"@{label}" if label else match.group()
+        
+        return _YAML_GUID_REFERENCE_RE.sub(replace, content)
     
-    toc.append("")
-    return toc
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = {'version': GUID_INDEX_VERSION, 'metas': self.metas}
+        write_file_atomic(self.path, json.dumps(data, separators=(',', ':')).encode('utf-8'))
+        self._dirty = False
 
 
 # =============================================================================
-# FILE CLEANUP
+# SEARCH INDEX
 # =============================================================================
 
-def clean_previous_files(project_path, profile_name, profile, global_settings, timestamp):
-    """Clean up previous output files for a profile."""
-    output_filename = profile.get("output_filename", f"EXTRACTED_{profile_name}")
-    part_filename = profile.get("part_output_filename", "")
-    
-    patterns = [os.path.join(project_path, f"{output_filename}*.txt")]
-    if part_filename:
-        patterns.append(os.path.join(project_path, f"{part_filename}*.txt"))
+SEARCH_INDEX_VERSION = 2
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Words of a file's path count this many times, so PlantGrowth.cs ranks for "plant growth"
+SEARCH_PATH_WEIGHT = 3
+
+# Files a --query run extracts when no --budget is given
+SEARCH_DEFAULT_RESULTS = 20
+
+_SEARCH_WORD_RE = re.compile(r'[A-Za-z][A-Za-z0-9]*')
+_SEARCH_WORD_PART_RE = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+')
+
+
+def _search_stem(word):
+    """Fold plurals so "ticks" finds Tick and "entities" finds Entity."""
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def search_terms(text):
+    """Index terms of text: every word lowercased, plus the parts of
+    camelCase/PascalCase/snake_case identifiers, plural-folded."""
+    terms = []
+    for word in _SEARCH_WORD_RE.findall(text):
+        lowered = word.lower()
+        if len(lowered) > 1:
+            terms.append(_search_stem(lowered))
+        parts = _SEARCH_WORD_PART_RE.findall(word)
+        if len(parts) > 1:
+            terms.extend(_search_stem(part.lower()) for part in parts if len(part) > 1)
+    return terms
+
+
+class SearchIndex:
+    """Inverted index over identifiers and comment words, ranked with BM25.
     
-    files_to_clean = []
-    for pattern in patterns:
-        files_to_clean.extend(glob.glob(pattern))
+    Stored in <cache dir>/search.json as a file table (with each file's
+    terms) plus postings (term -> {rel_path: term frequency}), so a query
+    only touches the postings of its own terms. Files are keyed on size and
+    mtime; an update re-reads changed files only and replaces just their
+    entries in the postings of their own terms, like CrossReferenceIndex.
+    """
     
-    if not files_to_clean:
-        return
+    def __init__(self, cache_dir=None):
+        self.path = os.path.join(cache_dir, "search.json") if cache_dir else None
+        self.files = {}  # rel_path -> [size, mtime_ns, length, [terms]]
+        self.postings = {}  # term -> {rel_path: tf}
+        self.scanned = 0
+        self._dirty = False
+        if self.path:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == SEARCH_INDEX_VERSION:
+                    self.files = data.get('files', {})
+                    self.postings = data.get('postings', {})
+            except (OSError, ValueError):
+                pass
     
-    # Backup if enabled
-    if global_settings.get("backup_previous_files", False):
-        backup_dir = os.path.join(project_path, global_settings.get("backup_directory", "_backups"))
-        backup_timestamp_dir = os.path.join(backup_dir, timestamp)
+    def update(self, sources, mmap_min_size=MMAP_MIN_SIZE):
+        """Bring the index up to date for [(rel_path, full_path, size, mtime_ns)].
         
-        os.makedirs(backup_timestamp_dir, exist_ok=True)
+        Files not listed are dropped from the index.
+        """
+        sources = list(sources)
+        listed = {source[0] for source in sources}
+        for rel_path in [p for p in self.files if p not in listed]:
+            self._forget(rel_path)
         
-        for file_path in files_to_clean:
+        for rel_path, full_path, size, mtime_ns in sources:
+            known = self.files.get(rel_path)
+            if known is not None and known[0] == size and known[1] == mtime_ns:
+                continue
+            self._forget(rel_path)
             try:
-                filename = os.path.basename(file_path)
-                backup_path = os.path.join(backup_timestamp_dir, filename)
-                shutil.copy2(file_path, backup_path)
-                print(f"  📦 Backed up: {filename}")
-            except Exception as e:
-                print(f"  ⚠ Failed to backup {filename}: {e}")
+                text = read_source(full_path, mmap_min_size)
+            except (OSError, UnicodeDecodeError):
+                text = ''
+            counts = {}
+            for term in search_terms(text):
+                counts[term] = counts.get(term, 0) + 1
+            for term in search_terms(rel_path):
+                counts[term] = counts.get(term, 0) + SEARCH_PATH_WEIGHT
+            for term, count in counts.items():
+                self.postings.setdefault(term, {})[rel_path] = count
+            self.files[rel_path] = [size, mtime_ns, sum(counts.values()), sorted(counts)]
+            self.scanned += 1
+            self._dirty = True
     
-    # Remove files
-    for file_path in files_to_clean:
-        try:
-            os.remove(file_path)
-            print(f"  🗑 Removed: {os.path.basename(file_path)}")
-        except Exception as e:
-            print(f"  ⚠ Failed to remove {os.path.basename(file_path)}: {e}")
+    def _forget(self, rel_path):
+        known = self.files.pop(rel_path, None)
+        if known is None:
+            return
+        for term in known[3]:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(rel_path, None)
+                if not posting:
+                    del self.postings[term]
+        self._dirty = True
+    
+    def search(self, query):
+        """[(rel_path, score)] of files matching any query term, best first."""
+        if not self.files:
+            return []
+        average_length = sum(row[2] for row in self.files.values()) / len(self.files) or 1
+        scores = {}
+        for term in set(search_terms(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (len(self.files) - len(posting) + 0.5) / (len(posting) + 0.5))
+            for rel_path, tf in posting.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.files[rel_path][2] / average_length)
+                scores[rel_path] = scores.get(rel_path, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = {'version': SEARCH_INDEX_VERSION, 'files': self.files, 'postings': self.postings}
+        write_file_atomic(self.path, json.dumps(data, separators=(',', ':')).encode('utf-8'))
+        self._dirty = False
 
 
-# =============================================================================
-# EXTRACTION
-# =============================================================================
+def parse_budget(text):
+    """(limit, unit) from a --budget value: "40000" characters or "12000t" tokens."""
+    match = re.fullmatch(r'\s*(\d[\d_,]*)\s*(t|tok|tokens|c|chars)?\s*', text or '', re.IGNORECASE)
+    if not match or not int(match.group(1).replace('_', '').replace(',', '')):
+        raise argparse.ArgumentTypeError(f"expected a positive number of characters or tokens "
+                                         f"(e.g. 40000 or 12000t), got '{text}'")
+    unit = 'tokens' if (match.group(2) or '').lower().startswith('t') else 'chars'
+    return int(match.group(1).replace('_', '').replace(',', '')), unit
 
-def extract_profile(project_path, profile_name, profile, global_settings):
-    """Extract files for a single profile."""
-    print(f"\n{'='*60}")
-    print(f"EXTRACTING: {profile_name.upper()}")
-    print(f"Description: {profile.get('description', 'No description')}")
-    print(f"{'='*60}")
+
+def plan_query_profiles(project_path, profiles, file_index, query, budget, index, global_settings,
+                        token_cache):
+    """Restrict profiles to the files ranking best for a search query.
     
-    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-    project_name = os.path.basename(project_path)
+    Files are taken in BM25 order while they fit budget (a parse_budget()
+    result, or None for the SEARCH_DEFAULT_RESULTS best files). A file's
+    cost is its compressed size when the extraction cache has it, else its
+    source size, plus its block markers; headers come on top, so
+    run_extraction also packs the outputs into budget. Returns
+    ({name: query profile}, {name: set of rel_paths}); query profiles write
+    to "<output>_query".
+    """
+    sources = {}
+    owners = {}
+    for name, profile in profiles.items():
+        for entry, _ in file_index.profile_files(profile):
+            rel_path = os.path.relpath(entry.path, project_path)
+            if rel_path not in sources:
+                sources[rel_path] = (rel_path, entry.path) + file_index.stat(entry)
+                owners[rel_path] = name
     
-    # Clean previous files
-    if global_settings.get("clean_previous_files", True):
-        clean_previous_files(project_path, profile_name, profile, global_settings, timestamp)
+    start = time.perf_counter()
+    index.update(sources.values(), global_settings.get("mmap_min_size", MMAP_MIN_SIZE))
+    ranked = [(rel_path, score) for rel_path, score in index.search(query) if rel_path in sources]
+    elapsed = time.perf_counter() - start
+    print(f"🔎 \"{query}\": {len(ranked)} matching files of {len(sources)}, ranked in {elapsed * 1000:.1f} ms"
+          f" ({index.scanned} files indexed)")
     
-    # Collect files
-    print(f"\nScanning directories: {', '.join(profile.get('directories', []))}")
-    print(f"Extensions: {', '.join(profile.get('include_extensions', []))}")
+    caches = {name: open_cache(project_path, name, profile.get("compression", {"enabled": False}), global_settings)
+              for name, profile in profiles.items()}
+    tokenizer = token_cache.tokenizer
+    chars_per_token = getattr(tokenizer, 'chars_per_token', CHARS_PER_TOKEN)
     
-    files = collect_files(project_path, profile)
+    def cost(rel_path):
+        _, _, size, mtime_ns = sources[rel_path]
+        cache = caches[owners[rel_path]]
+        entry = cache.get(rel_path, size, mtime_ns) if cache else None
+        chars = cache.content_size(entry) if entry else None
+        tokens = token_cache.lookup(entry['object']) if entry and tokenizer.exact else None
+        if chars is None:
+            chars, tokens = size, None
+        markers = len('\n'.join(render_file_block(rel_path, ''))) + len(rel_path) + 16
+        if tokens is None:
+            tokens = estimate_tokens(chars, chars_per_token)
+        return chars + markers, tokens + estimate_tokens(markers, chars_per_token)
     
-    if not files:
-        print("\n⚠ No files found matching the criteria.")
-        print("  Check your settings file to ensure paths are correct.")
-        return None
+    selected = []
+    used = 0
+    for rel_path, score in ranked:
+        if budget is None:
+            if len(selected) == SEARCH_DEFAULT_RESULTS:
+                break
+        else:
+            limit, unit = budget
+            chars, tokens = cost(rel_path)
+            amount = tokens if unit == 'tokens' else chars
+            if used + amount > limit:
+                continue
+            used += amount
+        selected.append((rel_path, score))
     
-    print(f"✓ Found {len(files)} files to extract")
+    for rel_path, score in selected[:10]:
+        print(f"   {score:6.2f}  {rel_path}")
+    if len(selected) > 10:
+        print(f"   ... and {len(selected) - 10} more")
+    budget_note = f"~{used:,} of {budget[0]:,} {budget[1]}" if budget else f"top {SEARCH_DEFAULT_RESULTS}"
+    if budget:
+        print(f"✓ {len(selected)} of {len(ranked)} matching files fit the budget ({budget_note})")
     
-    # Initialize content
-    all_content = []
-    file_locations = {}
-    current_line = 1
+    picked = {rel_path for rel_path, _ in selected}
+    query_profiles = {}
+    only_files = {}
+    for name, profile in profiles.items():
+        chosen = {rel_path for rel_path in picked if owners[rel_path] == name}
+        if not chosen:
+            continue
+        queried = dict(profile)
+        base_filename = profile.get("output_filename", f"EXTRACTED_{name}")
+        queried["output_filename"] = f"{base_filename}_query"
+        queried["part_output_filename"] = f"{base_filename}_query_part"
+        queried["description"] = f"{profile.get('description', name)} - query \"{query}\""
+        # The header is a format template; keep braces in the query literal
+        escaped_query = query.replace('{', '{{').replace('}', '}}')
+        queried["header_text"] = (f"QUERY EXTRACTION: \"{escaped_query}\" - {len(chosen)} of the {len(selected)} "
+                                  f"best-ranked files ({budget_note})\n\n"
+                                  + profile.get("header_text", "Extracted files\n"))
+        query_profiles[name] = queried
+        only_files[name] = chosen
+    return query_profiles, only_files
+
+
+# =============================================================================
+# CROSS-REFERENCE INDEX
+# =============================================================================
+
+XREF_INDEX_VERSION = 1
+
+_CS_IDENTIFIER_RE = re.compile(r'\b[A-Za-z_]\w*')
+CSHARP_KEYWORDS = frozenset("""
+    abstract as base bool break byte case catch char checked class const continue decimal default delegate
+    do double else enum event explicit extern false finally fixed float for foreach goto if implicit in int
+    interface internal is lock long namespace new null object operator out override params private
+    protected public readonly ref return sbyte sealed short sizeof stackalloc static string struct switch
+    this throw true try typeof uint ulong unchecked unsafe ushort using virtual void volatile while
+    add alias async await by descending dynamic equals from get global group init into join let nameof
+    notnull on orderby partial record remove select set unmanaged value var when where with yield
+""".split())
+
+
+def csharp_identifier_lines(content):
+    """{identifier: [line numbers]} of the names C# source uses, keywords left out.
     
-    # Compression settings
-    compression_settings = profile.get("compression", {"enabled": False})
-    compression_enabled = compression_settings.get("enabled", False)
+    Comments and literals are masked first, so names mentioned there don't
+    count; line numbers are 1-based lines of content.
+    """
+    occurrences = {}
+    for number, line in enumerate(_mask_csharp(content).split('\n'), 1):
+        for name in set(_CS_IDENTIFIER_RE.findall(line)):
+            if name not in CSHARP_KEYWORDS:
+                occurrences.setdefault(name, []).append(number)
+    return occurrences
+
+
+class CrossReferenceIndex:
+    """Identifier -> {file: source lines} for "who uses X" lookups.
     
-    # Reserve space for header
-    header_placeholder_lines = 25 if compression_enabled else 15
-    all_content.extend([''] * header_placeholder_lines)
-    current_line += header_placeholder_lines
+    Fed per file by extract_profile (process_file computes the occurrences
+    alongside compression and the extraction cache keeps them), so only
+    re-processed files change the index. Stored in <cache dir>/xref.json
+    with the name list of each file, so replacing a file's entries touches
+    only its own names; lookup() is a single dict access.
+    """
     
-    # TOC placeholder
-    toc_start_index = len(all_content)
-    if profile.get("include_toc", True):
-        all_content.append("[TOC_PLACEHOLDER]")
-        all_content.append("")
-        current_line += 2
+    def __init__(self, cache_dir=None):
+        self.path = os.path.join(cache_dir, "xref.json") if cache_dir else None
+        self.files = {}  # rel_path -> [size, mtime_ns, [names]]
+        self.names = {}  # name -> {rel_path: [line numbers]}
+        self.scanned = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        if self.path:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == XREF_INDEX_VERSION:
+                    self.files = data.get('files', {})
+                    self.names = data.get('names', {})
+            except (OSError, ValueError):
+                pass
     
-    # Section separator
-    all_content.append("=" * 80)
-    all_content.append("FILES")
-    all_content.append("=" * 80)
-    all_content.append("")
-    current_line += 4
+    def is_current(self, rel_path, size, mtime_ns):
+        known = self.files.get(rel_path)
+        return known is not None and known[0] == size and known[1] == mtime_ns
     
-    # Process files
-    total_original_size = 0
-    total_compressed_size = 0
-    discovered_usings = set()  # Track non-common usings for header
+    def update(self, rel_path, size, mtime_ns, occurrences):
+        """Replace a file's entries with csharp_identifier_lines() occurrences."""
+        with self._lock:
+            if self.is_current(rel_path, size, mtime_ns):
+                return
+            self._forget(rel_path)
+            for name, lines in occurrences.items():
+                self.names.setdefault(name, {})[rel_path] = lines
+            self.files[rel_path] = [size, mtime_ns, sorted(occurrences)]
+            self._dirty = True
     
-    for file_info in files:
-        file_path = file_info['full_path']
-        rel_path = file_info['rel_path']
-        file_ext = file_info.get('extension', '')
-        
-        # Record location
-        file_locations[rel_path] = {'line_num': current_line + 2}
-        
-        # File header
-        all_content.append("/" * 60)
-        all_content.append(f"// FILE: {rel_path}")
-        all_content.append("")
-        current_line += 3
-        
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                original_content = f.read()
-            
-            # Track non-common usings in C# files
-            if file_ext == '.cs' and compression_enabled:
-                common_usings = set(compression_settings.get("common_usings", []))
-                for line in original_content.split('\n')[:50]:  # Check first 50 lines
-                    stripped = line.strip()
-                    if stripped.startswith('using ') and stripped.endswith(';'):
-                        if stripped not in common_usings:
-                            discovered_usings.add(stripped)
-            
-            # Apply compression based on file type
-            if compression_enabled:
-                processed_content = compress_content(original_content, compression_settings, file_ext)
-            else:
-                processed_content = original_content
-            
-            # Track stats
-            total_original_size += len(original_content)
-            total_compressed_size += len(processed_content)
-            
-            # Add content
-            content_lines = processed_content.split('\n')
-            all_content.extend(content_lines)
-            current_line += len(content_lines)
-            
-        except Exception as e:
-            all_content.append(f"// ERROR: Could not read file. {e}")
-            current_line += 1
-        
-        all_content.append("")
-        current_line += 1
+    def _forget(self, rel_path):
+        known = self.files.pop(rel_path, None)
+        if known is None:
+            return
+        for name in known[2]:
+            referencing = self.names.get(name)
+            if referencing is not None:
+                referencing.pop(rel_path, None)
+                if not referencing:
+                    del self.names[name]
+        self._dirty = True
     
-    # Generate and insert TOC
-    if profile.get("include_toc", True):
-        toc = create_table_of_contents(files, file_locations, profile)
-        all_content[toc_start_index] = '\n'.join(toc)
+    def refresh(self, sources, mmap_min_size=MMAP_MIN_SIZE):
+        """Scan [(rel_path, full_path, size, mtime_ns)] C# sources the index is stale for."""
+        for rel_path, full_path, size, mtime_ns in sources:
+            if self.is_current(rel_path, size, mtime_ns):
+                continue
+            try:
+                occurrences = csharp_identifier_lines(read_source(full_path, mmap_min_size))
+            except (OSError, UnicodeDecodeError):
+                occurrences = {}
+            self.update(rel_path, size, mtime_ns, occurrences)
+            self.scanned += 1
     
-    # Generate header
-    stats = calculate_compression_stats(total_original_size, total_compressed_size)
+    def prune(self, project_path):
+        """Drop files that no longer exist."""
+        with self._lock:
+            for rel_path in [p for p in self.files if not os.path.isfile(os.path.join(project_path, p))]:
+                self._forget(rel_path)
     
-    header_text = profile.get("header_text", "Extracted files\n")
-    try:
-        header_text = header_text.format(
-            project_name=project_name,
-            extraction_date=datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            original_size=total_original_size,
-            compressed_size=total_compressed_size,
-            saved_percent=stats['percentage'],
-            tokens_saved=stats['tokens_saved']
-        )
-    except KeyError:
-        pass  # Some placeholders may not be in all headers
+    def lookup(self, name):
+        """{rel_path: [line numbers]} of the files using name.
+        
+        A qualified "Type.Member" gives the lines using Member in the files
+        that also use Type (which includes the file declaring it).
+        """
+        if '.' not in name:
+            return self.names.get(name, {})
+        qualifier, member = name.rsplit('.', 1)
+        qualifying = self.names.get(qualifier.rsplit('.', 1)[-1], {})
+        return {rel_path: lines for rel_path, lines in self.names.get(member, {}).items()
+                if rel_path in qualifying}
     
-    # Add discovered usings to header if compression is enabled
-    if compression_enabled and discovered_usings:
-        usings_section = "\n\nProject-specific using statements (add these when needed):\n"
-        for using in sorted(discovered_usings):
-            usings_section += f"{using}\n"
-        header_text += usings_section
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock:
+            data = {'version': XREF_INDEX_VERSION, 'files': self.files, 'names': self.names}
+            payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+            self._dirty = False
+        write_file_atomic(self.path, payload)
+
+
+def plan_refs_profiles(project_path, profiles, file_index, symbols, xref, mmap_min_size=MMAP_MIN_SIZE):
+    """Restrict profiles to the files using any of symbols.
     
-    # Add modifier legend if shortening is enabled
-    if compression_enabled and compression_settings.get("shorten_modifiers", True):
-        legend = "\n\nMODIFIER LEGEND:\n"
-        legend += "  pub=public | prot=protected | stat=static\n"
-        legend += "  virt=virtual | abs=abstract | ovr=override\n"
-        legend += "  ro=readonly | seal=sealed\n"
-        legend += "  (private & partial are omitted, internal kept as-is)\n"
-        if compression_settings.get("extreme_compression", False):
-            legend += "  ret=return | SF=SerializeField\n"
-        header_text += legend
-    
-    # Replace header placeholder
-    header_lines = header_text.split('\n')
-    if len(header_lines) < header_placeholder_lines:
-        header_lines.extend([''] * (header_placeholder_lines - len(header_lines)))
-    else:
-        header_lines = header_lines[:header_placeholder_lines]
-    all_content[0:header_placeholder_lines] = header_lines
+    "Type.Member" matches the files using Member that also use Type (see
+    CrossReferenceIndex.lookup). Files the index is stale for are scanned
+    first. Returns ({name: refs profile}, {name: set of rel_paths}); refs
+    profiles write to "<output>_refs_<Symbol>".
+    """
+    sources = {}
+    for profile in profiles.values():
+        for entry, file_ext in file_index.profile_files(profile):
+            if file_ext == '.cs':
+                rel_path = os.path.relpath(entry.path, project_path)
+                sources[rel_path] = (rel_path, entry.path) + file_index.stat(entry)
+    xref.refresh(sources.values(), mmap_min_size)
     
-    # Generate filename
-    base_filename = profile.get("output_filename", f"EXTRACTED_{profile_name}")
-    if global_settings.get("include_timestamp_in_filename", False):
-        output_filename = f"{base_filename}_{timestamp}.txt"
-    else:
-        output_filename = f"{base_filename}.txt"
+    referencing = {}
+    for symbol in symbols:
+        for rel_path, lines in xref.lookup(symbol).items():
+            if rel_path in sources:
+                referencing.setdefault(rel_path, set()).update(lines)
+    print(f"🔗 {', '.join(symbols)}: used in {len(referencing)} of {len(sources)} C# files")
+    for rel_path in sorted(referencing):
+        lines = sorted(referencing[rel_path])
+        shown = ', '.join(f"L{line}" for line in lines[:12])
+        print(f"   {rel_path}: {shown}{f' (+{len(lines) - 12})' if len(lines) > 12 else ''}")
     
-    # Write output
-    output_path = os.path.join(project_path, output_filename)
+    refs_label = '_'.join(re.sub(r'\W', '', symbol) for symbol in symbols)
+    symbol_names = ', '.join(symbols).replace('{', '{{').replace('}', '}}')
+    refs_profiles = {}
+    only_files = {}
+    for name, profile in profiles.items():
+        profile_paths = {os.path.relpath(entry.path, project_path) for entry, _ in file_index.profile_files(profile)}
+        selected = {rel_path for rel_path in profile_paths if rel_path in referencing}
+        if not selected:
+            continue
+        refs_profile = dict(profile)
+        base_filename = profile.get("output_filename", f"EXTRACTED_{name}")
+        refs_profile["output_filename"] = f"{base_filename}_refs_{refs_label}"
+        refs_profile["part_output_filename"] = f"{base_filename}_refs_{refs_label}_part"
+        refs_profile["description"] = f"{profile.get('description', name)} - files using {', '.join(symbols)}"
+        refs_profile["header_text"] = (f"REFERENCES: the {len(selected)} files that use {symbol_names}\n\n"
+                                       + profile.get("header_text", "Extracted files\n"))
+        refs_profiles[name] = refs_profile
+        only_files[name] = selected
+    return refs_profiles, only_files
+
+
+# =============================================================================
+# CONTEXT PACKING
+# =============================================================================
+
+ELIDED_STUB = "// ELIDED to fit the context budget ({chars:,} chars); request it by path"
+
+
+def packing_budget(value):
+    """(limit, unit) for a packing budget: 40000, "12000t" or a parse_budget() result; None when 0.
     
-    try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(all_content))
-        
-        print(f"\n✓ Success! Output saved to: {output_filename}")
-        
-        # Show stats
-        if global_settings.get("show_compression_stats", True) and compression_enabled:
-            print(f"\n📊 Compression Statistics:")
-            print(f"   Original:   {total_original_size:>10,} chars ({format_size(total_original_size)})")
-            print(f"   Compressed: {total_compressed_size:>10,} chars ({format_size(total_compressed_size)})")
-            print(f"   Saved:      {stats['saved']:>10,} chars ({stats['percentage']:.1f}%)")
-            print(f"   Est. tokens saved: ~{stats['tokens_saved']:,}")
-        
-        return {
-            'output_file': output_filename,
-            'files_processed': len(files),
-            'original_size': total_original_size,
-            'compressed_size': total_compressed_size,
-            'stats': stats
-        }
-        
-    except IOError as e:
-        print(f"\n✗ Error: Could not write to output file. {e}")
+    Raises argparse.ArgumentTypeError for a malformed value.
+    """
+    if not value:
         return None
+    if isinstance(value, (tuple, list)):
+        return int(value[0]), value[1]
+    return parse_budget(str(value))
 
 
-def run_extraction(project_path, profile_filter=None):
-    """Run extraction for specified profiles."""
-    settings = load_settings()
-    global_settings = settings.get("global", {})
-    profiles = settings.get("profiles", {})
+@functools.lru_cache(maxsize=64)
+def _compile_priorities(entries):
+    flags = re.IGNORECASE if os.name == 'nt' else 0
+    return [(re.compile(_glob_to_regex(pattern.replace('\\', '/').strip('/')), flags), float(weight))
+            for pattern, weight in entries]
+
+
+def file_priorities(files, packing, relevance=None, now=None):
+    """{rel_path: priority} from a profile's packing settings.
     
-    results = {}
+    The weight of the first "priorities" glob matching the project-relative
+    path (else default_priority) is raised by up to recency_boost for files
+    modified lately, halving every recency_half_life_days, and by up to
+    query_boost in proportion to the file's relevance (e.g. BM25 scores).
+    """
+    rules = _compile_priorities(tuple(packing.get("priorities", {}).items()))
+    default = packing.get("default_priority", 1.0)
+    recency_boost = packing.get("recency_boost", 1.0) or 0
+    half_life = (packing.get("recency_half_life_days", 14) or 0) * 86400
+    query_boost = packing.get("query_boost", 4.0) or 0
+    top_score = max(relevance.values(), default=0) if relevance else 0
+    now = time.time() if now is None else now
     
-    print("\n" + "=" * 60)
-    print("UNITY ULTIMATE EXTRACTOR")
-    print("=" * 60)
-    print(f"Project: {project_path}")
-    print(f"Time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    priorities = {}
+    for file_info in files:
+        rel_path = file_info['rel_path']
+        path = rel_path.replace('\\', '/')
+        priority = next((weight for regex, weight in rules if regex.fullmatch(path)), default)
+        if recency_boost and half_life:
+            age = max(now - file_info['mtime_ns'] / 1e9, 0)
+            priority *= 1 + recency_boost * 0.5 ** (age / half_life)
+        if query_boost and top_score:
+            priority *= 1 + query_boost * relevance.get(rel_path, 0) / top_score
+        priorities[rel_path] = priority
+    return priorities
+
+
+def pack_choices(items, limit):
+    """Choose at most one option per item, maximizing total value within limit.
     
-    # Determine which profiles to run
-    if profile_filter:
-        if profile_filter not in profiles:
-            print(f"\n✗ Error: Profile '{profile_filter}' not found.")
-            print(f"  Available profiles: {', '.join(profiles.keys())}")
-            return results
-        profiles_to_run = {profile_filter: profiles[profile_filter]}
-    else:
-        profiles_to_run = {k: v for k, v in profiles.items() if v.get("enabled", False)}
+    items maps a key to its options as (cost, value) pairs; an item can
+    always be left out. This multiple-choice knapsack is solved greedily on
+    its LP relaxation: each item's options are reduced to their upper convex
+    hull, the upgrade steps along all hulls are taken best value-per-cost
+    first while they fit, and an item stops at its first step that doesn't.
+    O(n log n) in the number of options. Returns {key: option index} for
+    the items kept.
+    """
+    steps = []
+    for order, (key, options) in enumerate(items.items()):
+        hull = [(0, 0.0, None)]
+        for index in sorted(range(len(options)), key=lambda i: (options[i][0], -options[i][1])):
+            cost, value = options[index]
+            if value <= hull[-1][1]:
+                continue  # costs at least as much for no more value
+            while len(hull) > 1 and ((hull[-1][1] - hull[-2][1]) * (cost - hull[-1][0])
+                                     <= (value - hull[-1][1]) * (hull[-1][0] - hull[-2][0])):
+                hull.pop()
+            hull.append((cost, value, index))
+        for position in range(1, len(hull)):
+            delta_cost = hull[position][0] - hull[position - 1][0]
+            delta_value = hull[position][1] - hull[position - 1][1]
+            steps.append((-delta_value / max(delta_cost, 1), order, position, delta_cost, hull[position][2], key))
     
-    if not profiles_to_run:
-        print("\n⚠ No enabled profiles found. Check your settings file.")
-        return results
+    chosen = {}
+    levels = {}
+    blocked = set()
+    remaining = limit
+    for _, order, position, delta_cost, index, key in sorted(steps):
+        if order in blocked or position != levels.get(order, 0) + 1:
+            continue
+        if delta_cost > remaining:
+            blocked.add(order)
+            continue
+        remaining -= delta_cost
+        levels[order] = position
+        chosen[key] = index
+    return chosen
+
+
+# =============================================================================
+# WATCH MODE
+# =============================================================================
+
+def snapshot_profiles(project_path, profiles):
+    """{profile_name: {rel_path: (size, mtime_ns)}} of the files each profile selects.
     
-    print(f"\nProfiles to run: {', '.join(profiles_to_run.keys())}")
+    One FileIndex walk covers all profiles; only selected files are stat'ed.
+    """
+    all_directories = [d for p in profiles.values() for d in p.get("directories", [])]
+    file_index = FileIndex(project_path, all_directories, prune=make_directory_pruner(profiles))
+    return {
+        name: {os.path.relpath(entry.path, project_path): file_index.stat(entry)
+               for entry, _ in file_index.profile_files(profile)}
+        for name, profile in profiles.items()
+    }
+
+
+def _settings_mtime():
+    try:
+        return os.stat(SETTINGS_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+
+def watch_extraction(project_path, profile_filter=None, use_cache=True, jobs=None):
+    """Extract once, then re-extract affected profiles whenever their files change.
     
-    # Run each profile
-    for profile_name, profile in profiles_to_run.items():
-        result = extract_profile(project_path, profile_name, profile, global_settings)
-        if result:
-            results[profile_name] = result
+    Profile directories are polled every global.watch_interval seconds by
+    size/mtime. Changes are collected until nothing has changed for
+    global.watch_debounce seconds (so a burst of IDE saves triggers a single
+    run), then only the profiles whose files changed are regenerated.
+    Unchanged files come from the extraction cache, so a rerun costs about as
+    much as compressing the changed files. Editing the settings file
+    re-extracts every watched profile.
+    """
+    run_extraction(project_path, profile_filter, use_cache, jobs)
     
-    # Summary
-    if results:
-        print("\n" + "=" * 60)
-        print("EXTRACTION COMPLETE")
-        print("=" * 60)
-        
-        total_files = sum(r['files_processed'] for r in results.values())
-        total_original = sum(r['original_size'] for r in results.values())
-        total_compressed = sum(r['compressed_size'] for r in results.values())
-        
-        print(f"\n📁 Total files processed: {total_files}")
-        print(f"📄 Output files created:")
-        for profile_name, result in results.items():
-            print(f"   - {result['output_file']}")
-        
-        if total_original > total_compressed:
-            overall_stats = calculate_compression_stats(total_original, total_compressed)
-            print(f"\n📊 Overall compression: {overall_stats['percentage']:.1f}% reduction")
-            print(f"   (~{overall_stats['tokens_saved']:,} tokens saved)")
+    settings = load_settings()
+    global_settings = settings.get("global", {})
+    interval = max(0.1, float(global_settings.get("watch_interval", 1.0)))
+    debounce = max(0.0, float(global_settings.get("watch_debounce", 1.5)))
+    profiles = select_profiles(settings.get("profiles", {}), profile_filter)
+    if not profiles:
+        return
+    if not (use_cache and global_settings.get("cache_enabled", True)):
+        print("\n⚠ Extraction cache is disabled: every change re-processes all files of a profile.")
     
-    return results
+    snapshot = snapshot_profiles(project_path, profiles)
+    settings_mtime = _settings_mtime()
+    changed = set()
+    last_change = 0.0
+    
+    print(f"\n👀 Watching {', '.join(profiles)} for changes (every {interval:g}s). Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(interval)
+            
+            current_settings_mtime = _settings_mtime()
+            if current_settings_mtime != settings_mtime:
+                settings_mtime = current_settings_mtime
+                settings = load_settings()
+                profiles = select_profiles(settings.get("profiles", {}), profile_filter) or {}
+                changed.update(profiles)
+                last_change = time.monotonic()
+                snapshot = snapshot_profiles(project_path, profiles)
+                continue
+            
+            current = snapshot_profiles(project_path, profiles)
+            now_changed = {name for name in profiles if current[name] != snapshot[name]}
+            snapshot = current
+            if now_changed:
+                changed.update(now_changed)
+                last_change = time.monotonic()
+                continue
+            
+            # Wait until saves have settled, then regenerate once
+            if changed and time.monotonic() - last_change >= debounce:
+                names = [name for name in profiles if name in changed]
+                changed.clear()
+                print(f"\n🔄 Changes detected in: {', '.join(names)}")
+                run_extraction(project_path, names, use_cache, jobs)
+                print(f"\n👀 Watching {', '.join(profiles)} for changes. Press Ctrl+C to stop.")
+    except KeyboardInterrupt:
+        print("\n✓ Watch mode stopped.")
 
 
 def list_profiles(settings):
@@ -1078,6 +5672,30 @@ Examples:
   python unity_extractor.py --profile scripts  Run only scripts profile
   python unity_extractor.py --profile ui       Run only UI profile
   python unity_extractor.py --list             List available profiles
+  python unity_extractor.py --no-cache         Force a full re-extraction
+  python unity_extractor.py --jobs 8           Compress on 8 worker processes
+  python unity_extractor.py --watch            Re-extract whenever files change
+  python unity_extractor.py --get PlantGrowth  Print one class from the output
+  python unity_extractor.py --seed PlantGrowth --depth 2
+                                               Extract PlantGrowth and the types it
+                                               references, up to 2 hops away
+  python unity_extractor.py --timings          Report time per stage and the slowest files
+  python unity_extractor.py --metrics-json m.json
+                                               Save the same timings as JSON
+  python unity_extractor.py --since main       Extract only files added or modified since
+                                               main (plus a list of deleted files)
+  python unity_extractor.py --query "plant growth ticks" --budget 40000
+                                               Extract the files ranking best for the query,
+                                               up to 40,000 characters ("12000t" = tokens)
+  python unity_extractor.py --budget 12000t    Pack each output into 12,000 tokens: the
+                                               highest-priority files whole, others as
+                                               skeletons or stubs
+  python unity_extractor.py --refs StatusEffectManager
+                                               Extract only the files that use
+                                               StatusEffectManager (and list their lines)
+  python unity_extractor.py --backups          List backup snapshots
+  python unity_extractor.py --restore latest --profile scripts --restore-to old
+                                               Restore the newest scripts backup into old/
         """
     )
     
@@ -1090,6 +5708,91 @@ Examples:
         action='store_true',
         help='List available profiles'
     )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Re-process every file instead of reusing the incremental cache'
+    )
+    parser.add_argument(
+        '--jobs', '-j',
+        type=int,
+        metavar='N',
+        help='Worker processes for compression (default: global.workers, 0 = all cores)'
+    )
+    parser.add_argument(
+        '--get', '-g',
+        metavar='NAME',
+        help='Print one class, method or file (e.g. PlantGrowth, PlantGrowth.Update, '
+             'PlantSystem/PlantGrowth.cs) from the last extraction output'
+    )
+    parser.add_argument(
+        '--watch', '-w',
+        action='store_true',
+        help='Keep running and re-extract affected profiles when their files change'
+    )
+    parser.add_argument(
+        '--seed', '-s',
+        metavar='TYPE',
+        help='Only extract the files declaring TYPE (comma-separated for several) '
+             'and the types they reference'
+    )
+    parser.add_argument(
+        '--depth', '-d',
+        type=int,
+        default=1,
+        metavar='N',
+        help='Reference hops to follow from --seed (default: 1)'
+    )
+    parser.add_argument(
+        '--since',
+        metavar='REF',
+        help='Only extract files added or modified since a git ref, to "<output>_delta" files'
+    )
+    parser.add_argument(
+        '--query', '-q',
+        metavar='TEXT',
+        help='Only extract the files ranking best for TEXT (BM25 over identifiers and comments), '
+             'to "<output>_query" files'
+    )
+    parser.add_argument(
+        '--refs', '-r',
+        metavar='SYMBOL',
+        help='Only extract the files that use SYMBOL (a type or member name, or Type.Member; comma-separated for several), '
+             'to "<output>_refs_<SYMBOL>" files'
+    )
+    parser.add_argument(
+        '--budget', '-b',
+        type=parse_budget,
+        metavar='N',
+        help=f'Size limit: N characters, or N tokens with a "t" suffix. With --query, the best files '
+             f'that fit (default: the {SEARCH_DEFAULT_RESULTS} best); otherwise each output is packed into it '
+             f'by priority (see the profile "packing" settings)'
+    )
+    parser.add_argument(
+        '--backups',
+        action='store_true',
+        help='List the snapshots in the backup store (see global.backup_previous_files)'
+    )
+    parser.add_argument(
+        '--restore',
+        metavar='SNAPSHOT',
+        help='Restore a backup snapshot: an id from --backups, a unique prefix or "latest"'
+    )
+    parser.add_argument(
+        '--restore-to',
+        metavar='DIR',
+        help='Directory to restore into (default: the project directory)'
+    )
+    parser.add_argument(
+        '--timings',
+        action='store_true',
+        help='Print wall/CPU time per stage and profile, bytes read/written and the heaviest files'
+    )
+    parser.add_argument(
+        '--metrics-json',
+        metavar='PATH',
+        help='Write the --timings report as JSON to PATH'
+    )
     parser.add_argument(
         '--path',
         default=SCRIPT_DIR,
@@ -1097,12 +5800,29 @@ Examples:
     )
     
     args = parser.parse_args()
+    if sum(bool(mode) for mode in (args.seed, args.since, args.query, args.refs)) > 1:
+        parser.error("--seed, --since, --query and --refs cannot be combined")
+    seeds = [name.strip() for name in args.seed.split(',') if name.strip()] if args.seed else None
+    refs = [name.strip() for name in args.refs.split(',') if name.strip()] if args.refs else None
     
     if args.list:
         settings = load_settings()
         list_profiles(settings)
+    elif args.backups:
+        list_backups(args.path, args.profile)
+    elif args.restore:
+        if not restore_backup(args.path, args.restore, args.restore_to, args.profile):
+            sys.exit(1)
+    elif args.get:
+        if not get_block(args.path, args.get):
+            sys.exit(1)
+    elif args.watch:
+        watch_extraction(args.path, args.profile, use_cache=not args.no_cache, jobs=args.jobs)
     else:
-        run_extraction(args.path, args.profile)
+        run_extraction(args.path, args.profile, use_cache=not args.no_cache, jobs=args.jobs,
+                       seeds=seeds, depth=max(args.depth, 0), timings=args.timings,
+                       metrics_path=args.metrics_json, since=args.since, query=args.query, budget=args.budget,
+                       refs=refs)
     
     # Only wait for key if running without arguments (interactive mode)
     if len(sys.argv) == 1:
@@ -21,16 +21,18 @@ echo   1. Run ALL active profiles (Default)
 echo   2. Extract SCRIPTS only
 echo   3. Extract UI only
 echo   4. List available profiles
-echo   5. Exit
+echo   5. WATCH for changes (re-extract automatically)
+echo   6. Exit
 echo.
 echo ========================================================
-set /p option="Select an option [1-5]: "
+set /p option="Select an option [1-6]: "
 
 if "%option%"=="1" goto RUN_ALL
 if "%option%"=="2" goto RUN_SCRIPTS
 if "%option%"=="3" goto RUN_UI
 if "%option%"=="4" goto LIST_PROFILES
-if "%option%"=="5" goto EXIT
+if "%option%"=="5" goto WATCH
+if "%option%"=="6" goto EXIT
 goto MENU
 
 :RUN_ALL
@@ -64,5 +66,13 @@ echo.
 pause
 goto MENU
 
+:WATCH
+cls
+echo Watching enabled profiles for changes (Ctrl+C to stop)...
+python unity_extractor.py --watch
+echo.
+pause
+goto MENU
+
 :EXIT
 exit /b
\ No newline at end of file
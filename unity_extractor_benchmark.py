@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+===============================================================================
+UNITY EXTRACTOR BENCHMARK
+===============================================================================
+Generates a synthetic Unity project and times each phase of the extractor
+(walk, read, metadata, compress, TOC, write, plus a full uncached
+extraction) so changes can be checked for speed regressions.
+
+The project is generated from a fixed random seed: nested namespaces, MonoBehaviours,
+interfaces, enums and partial classes, UI Toolkit .uxml/.uss files and a .meta
+file next to every asset. The numbers for a run are compared against a stored
+baseline, and the process exits with code 1 if any phase is slower by more
+than the threshold.
+
+Usage:
+    python unity_extractor_benchmark.py                     # 1,000 scripts, compare to baseline
+    python unity_extractor_benchmark.py --scripts 50000     # Larger project
+    python unity_extractor_benchmark.py --save-baseline     # Record this run as the baseline
+    python unity_extractor_benchmark.py --threshold 0.25    # Allow 25% slowdown per phase
+    python unity_extractor_benchmark.py --keep DIR          # Generate into DIR and keep it
+===============================================================================
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import platform
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+import unity_extractor as ue
+
+BASELINE_FILENAME = "unity_extractor_benchmark_baseline.json"
+BASELINE_VERSION = 1
+
+# Phases faster than this are too noisy to flag as regressions
+MIN_REGRESSION_SECONDS = 0.02
+
+PHASES = ["walk", "read", "metadata", "compress", "toc", "write", "extract"]
+
+
+# =============================================================================
+# SYNTHETIC PROJECT
+# =============================================================================
+
+_AREAS = ["Core", "Gameplay", "AI", "Audio", "World", "Inventory", "Combat", "Economy", "Network", "Tools"]
+_SUBAREAS = ["Systems", "Components", "Data", "Services", "Controllers", "Utilities", "Events", "States"]
+_NOUNS = ["Plant", "Growth", "Enemy", "Spawner", "Inventory", "Item", "Quest", "Dialogue", "Weather",
+          "Terrain", "Camera", "Player", "Health", "Damage", "Resource", "Market", "Pathfinder", "Sensor"]
+_ROLES = ["Manager", "Controller", "Handler", "Service", "Component", "Tracker", "Builder", "View"]
+_FIELD_TYPES = ["int", "float", "bool", "string", "Vector3", "GameObject", "Transform", "List<int>"]
+_EXTRA_USINGS = ["using System.Text;", "using UnityEngine.UIElements;", "using System.Threading.Tasks;",
+                 "using UnityEngine.AI;", "using Unity.Mathematics;"]
+
+
+def _class_name(index):
+    return f"{_NOUNS[index % len(_NOUNS)]}{_ROLES[(index // len(_NOUNS)) % len(_ROLES)]}{index}"
+
+
+def _csharp_method(rng, name, others):
+    """One method with comments, strings and branches for the compressor to chew on."""
+    other = rng.choice(others)
+    lines = [
+        f"        /// <summary>",
+        f"        /// Applies {name} to the current state.",
+        f"        /// </summary>",
+        f"        /// <param name=\"amount\">How much to apply.</param>",
+        f"        public {rng.choice(['void', 'bool', 'int'])} {name}(int amount, string label = \"default\")",
+        "        {",
+        "            // Guard against invalid input",
+        "            if (amount <= 0)",
+        "            {",
+        f"                Debug.LogWarning($\"{name}: invalid amount {{amount}} // not a comment\");",
+        "            }",
+        "            else",
+        "            {",
+        "                for (int i = 0; i < amount; i++)",
+        "                {",
+        "                    values.Add(i * 2); /* inline block comment */",
+        "                }",
+        f"                var helper = GetComponent<{other}>();",
+        "                helper?.Refresh();",
+        "            }",
+    ]
+    if lines[4].split()[1] == 'bool':
+        lines.append("            return values.Count > 0;")
+    elif lines[4].split()[1] == 'int':
+        lines.append("            return values.Count;")
+    lines.append("        }")
+    return lines
+
+
+def generate_csharp(rng, index, namespace, class_names):
+    """Source of one synthetic script declaring class_names[index]."""
+    name = class_names[index]
+    others = [class_names[rng.randrange(len(class_names))] for _ in range(3)]
+    kind = rng.random()
+    file_scoped = rng.random() < 0.2
+    indent = "" if file_scoped else "    "
+
+    lines = ["using System;", "using System.Collections.Generic;", "using UnityEngine;"]
+    lines += rng.sample(_EXTRA_USINGS, rng.randint(0, 2))
+    lines.append("")
+    if file_scoped:
+        lines += [f"namespace {namespace};", ""]
+    else:
+        lines += [f"namespace {namespace}", "{"]
+
+    if kind < 0.1:
+        lines += [f"{indent}/// <summary>Possible states of {name}.</summary>",
+                  f"{indent}public enum {name}",
+                  f"{indent}{{"]
+        lines += [f"{indent}    Value{i} = {i}," for i in range(rng.randint(3, 12))]
+        lines.append(f"{indent}}}")
+    elif kind < 0.2:
+        lines += [f"{indent}public interface {name}", f"{indent}{{"]
+        lines += [f"{indent}    void Handle{i}({others[i % 3]} source, float weight);" for i in range(rng.randint(2, 6))]
+        lines.append(f"{indent}}}")
+    else:
+        body = [
+            "    #region Fields",
+            "    [SerializeField] private float speed = 1.5f;",
+            "    [Header(\"References\")]",
+            f"    [SerializeField] private {others[0]} target;",
+            "    private readonly List<int> values = new List<int>();",
+        ]
+        body += [f"    [SerializeField] private {rng.choice(_FIELD_TYPES)} field{i};" for i in range(rng.randint(1, 8))]
+        body += [
+            "    #endregion",
+            "",
+            "    public float Speed { get => speed; set => speed = value; }",
+            "",
+        ]
+        for i in range(rng.randint(2, 12)):
+            body += [line[4:] for line in _csharp_method(rng, f"{rng.choice(_NOUNS)}Step{i}", others)]
+            body.append("")
+        partial = "partial " if rng.random() < 0.1 else ""
+        lines += [f"{indent}[DisallowMultipleComponent]",
+                  f"{indent}public {partial}class {name} : MonoBehaviour",
+                  f"{indent}{{"]
+        lines += [f"{indent}{line}" if line else "" for line in body]
+        lines.append(f"{indent}}}")
+
+    if not file_scoped:
+        lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def generate_uxml(rng, name):
+    elements = "\n".join(
+        f'        <ui:Button name="{name}-button-{i}" text="Action {i}" class="action-button" />'
+        for i in range(rng.randint(2, 10)))
+    return f"""<ui:UXML xmlns:ui="UnityEngine.UIElements" xmlns:uie="UnityEditor.UIElements">
+    <Style src="{name}.uss" />
+    <!-- Generated panel {name} -->
+    <ui:VisualElement name="{name}-root" class="panel">
+        <ui:Label text="{name}" class="title" />
+{elements}
+    </ui:VisualElement>
+</ui:UXML>
+"""
+
+
+def generate_uss(rng, name):
+    rules = "\n\n".join(
+        f""".{name}-rule-{i} {{
+    margin: {rng.randint(0, 12)}px;
+    padding: {rng.randint(0, 12)}px;
+    /* color tweak */
+    color: rgb({rng.randint(0, 255)}, {rng.randint(0, 255)}, {rng.randint(0, 255)});
+}}"""
+        for i in range(rng.randint(2, 10)))
+    return rules + "\n"
+
+
+def generate_meta(rng):
+    guid = '%032x' % rng.getrandbits(128)
+    return f"fileFormatVersion: 2\nguid: {guid}\nMonoImporter:\n  externalObjects: {{}}\n  serializedVersion: 2\n"
+
+
+def _write(path, text, rng, with_meta=True):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(text)
+    if with_meta:
+        with open(path + ".meta", 'w', encoding='utf-8', newline='\n') as f:
+            f.write(generate_meta(rng))
+
+
+def generate_project(root, scripts, ui_ratio=0.1, seed=1):
+    """Create a synthetic Unity project under root; returns its file counts by extension."""
+    rng = random.Random(seed)
+    class_names = [_class_name(i) for i in range(scripts)]
+    counts = {}
+
+    ui_scripts = int(scripts * ui_ratio)
+    editor_scripts = max(1, scripts // 20)
+    for i in range(scripts):
+        if i < ui_scripts:
+            folder = os.path.join("Assets", "Scripts", "A_ToolkitUI", rng.choice(_SUBAREAS))
+            namespace = "Game.UI"
+        elif i < ui_scripts + editor_scripts:
+            folder = os.path.join("Assets", "Editor", rng.choice(_AREAS))
+            namespace = "Game.Editor"
+        else:
+            area, sub = rng.choice(_AREAS), rng.choice(_SUBAREAS)
+            depth = rng.randint(0, 2)
+            nested = [f"{sub}{d}" for d in range(depth)]
+            folder = os.path.join("Assets", "Scripts", area, sub, *nested)
+            namespace = ".".join(["Game", area, sub] + nested)
+        _write(os.path.join(root, folder, f"{class_names[i]}.cs"),
+               generate_csharp(rng, i, namespace, class_names), rng)
+        counts['.cs'] = counts.get('.cs', 0) + 1
+
+    # UI Toolkit documents and style sheets beside the UI scripts
+    for i in range(ui_scripts):
+        folder = os.path.join(root, "Assets", "Scripts", "A_ToolkitUI", "Panels")
+        name = f"Panel{i}"
+        _write(os.path.join(folder, f"{name}.uxml"), generate_uxml(rng, name), rng)
+        _write(os.path.join(folder, f"{name}.uss"), generate_uss(rng, name), rng)
+        counts['.uxml'] = counts.get('.uxml', 0) + 1
+        counts['.uss'] = counts.get('.uss', 0) + 1
+
+    counts['.meta'] = sum(counts.values())
+    return counts
+
+
+# =============================================================================
+# PHASE TIMINGS
+# =============================================================================
+
+class PhaseTimer:
+    """Accumulates wall time plus files/bytes handled per phase."""
+
+    def __init__(self):
+        self.phases = {}
+
+    def add(self, phase, seconds, files=0, size=0):
+        totals = self.phases.setdefault(phase, {'seconds': 0.0, 'files': 0, 'bytes': 0})
+        totals['seconds'] += seconds
+        totals['files'] += files
+        totals['bytes'] += size
+
+    def results(self):
+        results = {}
+        for phase in PHASES:
+            if phase not in self.phases:
+                continue
+            totals = self.phases[phase]
+            seconds = totals['seconds']
+            results[phase] = {
+                'seconds': round(seconds, 6),
+                'files': totals['files'],
+                'bytes': totals['bytes'],
+                'files_per_sec': round(totals['files'] / seconds, 1) if seconds else 0.0,
+                'mb_per_sec': round(totals['bytes'] / seconds / 1e6, 2) if seconds else 0.0
+            }
+        return results
+
+
+def _quiet(*args, **kwargs):
+    pass
+
+
+def benchmark_profile(project_path, profile_name, profile, global_settings, timer, workers=1):
+    """Time each phase of extracting one profile, then a full uncached extraction."""
+    compression_settings = profile.get("compression", {"enabled": False})
+
+    start = time.perf_counter()
+    file_index = ue.FileIndex(project_path, profile.get("directories", []))
+    files = ue.collect_files(project_path, profile, file_index=file_index, log=_quiet)
+    timer.add("walk", time.perf_counter() - start, len(files))
+
+    start = time.perf_counter()
+    sources = {}
+    for file_info in files:
+        sources[file_info['rel_path']] = ue.read_source(file_info['full_path'])
+    source_bytes = sum(file_info['size'] for file_info in files)
+    timer.add("read", time.perf_counter() - start, len(files), source_bytes)
+
+    start = time.perf_counter()
+    for file_info in files:
+        file_info.update(ue.detect_file_metadata(sources[file_info['rel_path']], file_info['full_path'],
+                                                 file_info['extension']))
+    timer.add("metadata", time.perf_counter() - start, len(files), source_bytes)
+
+    start = time.perf_counter()
+    compressed = {}
+    for file_info in files:
+        content = sources[file_info['rel_path']]
+        if compression_settings.get("enabled", False):
+            content = ue.compress_content(content, compression_settings, file_info['extension'])
+        compressed[file_info['rel_path']] = content
+    timer.add("compress", time.perf_counter() - start, len(files), source_bytes)
+
+    start = time.perf_counter()
+    files = ue.sort_files(files)
+    ue.create_table_of_contents(files, {}, profile)
+    timer.add("toc", time.perf_counter() - start, len(files))
+
+    output_path = os.path.join(project_path, f"{profile.get('output_filename', profile_name)}.txt")
+    start = time.perf_counter()
+    writer = ue.StreamingOutputWriter(output_path)
+    try:
+        for file_info in files:
+            writer.add_block(file_info['rel_path'], ue.render_file_block(file_info['rel_path'],
+                                                                         compressed[file_info['rel_path']]))
+        stats = ue.calculate_compression_stats(source_bytes, sum(len(c) for c in compressed.values()))
+        header_lines = ue.build_header_lines(profile, os.path.basename(project_path), compression_settings,
+                                             stats, set(), "estimate")
+        ue.write_output_file(writer, output_path, files, profile, header_lines)
+        written = writer.bytes_written
+    finally:
+        writer.discard()
+    timer.add("write", time.perf_counter() - start, len(files), written)
+
+    start = time.perf_counter()
+    ue.extract_profile(project_path, profile_name, profile, global_settings, use_cache=False,
+                       workers=workers, log=_quiet)
+    timer.add("extract", time.perf_counter() - start, len(files), source_bytes)
+
+
+def run_benchmark(project_path, repeat=3, workers=1):
+    """Best-of-repeat phase timings over the default scripts and ui profiles."""
+    settings = json.loads(json.dumps(ue.DEFAULT_SETTINGS))
+    global_settings = settings["global"]
+    global_settings["cache_enabled"] = False
+    profiles = {name: profile for name, profile in settings["profiles"].items() if profile.get("enabled", True)}
+
+    best = None
+    for _ in range(max(1, repeat)):
+        timer = PhaseTimer()
+        for profile_name, profile in profiles.items():
+            benchmark_profile(project_path, profile_name, profile, global_settings, timer, workers)
+        results = timer.results()
+        if best is None:
+            best = results
+        else:
+            for phase, result in results.items():
+                if result['seconds'] < best[phase]['seconds']:
+                    best[phase] = result
+    return best
+
+
+# =============================================================================
+# BASELINE
+# =============================================================================
+
+def load_baseline(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if baseline.get('version') != BASELINE_VERSION:
+        return None
+    return baseline
+
+
+def save_baseline(path, config, results):
+    baseline = {
+        'version': BASELINE_VERSION,
+        'recorded': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'config': config,
+        'phases': results
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=4)
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """Phases slower than the baseline by more than threshold (a fraction): [(phase, old, new)]."""
+    regressions = []
+    for phase, result in results.items():
+        old = baseline['phases'].get(phase)
+        if not old:
+            continue
+        new_seconds, old_seconds = result['seconds'], old['seconds']
+        if new_seconds > old_seconds * (1 + threshold) and new_seconds - old_seconds > MIN_REGRESSION_SECONDS:
+            regressions.append((phase, old_seconds, new_seconds))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    print(f"\n{'Phase':<10} {'Seconds':>10} {'Files/s':>12} {'MB/s':>9} {'vs baseline':>12}")
+    print("-" * 57)
+    for phase, result in results.items():
+        change = ""
+        old = baseline['phases'].get(phase) if baseline else None
+        if old and old['seconds']:
+            change = f"{(result['seconds'] / old['seconds'] - 1) * 100:+.1f}%"
+        mb_per_sec = f"{result['mb_per_sec']:.2f}" if result['bytes'] else "-"
+        print(f"{phase:<10} {result['seconds']:>10.4f} {result['files_per_sec']:>12,.1f} {mb_per_sec:>9} {change:>12}")
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Unity Extractor Benchmark - Time extraction phases on a synthetic project",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Exit codes: 0 = no regression, 1 = a phase regressed beyond the threshold,
+2 = the baseline was recorded with a different project configuration.
+        """
+    )
+    parser.add_argument('--scripts', '-n', type=int, default=1000,
+                        help='Number of C# scripts to generate (default: 1000)')
+    parser.add_argument('--ui-ratio', type=float, default=0.1,
+                        help='Fraction of scripts that get a .uxml/.uss pair in the UI folder (default: 0.1)')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='Random seed for the generated project (default: 1)')
+    parser.add_argument('--repeat', '-r', type=int, default=3,
+                        help='Runs per phase; the fastest is kept (default: 3)')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='Worker processes for the full extraction phase (default: 1)')
+    parser.add_argument('--baseline', default=os.path.join(SCRIPT_DIR, BASELINE_FILENAME),
+                        help=f'Baseline JSON file (default: {BASELINE_FILENAME} next to this script)')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Record this run as the new baseline instead of comparing')
+    parser.add_argument('--threshold', '-t', type=float, default=0.15,
+                        help='Allowed slowdown per phase as a fraction (default: 0.15)')
+    parser.add_argument('--keep', metavar='DIR',
+                        help='Generate the project into DIR and keep it afterwards')
+    args = parser.parse_args()
+
+    config = {'scripts': args.scripts, 'ui_ratio': args.ui_ratio, 'seed': args.seed, 'jobs': args.jobs}
+
+    print("\n" + "=" * 60)
+    print("UNITY EXTRACTOR BENCHMARK")
+    print("=" * 60)
+
+    project_path = os.path.abspath(args.keep) if args.keep else tempfile.mkdtemp(prefix="unity_bench_")
+    try:
+        start = time.perf_counter()
+        counts = generate_project(project_path, args.scripts, args.ui_ratio, args.seed)
+        print(f"✓ Generated {', '.join(f'{n:,} {ext}' for ext, n in counts.items())} "
+              f"in {time.perf_counter() - start:.1f}s: {project_path}")
+
+        results = run_benchmark(project_path, args.repeat, args.jobs)
+    finally:
+        if not args.keep:
+            shutil.rmtree(project_path, ignore_errors=True)
+
+    if args.save_baseline:
+        print_results(results)
+        save_baseline(args.baseline, config, results)
+        print(f"\n✓ Baseline saved to: {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print_results(results)
+        print(f"\n⚠ No baseline at {args.baseline}; run with --save-baseline to record one.")
+        return 0
+    if baseline.get('config') != config:
+        print_results(results)
+        print(f"\n✗ Baseline was recorded with {baseline.get('config')}, this run used {config}.")
+        return 2
+
+    print_results(results, baseline)
+
+    regressions = compare_to_baseline(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n✗ Regressions beyond {args.threshold:.0%}:")
+        for phase, old_seconds, new_seconds in regressions:
+            print(f"   - {phase}: {old_seconds:.4f}s → {new_seconds:.4f}s")
+        return 1
+    print(f"\n✓ No phase slower than the baseline by more than {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())